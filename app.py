@@ -10,20 +10,50 @@ from flask_cors import CORS
 from dotenv import load_dotenv
 from llm_factory import create_llm_service 
 from llm_service import LLMService 
+from tts_cache import TTSCache
+from sentence_pipeline import SentenceSegmenter, pipeline_synthesis
+from context_manager import ContextManager, estimate_text_tokens, message_text
+from frame_buffer import FrameBuffer, select_frames
+from camera_ingest import FrameIngestor
+from request_body import BodyTooLarge, extract_inline_images, read_json_body, summarize_payload
+from image_utils import ImageCache, dhash, image_size, resize_image
+from vision_policy import VisionDetailPolicy
+from model_router import get_router, all_router_stats
+from chunk_coalescer import coalesce_chunks
+from voice_deadline import DEFAULT_FALLBACK_UTTERANCE, assistant_chunk, fallback_chunk, fallback_completion, is_deadline_error, resolve_budget
+from preamble import PreamblePicker, call_in_background, close_when_done, first_sentence, wait_for_stream
+from stream_cancel import StreamCanceller, cancellation_stats, client_socket
+from job_queue import JobQueue, MemoryJobStore, SQLiteJobStore, webhook_url_error
+from shadow import ShadowMirror
+from artwork_index import ArtworkIndex
+from session_ledger import SessionLedger
+from static_assets import AssetManifest, compress_json_response
+from memory_diagnostics import AllocationTracer, directory_usage, file_sizes, largest, process_memory, store_usage
+from scheduler import get_scheduler, all_scheduler_metrics, AdmissionError, PRIORITY_INTERACTIVE, PRIORITY_BATCH
 import time 
+import atexit
 import logging
 import shutil
+import hmac
+import sys
+try:
+    # Optional: enables the /ws/camera WebSocket ingestion channel
+    from flask_sock import Sock
+    from simple_websocket import ConnectionClosed
+except ImportError:
+    Sock = None
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Debug environment variables
-print(f"\n=== ENVIRONMENT VARIABLES DEBUG ===")
-print(f"ELEVENLABS_API_KEY: {'*' * 20 + os.getenv('ELEVENLABS_API_KEY')[-4:] if os.getenv('ELEVENLABS_API_KEY') else 'Not set'}")
-print(f"ELEVENLABS_AGENT_ID: {os.getenv('ELEVENLABS_AGENT_ID') or 'Not set'}")
-print(f"LLM_PROVIDER: {os.getenv('LLM_PROVIDER') or 'Not set'}")
-print(f"DEFAULT_MODEL: {os.getenv('DEFAULT_MODEL') or 'Not set'}")
-print(f"=== END ENVIRONMENT VARIABLES DEBUG ===\n")
+def print_environment_debug():
+    """Print the relevant environment configuration (secrets masked)."""
+    print(f"\n=== ENVIRONMENT VARIABLES DEBUG ===")
+    print(f"ELEVENLABS_API_KEY: {'*' * 20 + os.getenv('ELEVENLABS_API_KEY')[-4:] if os.getenv('ELEVENLABS_API_KEY') else 'Not set'}")
+    print(f"ELEVENLABS_AGENT_ID: {os.getenv('ELEVENLABS_AGENT_ID') or 'Not set'}")
+    print(f"LLM_PROVIDER: {os.getenv('LLM_PROVIDER') or 'Not set'}")
+    print(f"DEFAULT_MODEL: {os.getenv('DEFAULT_MODEL') or 'Not set'}")
+    print(f"=== END ENVIRONMENT VARIABLES DEBUG ===\n")
 
 app = Flask(__name__)
 
@@ -51,6 +81,59 @@ def handle_preflight():
     return ('', 204, headers)
 # --- End CORS Preflight Helper ---
 
+# --- Admin Access Helper ---
+def admin_authorized():
+    """Check access to admin endpoints.
+
+    If ADMIN_TOKEN is set, the request must carry it in the X-Admin-Token header.
+    Otherwise admin endpoints are only reachable from localhost, directly: the
+    socket peer is checked rather than request.remote_addr (which ProxyFix takes
+    from the client-supplied X-Forwarded-For header), and forwarded requests are
+    refused because a reverse proxy on the same host also connects from localhost.
+    """
+    admin_token = os.getenv('ADMIN_TOKEN')
+    if admin_token:
+        return hmac.compare_digest(request.headers.get('X-Admin-Token', ''), admin_token)
+    if request.headers.get('X-Forwarded-For') or request.headers.get('Forwarded'):
+        return False
+    peer = request.environ.get('werkzeug.proxy_fix.orig', {}).get('REMOTE_ADDR', request.environ.get('REMOTE_ADDR'))
+    return peer in ('127.0.0.1', '::1')
+# --- End Admin Access Helper ---
+
+# --- Admission Control Helper ---
+def admission_error_response(error, openai_format=False):
+    """Build the fast 429/503 response for a request shed by the provider scheduler."""
+    if openai_format:
+        body = {
+            "error": {
+                "message": str(error),
+                "type": "rate_limit_error" if error.status_code == 429 else "server_overloaded",
+                "code": error.status_code
+            }
+        }
+    else:
+        body = {"error": str(error)}
+    response = jsonify(body)
+    response.status_code = error.status_code
+    response.headers['Retry-After'] = str(max(1, int(round(error.retry_after))))
+    return response
+
+def voice_fallback_response(model, stream, reason):
+    """Answer a voice turn that ran out of time with the fallback utterance instead of an error."""
+    app.logger.warning(f"Voice turn missed its deadline ({reason}); sending fallback utterance")
+    if stream:
+        def generate_fallback():
+            yield f"data: {json.dumps(fallback_chunk(model, VOICE_FALLBACK_UTTERANCE))}\n\n"
+            yield "data: [DONE]\n\n"
+        response = Response(generate_fallback(), mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'
+    else:
+        response = jsonify(fallback_completion(model, VOICE_FALLBACK_UTTERANCE))
+    response.headers['X-Fallback-Reason'] = reason
+    return response
+# --- End Admission Control Helper ---
+
 # --- Image Context Storage --- 
 # Simple in-memory dictionary to store the mapping between a conversation identifier
 # (e.g., user_id from ElevenLabs) and the filename of the image uploaded for that session.
@@ -64,11 +147,91 @@ app.config['UPLOAD_FOLDER'] = os.path.abspath('./uploads')
 
 # Ensure the upload folder exists
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+
+# Rolling buffer of recent camera keyframes per session. image_context always holds
+# the newest keyframe; frame_history keeps the last few so turns can carry motion context.
+frame_history = {}
+CAMERA_BUFFER_FRAMES = int(os.getenv('CAMERA_BUFFER_FRAMES', '4'))
+CAMERA_DEDUP_DISTANCE = int(os.getenv('CAMERA_DEDUP_DISTANCE', '6'))
+CAMERA_CONTEXT_FRAMES = int(os.getenv('CAMERA_CONTEXT_FRAMES', '1'))
+CAMERA_CONTEXT_TOKEN_BUDGET = int(os.getenv('CAMERA_CONTEXT_TOKEN_BUDGET', '1500'))
+
+# Picks low/high vision detail per injected image (set VISION_DETAIL_POLICY=auto to always send "auto")
+ADAPTIVE_VISION_DETAIL = os.getenv('VISION_DETAIL_POLICY', 'adaptive').lower() == 'adaptive'
+vision_policy = VisionDetailPolicy(
+    low_max_side=int(os.getenv('VISION_LOW_MAX_SIDE', '512')),
+    max_tiles=int(os.getenv('VISION_MAX_TILES', '6'))
+)
+# Downscaled copies of uploads served to providers, keyed by filename and size (fetched again every turn)
+resized_images = ImageCache(max_bytes=int(os.getenv('RESIZED_IMAGE_CACHE_BYTES', str(16 * 1024 * 1024))))
+
+# Inbound /v1/chat/completions bodies: size limit and extraction of inline data-URI images
+CHAT_MAX_BODY_BYTES = int(os.getenv('CHAT_MAX_BODY_BYTES', str(25 * 1024 * 1024)))
+INLINE_IMAGE_EXTRACTION = os.getenv('INLINE_IMAGE_EXTRACTION', 'true').lower() == 'true'
+INLINE_IMAGE_MIN_BYTES = int(os.getenv('INLINE_IMAGE_MIN_BYTES', str(256 * 1024)))
+
+# Seconds between checks of a streaming client's connection (0 only notices on the next write)
+STREAM_DISCONNECT_POLL_INTERVAL = float(os.getenv('STREAM_DISCONNECT_POLL_INTERVAL', '0.25'))
+# Merge streamed token deltas into one SSE frame per window or byte threshold (0 sends every delta)
+SSE_COALESCE_WINDOW = float(os.getenv('SSE_COALESCE_WINDOW_MS', '0')) / 1000
+SSE_COALESCE_MAX_BYTES = int(os.getenv('SSE_COALESCE_MAX_BYTES', '1024'))
+# Latency budget of a voice turn (0 = none); when it runs out the fallback utterance is spoken instead
+VOICE_TURN_DEADLINE_MS = float(os.getenv('VOICE_TURN_DEADLINE_MS', '0'))
+VOICE_FALLBACK_UTTERANCE = os.getenv('VOICE_FALLBACK_UTTERANCE', DEFAULT_FALLBACK_UTTERANCE)
+# Speak a short acknowledgement while an image turn's upstream request is in flight (per request: "preamble")
+VOICE_PREAMBLE = os.getenv('VOICE_PREAMBLE', 'false').lower() == 'true'
+preamble_picker = PreamblePicker(
+    phrases=[p.strip() for p in os.getenv('VOICE_PREAMBLE_PHRASES', '').split('|') if p.strip()],
+    caption_template=os.getenv('VOICE_PREAMBLE_CAPTION_TEMPLATE', '{caption} Let me look closer.')
+)
+# Short descriptions of images already discussed, keyed by filename (the first sentence of the reply)
+image_captions = ImageCache(max_bytes=int(os.getenv('IMAGE_CAPTION_CACHE_BYTES', str(256 * 1024))))
+# Mirror a sample of chat and analysis calls to another provider/model to compare latency (results discarded)
+shadow_mirror = ShadowMirror(
+    provider=os.getenv('SHADOW_PROVIDER', '').lower() or None,
+    model=os.getenv('SHADOW_MODEL') or None,
+    sample_rate=float(os.getenv('SHADOW_SAMPLE_PERCENT', '0')) / 100,
+    service_factory=lambda provider: create_llm_service(provider=provider),
+    max_pending=int(os.getenv('SHADOW_MAX_PENDING', '4')),
+    timeout=float(os.getenv('SHADOW_TIMEOUT', '60')),
+    log_path=os.getenv('SHADOW_LOG_PATH') or None
+)
+# Persistent perceptual-hash index of analyzed artworks; near-identical photos reuse the stored description
+artwork_index = None
+if os.getenv('ARTWORK_INDEX', 'false').lower() == 'true':
+    artwork_index = ArtworkIndex(
+        os.getenv('ARTWORK_INDEX_DB', os.path.join(os.path.dirname(__file__), 'artworks.sqlite3')),
+        max_distance=int(os.getenv('ARTWORK_MATCH_DISTANCE', '8'))
+    )
+# Send a known artwork's stored description to the chat model next to a low-detail copy of the image
+ARTWORK_REUSE_IN_CHAT = os.getenv('ARTWORK_REUSE_IN_CHAT', 'false').lower() == 'true'
+# Prompt /analyze uses when none is given; only descriptions made for it are reused in chat
+DEFAULT_ANALYSIS_PROMPT = "Describe this image in detail."
+# Tokens and latency of every chat turn per session; SESSION_LEDGER_PATH also appends them to a JSONL file
+session_ledger = SessionLedger(
+    path=os.getenv('SESSION_LEDGER_PATH') or None,
+    flush_interval=float(os.getenv('SESSION_LEDGER_FLUSH_INTERVAL', '30')),
+    max_sessions=int(os.getenv('SESSION_LEDGER_MAX_SESSIONS', '1000'))
+)
+atexit.register(session_ledger.flush)
+# On-demand tracemalloc snapshots for /admin/memory; MEMORY_TRACE_FRAMES > 0 starts tracing at startup
+allocation_tracer = AllocationTracer(frames=int(os.getenv('MEMORY_TRACE_FRAMES', '0')) or 10)
+if int(os.getenv('MEMORY_TRACE_FRAMES', '0')) > 0:
+    allocation_tracer.start()
 # --- End Image Context Storage ---
 
 # Simple in-memory session storage (kept for potential other uses)
 sessions = {}
 
+# --- TTS Audio Cache ---
+# Synthesized speech is stored once per (text, voice, model, settings) under static/tts_cache
+# and evicted LRU once the cache grows past TTS_CACHE_MAX_BYTES. Set TTS_CACHE_ENABLED=false to disable.
+TTS_CACHE_DIR = os.path.join(os.path.dirname(__file__), 'static', 'tts_cache')
+tts_cache = None
+if os.getenv('TTS_CACHE_ENABLED', 'true').lower() == 'true':
+    tts_cache = TTSCache(TTS_CACHE_DIR, max_bytes=int(os.getenv('TTS_CACHE_MAX_BYTES', str(256 * 1024 * 1024))))
+# --- End TTS Audio Cache ---
+
 # Configure logging
 logging.basicConfig(level=logging.INFO) 
 app.logger.setLevel(logging.INFO) 
@@ -81,6 +244,9 @@ def clear_uploads_and_context(upload_dir, logger):
     # 1. Clear In-Memory Context
     logger.info("Resetting in-memory image context and session maps.")
     image_context.clear()
+    frame_history.clear()
+    vision_policy.forget()
+    frame_ingestor.forget()
     session_map.clear()
     pending_session_id = None
     # sessions.clear() # Clear other stores if applicable
@@ -113,23 +279,161 @@ def clear_uploads_and_context(upload_dir, logger):
 
     logger.info(f"Cleanup complete. Deleted {deleted_count} files. Encountered {error_count} errors.")
 
+# --- Helper Function for Session Image Binding ---
+def bind_session_image(session_id, filename, image_bytes):
+    """Store an uploaded frame for a session and bind it as the session's image.
+
+    Frames that are near-duplicates of the session's latest keyframe are not
+    written at all (the existing keyframe stays bound), and frames pushed out of
+    the session's ring buffer are deleted from the upload folder.
+
+    Returns:
+        Tuple of (filename bound to the session, whether the new frame was kept)
+    """
+    buffer = frame_history.get(session_id)
+    if buffer is None:
+        buffer = frame_history.setdefault(session_id, FrameBuffer(CAMERA_BUFFER_FRAMES, CAMERA_DEDUP_DISTANCE))
+
+    frame_hash = dhash(image_bytes)
+    if buffer.is_duplicate(frame_hash):
+        app.logger.info(f"Frame for session {session_id} is a near-duplicate of the latest keyframe; discarding")
+        return buffer.latest(), False
+
+    with open(os.path.join(app.config['UPLOAD_FOLDER'], filename), 'wb') as f:
+        f.write(image_bytes)
+
+    kept, evicted = buffer.add(filename, frame_hash, image_size(image_bytes))
+    if not kept:
+        # Lost a race with a concurrent near-identical frame
+        remove_upload(filename)
+        return buffer.latest(), False
+
+    image_context[session_id] = filename
+    if evicted:
+        remove_upload(evicted)
+    return filename, True
+
+def match_artwork(session_id, filename):
+    """Look up a session's frame in the artwork index; a match also seeds the frame's preamble caption."""
+    if artwork_index is None:
+        return None
+    buffer = frame_history.get(session_id)
+    frame = buffer.get(filename) if buffer else None
+    # Only a general description stands in for the image; answers to other prompts are too narrow
+    match = artwork_index.lookup(frame.frame_hash if frame else None, prompt=DEFAULT_ANALYSIS_PROMPT)
+    if match and image_captions.get(filename) is None:
+        caption = first_sentence(match.description)
+        if caption:
+            image_captions.put(filename, caption)
+    return match
+
+def remove_upload(filename):
+    """Delete a file from the upload folder, ignoring files that are already gone."""
+    try:
+        os.remove(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+    except OSError:
+        pass
+# --- End Session Image Binding Helper ---
+
+# --- Camera Frame Ingestion ---
+# Live camera frames can be streamed over one WebSocket per session instead of a
+# multipart POST per frame. Frames are rate-limited per session and deduplicated.
+frame_ingestor = FrameIngestor(
+    bind=lambda session_id, extension, data: bind_session_image(session_id, f"{uuid.uuid4()}_camera{extension}", data),
+    min_interval=float(os.getenv('CAMERA_MIN_FRAME_INTERVAL', '0.25')),
+    max_frame_bytes=int(os.getenv('CAMERA_MAX_FRAME_BYTES', str(5 * 1024 * 1024)))
+)
+
+if Sock is not None:
+    sock = Sock(app)
+
+    @sock.route('/ws/camera')
+    def camera_socket(ws):
+        """Receive binary camera frames for a session and acknowledge each with JSON.
+
+        Connect with ?session_id=<id> (the pending session is used if omitted), then
+        send each frame as one binary message. Every frame is answered with
+        {"status": "accepted" | "duplicate" | "throttled" | "rejected", ...}.
+        Text messages are treated as keep-alive pings.
+        """
+        global pending_session_id
+        session_id = request.args.get('session_id')
+        if not session_id:
+            if not pending_session_id:
+                pending_session_id = str(uuid.uuid4())
+            session_id = pending_session_id
+        app.logger.info(f"Camera WebSocket opened for session {session_id}")
+        try:
+            while True:
+                message = ws.receive()
+                if message is None:
+                    break
+                if isinstance(message, str):
+                    ws.send(json.dumps({"type": "pong"}))
+                    continue
+                ws.send(json.dumps(frame_ingestor.ingest(session_id, message)))
+        except ConnectionClosed:
+            pass
+        finally:
+            app.logger.info(f"Camera WebSocket closed for session {session_id}")
+else:
+    app.logger.warning("flask-sock not installed; /ws/camera frame ingestion is disabled")
+# --- End Camera Frame Ingestion ---
+
+# --- Frontend Assets ---
+# The Vite build is indexed on first request and served compressed (restart after rebuilding)
+FRONTEND_DIST_DIR = os.path.join(app.root_path, 'frontend', 'dist')
+frontend_assets = AssetManifest(FRONTEND_DIST_DIR,
+                                min_compress_bytes=int(os.getenv('STATIC_COMPRESS_MIN_BYTES', '1024')))
+JSON_GZIP_MIN_BYTES = int(os.getenv('JSON_GZIP_MIN_BYTES', '2048'))
+
+def serve_frontend_file(relative_path):
+    """Serve a file of the frontend build from the manifest."""
+    asset = frontend_assets.get(relative_path)
+    if asset is None:
+        return send_from_directory(FRONTEND_DIST_DIR, relative_path)
+    return frontend_assets.response(asset, request)
+
+@app.after_request
+def compress_large_json(response):
+    """Gzip large non-streamed JSON responses (JSON_GZIP_MIN_BYTES=0 disables)."""
+    if JSON_GZIP_MIN_BYTES > 0:
+        response = compress_json_response(response, request, min_bytes=JSON_GZIP_MIN_BYTES)
+    return response
+# --- End Frontend Assets ---
+
+@app.route('/health')
+def health():
+    """Lightweight liveness check for deploys and load balancers."""
+    return jsonify({"status": "ok"})
+
 # Define the root route to serve the built frontend UI
 @app.route('/')
 def index():
     """Serve the main frontend UI (Vite build)."""
-    return send_from_directory(os.path.join(app.root_path, 'frontend', 'dist'), 'index.html')
+    return serve_frontend_file('index.html')
 
 # Route to serve static assets for the frontend UI
 @app.route('/assets/<path:filename>')
 def serve_frontend_assets(filename):
     """Serve static assets from the frontend build's assets directory."""
-    return send_from_directory(os.path.join(app.root_path, 'frontend', 'dist', 'assets'), filename)
+    return serve_frontend_file(f'assets/{filename}')
 
 @app.route('/analyze', methods=['POST'])
 def analyze_image():
     """
     Endpoint for image analysis that sends results to ElevenLabs for vocalization.
     Accepts image data as file upload or URL and returns analysis.
+    
+    With ?voice=true&pipeline=true the analysis is streamed from the LLM, split
+    into sentences as it arrives and each sentence is synthesized while the model
+    keeps generating. The response is then newline-delimited JSON: one ordered
+    'segment' object per sentence with its audio URL, followed by a 'done' object
+    carrying the full analysis.
+    
+    With ?async=true the analysis is queued and a job ID is returned immediately
+    (202); poll /analyze/jobs/<job_id> for the result, or pass a webhook_url to
+    have the finished job POSTed to it.
     """
     try:
         # Check if we have image data
@@ -149,7 +453,7 @@ def analyze_image():
             }), 400
             
         # Get prompt from request or use default
-        prompt = "Describe this image in detail."
+        prompt = DEFAULT_ANALYSIS_PROMPT
         if request.is_json and 'prompt' in request.json:
             prompt = request.json['prompt']
             
@@ -161,62 +465,77 @@ def analyze_image():
             return jsonify({
                 "error": f"API key for '{llm_provider}' not configured."
             }), 500
+        
+        # Check if we should send to ElevenLabs
+        send_to_elevenlabs = request.args.get('voice', 'false').lower() == 'true'
+        pipelined = request.args.get('pipeline', 'false').lower() == 'true'
+        
+        # Job mode: hand the work to the background pool and free this worker right away
+        if request.args.get('async', 'false').lower() == 'true':
+            webhook_url = request.args.get('webhook_url') or request.form.get('webhook_url')
+            if not webhook_url and request.is_json:
+                webhook_url = request.json.get('webhook_url')
+            webhook_error = webhook_url_error(webhook_url, analysis_jobs.webhook_allowed_hosts) if webhook_url else None
+            if webhook_error:
+                return jsonify({
+                    "error": f"{webhook_error}."
+                }), 400
+            job = analysis_jobs.submit({
+                "provider": llm_provider,
+                "prompt": prompt,
+                "image_url": image_url,
+                "image_b64": base64.b64encode(image_data).decode('utf-8') if image_data else None,
+                "voice": send_to_elevenlabs
+            }, webhook_url=webhook_url)
+            status_url = f"{request.host_url.rstrip('/')}/analyze/jobs/{job.id}"
+            response = jsonify({"job_id": job.id, "status": job.status, "status_url": status_url})
+            response.headers['Location'] = status_url
+            return response, 202
+        
+        if send_to_elevenlabs and pipelined and not os.getenv('ELEVENLABS_API_KEY'):
+            return jsonify({
+                "error": "ELEVENLABS_API_KEY not configured."
+            }), 500
 
         # Create LLM service
         llm_service = create_llm_service(provider=llm_provider)
+        messages, vision_decision = build_analysis_messages(image_data, image_url, prompt, llm_provider)
         
-        # Prepare message with image
-        messages = [
-            {"role": "system", "content": "You are an expert at analyzing and describing images in detail."},
-            {"role": "user", "content": [
-                {"type": "text", "text": prompt}
-            ]}
-        ]
-        
-        # Add image to the user message content
-        if image_url:
-            # Add image URL to message
-            messages[1]["content"].append({
-                "type": "image_url",
-                "image_url": {"url": image_url}
-            })
-        elif image_data:
-            # Process image dataa
-            base64_image = base64.b64encode(image_data).decode('utf-8')
-            data_url = f"data:image/jpeg;base64,{base64_image}"
-            messages[1]["content"].append({
-                "type": "image_url",
-                "image_url": {"url": data_url}
-            })
-            
-        # Call LLM for analysis
-        response = llm_service.chat_completion(
-            messages=messages,
-            model=os.getenv('DEFAULT_MODEL', 'gpt-4o')
-        )
-        
-        # Extract the analysis text
-        analysis_text = response.choices[0].message.content
-        
-        # Check if we should send to ElevenLabs
-        send_to_elevenlabs = request.args.get('voice', 'false').lower() == 'true'
-        elevenlabs_response = None
+        # Image analysis always goes to the provider's vision pool
+        model = get_router(llm_provider).route(messages).model
         
-        if send_to_elevenlabs:
-            # Send to ElevenLabs for vocalization
-            elevenlabs_response = send_to_elevenlabs_tts(analysis_text)
-            
-        # Return the analysis and optional ElevenLabs response
-        result = {
-            "status": "success",
-            "analysis": analysis_text
-        }
+        if send_to_elevenlabs and pipelined:
+            # Analysis is batch work; it queues behind live voice turns for the provider
+            try:
+                admission = get_scheduler(llm_provider).acquire(PRIORITY_BATCH)
+            except AdmissionError as e:
+                app.logger.warning(f"Shedding /analyze request: {e}")
+                return admission_error_response(e)
+            try:
+                llm_stream = llm_service.chat_completion(
+                    messages=messages,
+                    model=model,
+                    stream=True
+                )
+            except Exception:
+                admission.release()
+                raise
+            pipeline = generate_pipelined_analysis(llm_stream, os.getenv('ELEVENLABS_API_KEY'))
+            response = Response(stream_with_context(admission.wrap(pipeline)), mimetype='application/x-ndjson')
+            response.call_on_close(admission.release)
+            response.headers['Cache-Control'] = 'no-cache'
+            response.headers['X-Accel-Buffering'] = 'no'
+            return response
         
-        if elevenlabs_response:
-            result["elevenlabs"] = elevenlabs_response
-            
+        # Known artworks photographed before (in any session) reuse their stored analysis
+        image_hash = dhash(image_data) if image_data and artwork_index is not None else None
+        result = run_analysis(llm_service, llm_provider, messages, model, vision_decision, send_to_elevenlabs,
+                              image_hash=image_hash, prompt=prompt)
         return jsonify(result), 200
             
+    except AdmissionError as e:
+        app.logger.warning(f"Shedding or upstream quota exhausted for /analyze: {e}")
+        return admission_error_response(e)
     except Exception as e:
         print(f"Error in analyze_image: {str(e)}")
         import traceback
@@ -226,6 +545,219 @@ def analyze_image():
             "error": f"Error analyzing image: {str(e)}"
         }), 500
 
+@app.route('/analyze/jobs/<job_id>', methods=['GET'])
+def analyze_job_status(job_id):
+    """Report the state of an /analyze?async=true job, with its result once finished."""
+    job = analysis_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found or expired"}), 404
+    return jsonify(job.to_dict()), 200
+
+def build_analysis_messages(image_data, image_url, prompt, llm_provider):
+    """
+    Build the vision request for an image analysis.
+    
+    Args:
+        image_data: Raw image bytes (or None if image_url is given)
+        image_url: Public image URL (or None if image_data is given)
+        prompt: The analysis instruction
+        llm_provider: Provider the request will be sent to
+        
+    Returns:
+        Tuple of (messages, vision decision or None)
+    """
+    # Prepare message with image
+    messages = [
+        {"role": "system", "content": "You are an expert at analyzing and describing images in detail."},
+        {"role": "user", "content": [
+            {"type": "text", "text": prompt}
+        ]}
+    ]
+    
+    # Pick the vision detail from the image size and the prompt (analysis is always a first look)
+    vision_decision = None
+    if ADAPTIVE_VISION_DETAIL:
+        vision_decision = vision_policy.choose(
+            image_url or "upload",
+            size=image_size(image_data) if image_data else None,
+            question=prompt,
+            provider=llm_provider
+        )
+    detail = vision_decision.detail if vision_decision else "auto"
+    if image_data and vision_decision and vision_decision.resize_to:
+        # The tile cap needs a smaller image than the provider would send; the token estimate assumes it
+        image_data = resize_image(image_data, vision_decision.resize_to) or image_data
+    
+    # Add image to the user message content
+    if image_url:
+        # Add image URL to message
+        messages[1]["content"].append({
+            "type": "image_url",
+            "image_url": {"url": image_url, "detail": detail}
+        })
+    elif image_data:
+        # Process image dataa
+        base64_image = base64.b64encode(image_data).decode('utf-8')
+        data_url = f"data:image/jpeg;base64,{base64_image}"
+        messages[1]["content"].append({
+            "type": "image_url",
+            "image_url": {"url": data_url, "detail": detail}
+        })
+    return messages, vision_decision
+
+def run_analysis(llm_service, llm_provider, messages, model, vision_decision, send_to_elevenlabs, queue_timeout=None,
+                 image_hash=None, prompt=None):
+    """
+    Run a non-streaming image analysis and optionally vocalize it.
+    
+    If the artwork index holds a description of a near-identical image made for
+    the same prompt, it is returned without calling the model; otherwise the new
+    analysis is added to the index.
+    
+    Args:
+        llm_service: The provider's LLM service
+        llm_provider: Provider name (selects the scheduler)
+        messages: Messages built by build_analysis_messages
+        model: Model to use
+        vision_decision: Vision detail decision to report, if any
+        send_to_elevenlabs: Whether to send the analysis to ElevenLabs TTS
+        queue_timeout: Seconds to wait for a batch slot (scheduler default if None)
+        image_hash: dHash of the uploaded image, if any (enables the artwork index)
+        prompt: The analysis instruction, which stored descriptions must match
+        
+    Returns:
+        The /analyze result dictionary
+        
+    Raises:
+        AdmissionError: If no upstream slot or quota was available in time
+    """
+    artwork = artwork_index.lookup(image_hash, prompt=prompt) if artwork_index is not None else None
+    if artwork:
+        app.logger.info(f"Reusing stored analysis of artwork {artwork.id} (distance {artwork.distance})")
+        analysis_text = artwork.description
+    else:
+        # Analysis is batch work; it queues behind live voice turns for the provider
+        with get_scheduler(llm_provider).acquire(PRIORITY_BATCH, timeout=queue_timeout):
+            shadow_pair = shadow_mirror.mirror("analyze", messages, llm_provider)
+            call_started = time.monotonic()
+            try:
+                response = llm_service.chat_completion(
+                    messages=messages,
+                    model=model
+                )
+            except Exception as e:
+                shadow_mirror.record_primary(shadow_pair, llm_provider, model, None,
+                                             time.monotonic() - call_started, error=f"{type(e).__name__}: {e}")
+                raise
+            call_latency = time.monotonic() - call_started
+        
+        # Extract the analysis text
+        analysis_text = response.choices[0].message.content
+        shadow_mirror.record_primary(shadow_pair, llm_provider, model, call_latency, call_latency, analysis_text or "",
+                                     completion_tokens=getattr(getattr(response, 'usage', None), 'completion_tokens', None))
+        if artwork_index is not None:
+            artwork_index.add(image_hash, analysis_text, prompt, llm_provider, model)
+    
+    elevenlabs_response = None
+    
+    if send_to_elevenlabs:
+        # Send to ElevenLabs for vocalization
+        elevenlabs_response = send_to_elevenlabs_tts(analysis_text)
+        
+    # Return the analysis and optional ElevenLabs response
+    result = {
+        "status": "success",
+        "analysis": analysis_text
+    }
+    if vision_decision and not artwork:
+        result["vision"] = vision_decision.to_dict()
+    if artwork:
+        result["artwork"] = {**artwork.to_dict(), "cached": True}
+    
+    if elevenlabs_response:
+        result["elevenlabs"] = elevenlabs_response
+    return result
+
+def run_analysis_job(payload):
+    """
+    Job handler for /analyze?async=true.
+    
+    Jobs can afford to wait for capacity, so a shed admission is retried until
+    ANALYZE_JOB_ADMISSION_TIMEOUT instead of failing the job.
+    """
+    image_data = base64.b64decode(payload['image_b64']) if payload.get('image_b64') else None
+    llm_provider = payload['provider']
+    llm_service = create_llm_service(provider=llm_provider)
+    messages, vision_decision = build_analysis_messages(image_data, payload.get('image_url'), payload['prompt'], llm_provider)
+    model = get_router(llm_provider).route(messages).model
+    image_hash = dhash(image_data) if image_data and artwork_index is not None else None
+    
+    deadline = time.monotonic() + ANALYZE_JOB_ADMISSION_TIMEOUT
+    while True:
+        try:
+            return run_analysis(llm_service, llm_provider, messages, model, vision_decision, payload.get('voice', False),
+                                queue_timeout=max(0.0, deadline - time.monotonic()),
+                                image_hash=image_hash, prompt=payload['prompt'])
+        except AdmissionError as e:
+            if time.monotonic() + e.retry_after >= deadline:
+                raise
+            time.sleep(e.retry_after)
+
+# Background pool for /analyze?async=true; ANALYZE_JOB_STORE=sqlite keeps queued jobs across restarts
+ANALYZE_JOB_ADMISSION_TIMEOUT = float(os.getenv('ANALYZE_JOB_ADMISSION_TIMEOUT', '300'))
+if os.getenv('ANALYZE_JOB_STORE', 'memory').lower() == 'sqlite':
+    analysis_job_store = SQLiteJobStore(os.getenv('ANALYZE_JOB_DB', os.path.join(os.path.dirname(__file__), 'jobs.sqlite3')))
+else:
+    analysis_job_store = MemoryJobStore()
+analysis_jobs = JobQueue(
+    run_analysis_job,
+    store=analysis_job_store,
+    workers=int(os.getenv('ANALYZE_JOB_WORKERS', '2')),
+    retention=float(os.getenv('ANALYZE_JOB_RETENTION', '3600')),
+    webhook_secret=os.getenv('ANALYZE_WEBHOOK_SECRET'),
+    # Without an allowlist, webhooks may only target hosts that resolve to public addresses
+    webhook_allowed_hosts=[host.strip().lower() for host in os.getenv('WEBHOOK_ALLOWED_HOSTS', '').split(',') if host.strip()] or None
+)
+
+@app.before_request
+def start_analysis_jobs():
+    """Resume stored jobs once the app serves requests (not at import, and never in the reloader's watcher process)."""
+    analysis_jobs.start()
+
+def generate_pipelined_analysis(llm_stream, api_key):
+    """
+    Turn a streamed analysis into an ordered NDJSON stream of synthesized sentences.
+    
+    Args:
+        llm_stream: Streaming chat completion from the LLM service
+        api_key: ElevenLabs API key
+        
+    Yields:
+        Newline-terminated JSON objects: 'segment' per sentence, then 'done' or 'error'
+    """
+    segmenter = SentenceSegmenter(min_chars=int(os.getenv('TTS_PIPELINE_MIN_CHARS', '20')))
+    analysis_parts = []
+    
+    def sentences():
+        for chunk in llm_stream:
+            if not chunk.choices or not chunk.choices[0].delta:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                analysis_parts.append(delta)
+                yield from segmenter.feed(delta)
+        yield from segmenter.flush()
+    
+    try:
+        max_workers = int(os.getenv('TTS_PIPELINE_WORKERS', '3'))
+        segments = pipeline_synthesis(sentences(), lambda text: generate_elevenlabs_audio(text, api_key), max_workers)
+        for segment in segments:
+            yield json.dumps({"type": "segment", **segment}) + "\n"
+        yield json.dumps({"type": "done", "status": "success", "analysis": "".join(analysis_parts)}) + "\n"
+    except Exception as e:
+        app.logger.error(f"Error during pipelined analysis: {str(e)}")
+        yield json.dumps({"type": "error", "error": f"Error analyzing image: {str(e)}"}) + "\n"
+
 @app.route('/v1/chat/completions', methods=['POST', 'OPTIONS'])
 @app.route('/v1/chat/completions/chat/completions', methods=['POST', 'OPTIONS'])  # Handle duplicate path pattern from ElevenLabs
 def chat_completions():
@@ -243,29 +775,9 @@ def chat_completions():
     for name, value in request.headers.items():
         app.logger.info(f"{name}: {value}")
     app.logger.info(f"{'-'*50}")
-    
-    try:
-        # Log raw body for debugging non-JSON requests or unexpected formats
-        raw_body = request.get_data()
-        app.logger.info(f"Raw Body (hex): {raw_body[:100].hex()}")
-        try:
-            text_body = request.get_data(as_text=True)
-            app.logger.info(f"Raw Body (text): {text_body[:500]}...")
-        except UnicodeDecodeError:
-            app.logger.info("Raw body is not valid UTF-8 text")
-            
-        # Attempt to log JSON if possible
-        if request.is_json:
-            try:
-                app.logger.info(f"JSON Payload: {request.json}")
-            except Exception as json_err:
-                app.logger.error(f"Error parsing JSON: {json_err}")
-        else:
-            app.logger.info("Request body is not JSON.")
-    except Exception as e:
-        app.logger.error(f"Error inspecting request body: {e}")
-        import traceback
-        app.logger.error(traceback.format_exc())
+    # The body itself is parsed once below and only summarized; large inline images
+    # would otherwise be copied several times just for logging
+    app.logger.info(f"Body: {request.content_length} bytes, Content-Type: {request.content_type}")
     app.logger.info(f"==================== End Request Details ====================")
     # --- END ADDED LOGGING ---
 
@@ -301,7 +813,18 @@ def chat_completions():
                 }
             }), 400
             
-        data = request.json
+        turn_started = time.monotonic()
+        # Parse once, straight from the input stream, with a size limit
+        try:
+            data = read_json_body(request, CHAT_MAX_BODY_BYTES)
+        except BodyTooLarge as e:
+            return jsonify({
+                "error": {
+                    "message": str(e),
+                    "type": "invalid_request_error",
+                    "code": 413
+                }
+            }), 413
         
         # Validate required fields
         if not data:
@@ -313,13 +836,18 @@ def chat_completions():
                 }
             }), 400
         
-        # Extract key parameters
-        model = data.get('model', os.getenv('DEFAULT_MODEL', 'gpt-4o')) 
+        # Extract key parameters (the model is resolved by the router once the final messages are known)
+        requested_model = data.get('model')
         messages = data.get('messages', [])
         temperature = data.get('temperature') 
         max_tokens = data.get('max_tokens')
         stream = data.get('stream', False) 
         
+        # Latency budget of the voice turn: header, extra-body field or configured default
+        turn_budget = resolve_budget(request.headers.get('X-Request-Deadline-Ms'), data.get('deadline_ms'),
+                                     VOICE_TURN_DEADLINE_MS)
+        turn_deadline = turn_started + turn_budget if turn_budget else None
+        
         # Validate messages format
         if not isinstance(messages, list) or not messages:
             return jsonify({
@@ -331,7 +859,19 @@ def chat_completions():
             }), 400
         
         # --- EXTENSIVE DEBUGGING for ElevenLabs Request ---
-        app.logger.info(f"=== FULL REQUEST DATA IN /v1/chat/completions ===\n{json.dumps(data, indent=2)}")
+        app.logger.info(f"=== REQUEST SUMMARY IN /v1/chat/completions === {summarize_payload(data)}")
+        
+        # Move inline base64 images into the upload store and send them by reference instead
+        if INLINE_IMAGE_EXTRACTION:
+            base_url = request.host_url.rstrip('/')
+            extracted, removed = extract_inline_images(
+                messages,
+                app.config['UPLOAD_FOLDER'],
+                lambda filename: f"{base_url}/serve_image/{filename}",
+                min_bytes=INLINE_IMAGE_MIN_BYTES
+            )
+            if extracted:
+                app.logger.info(f"Extracted {extracted} inline image(s) ({removed} base64 chars) into the upload store")
         
         # --- Attempt to get ElevenLabs User ID --- 
         # IMPORTANT: Requires 'user_id' to be sent by ElevenLabs (enable 'Custom LLM extra body')
@@ -354,6 +894,9 @@ def chat_completions():
         
         # --- Session Linking Logic --- 
         session_id = None
+        vision_decision = None
+        injected_image = None
+        artwork = None
         if elevenlabs_user_id:
             if elevenlabs_user_id not in session_map:
                 # If this elevenlabs_user_id is new, link it to the pending session_id
@@ -436,27 +979,71 @@ def chat_completions():
                 # Use the request's host URL instead of relying on environment variable
                 base_url = request.host_url.rstrip('/')
                 
-                # Construct the full public URL for the image
-                public_image_url = f"{base_url}/serve_image/{image_filename}"
-                app.logger.info(f"Injecting image URL: {public_image_url} for session: {session_id}")
-
-                # Create the OpenAI-compatible message structure for the image
+                # Pick the frames to send: the current image plus, if configured, earlier keyframes
+                buffer = frame_history.get(session_id)
+                frame_filenames = buffer.filenames() if buffer else []
+                if image_filename not in frame_filenames:
+                    frame_filenames = [image_filename]
+                frames = select_frames(frame_filenames, CAMERA_CONTEXT_FRAMES, CAMERA_CONTEXT_TOKEN_BUDGET, llm_provider)
+                
+                # A known artwork is sent at low detail together with its stored analysis
+                if ARTWORK_REUSE_IN_CHAT and len(frames) == 1:
+                    artwork = match_artwork(session_id, image_filename)
+                
+                # Choose the detail level of the current frame from its size, whether it changed and the question
+                if ADAPTIVE_VISION_DETAIL and not artwork:
+                    frame = buffer.get(image_filename) if buffer else None
+                    latest_user = next((m for m in reversed(messages) if m.get('role') == 'user'), {})
+                    vision_decision = vision_policy.choose(
+                        image_filename,
+                        size=frame.size if frame else None,
+                        question=message_text(latest_user),
+                        session_id=session_id,
+                        provider=llm_provider
+                    )
+                    frames[-1] = (frames[-1][0], vision_decision.detail)
+                    app.logger.info(f"Vision detail for {image_filename}: {vision_decision.to_dict()}")
+                
+                if len(frames) > 1:
+                    note = ("(System note: The user is sharing their live camera. These are recent frames, oldest first; "
+                            "the last one is the current view. Please analyze them in the context of our conversation.)")
+                else:
+                    note = "(System note: The user has shared an image. Please analyze this image in the context of our conversation.)"
+                
+                # Create the OpenAI-compatible message structure for the image(s)
                 image_message = {
                     "role": "user", 
                     "content": [
                         {
                             "type": "text",
-                            "text": "(System note: The user has shared an image. Please analyze this image in the context of our conversation.)" 
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": public_image_url,
-                                "detail": "auto" 
-                            }
+                            "text": note
                         }
                     ]
                 }
+                if artwork:
+                    note = ("(System note: The user has shared an image of an artwork that was analyzed before. "
+                            f"That analysis: {artwork.description} "
+                            "Where it disagrees with the image, trust the image. "
+                            "Please answer about it in the context of our conversation.)")
+                    image_message["content"][0]["text"] = note
+                    frames[-1] = (frames[-1][0], 'low')
+                    app.logger.info(f"Sending image {image_filename} at low detail with the stored description of artwork {artwork.id}")
+                for frame_filename, detail in frames:
+                    # Construct the full public URL for the frame
+                    public_image_url = f"{base_url}/serve_image/{frame_filename}"
+                    if vision_decision and vision_decision.resize_to and frame_filename == image_filename:
+                        # Served at the size the vision token estimate assumes
+                        public_image_url += "?w={}&h={}".format(*vision_decision.resize_to)
+                    image_message["content"].append({
+                        "type": "image_url",
+                        "image_url": {
+                            "url": public_image_url,
+                            "detail": detail
+                        }
+                    })
+                if frames:
+                    app.logger.info(f"Injecting {len(frames)} image(s) ending with {public_image_url} for session: {session_id}")
+                    injected_image = image_filename
                 
                 # Insert the image message into the list at position 1 (after system prompt)
                 # This ensures the image is analyzed in the context of the system prompt
@@ -486,72 +1073,278 @@ def chat_completions():
             
         # --- End Image URL Injection Logic ---
 
+        # --- Context Budget ---
+        # Keep the system prompt, bound image and recent turns; trim/summarize older turns to the budget
+        context_manager = ContextManager(
+            provider=llm_provider,
+            budget=int(os.getenv('CONTEXT_TOKEN_BUDGET', '8000')),
+            keep_recent=int(os.getenv('CONTEXT_KEEP_RECENT', '6')),
+            summary_tokens=int(os.getenv('CONTEXT_SUMMARY_TOKENS', '200'))
+        )
+        messages, context_report = context_manager.fit(messages)
+        app.logger.info(f"Context tokens: {context_report['tokens_before']} -> {context_report['tokens_after']} "
+                        f"(budget {context_report['budget']}, trimmed {context_report['trimmed_messages']} messages)")
+        # --- End Context Budget ---
+
+        # --- Model Routing ---
+        # Text-only turns go to the fast pool and image turns to the vision pool, unless overridden
+        router = get_router(llm_provider)
+        routing = router.route(
+            messages,
+            requested_model=requested_model,
+            override=request.headers.get('X-Model-Override') or data.get('model_override')
+        )
+        model = routing.model
+        app.logger.info(f"Model routing: {routing.to_dict()}")
+        # --- End Model Routing ---
+
+        # --- Admission Control ---
+        # Live voice turns take the interactive lane; shed fast instead of queueing past the deadline
+        scheduler = get_scheduler(llm_provider)
+        queue_timeout = None
+        if turn_deadline is not None:
+            queue_timeout = min(scheduler.queue_timeouts.get(PRIORITY_INTERACTIVE, 2.0),
+                                max(0.0, turn_deadline - time.monotonic()))
+        try:
+            admission = scheduler.acquire(PRIORITY_INTERACTIVE, timeout=queue_timeout)
+        except AdmissionError as e:
+            app.logger.warning(f"Shedding /v1/chat/completions request: {e}")
+            if turn_deadline is not None:
+                return voice_fallback_response(model, stream, "shed")
+            return admission_error_response(e, openai_format=True)
+        if admission.wait_time > 0.05:
+            app.logger.info(f"Admitted after {admission.wait_time * 1000:.0f} ms in the {llm_provider} queue")
+        # --- End Admission Control ---
+
         # Log the request for debugging (moved down slightly)
         print(f"Received request for /v1/chat/completions using {llm_provider} model {model}")
         print(f"Request headers: {dict(request.headers)}")
-        safe_data = data.copy() if data else {}
-        if 'api_key' in safe_data:
-            safe_data['api_key'] = '[REDACTED]'
-        print(f"Request data keys: {list(safe_data.keys())}")
+        print(f"Request data keys: {list(data.keys())}")
+        
+        # --- Latency-Masking Preamble ---
+        # Image turns spend a while in image preparation and prefill; say something natural meanwhile
+        preamble_text = None
+        use_preamble = data.get('preamble', VOICE_PREAMBLE)
+        if stream and injected_image and str(use_preamble).lower() == 'true':
+            preamble_text = preamble_picker.choose(session_id, caption=image_captions.get(injected_image))
+            app.logger.info(f"Streaming preamble while the image turn is prepared: {preamble_text!r}")
+        # --- End Latency-Masking Preamble ---
+        
+        # Optionally send the same turn to the shadow provider for comparison
+        shadow_pair = shadow_mirror.mirror("chat", messages, llm_provider, temperature, max_tokens)
+        image_tokens = context_manager.count_image_tokens(messages)
+        # The final usage chunk is only forwarded to clients that asked for it
+        client_wants_usage = bool((data.get('stream_options') or {}).get('include_usage'))
+        
+        def record_turn(status, ttft, output_text, usage=None):
+            """Add the turn to the session ledger, preferring the provider's token counts."""
+            session_ledger.record(
+                session_id, llm_provider, model,
+                prompt_tokens=usage.prompt_tokens if usage else context_report['tokens_after'],
+                completion_tokens=usage.completion_tokens if usage else estimate_text_tokens(output_text),
+                image_tokens=image_tokens,
+                ttft=ttft,
+                duration=time.monotonic() - request_started,
+                usage_source="provider" if usage else "estimated",
+                status=status
+            )
         
         # --- Call LLM Service (MODIFIED FOR TESTING) --- 
         try:
             # Pass the potentially modified messages list to the LLM service
-            llm_response = llm_service.chat_completion(
-                messages=messages,
-                model=model,
-                temperature=temperature,
-                max_tokens=max_tokens,
-                stream=stream 
-            )
+            request_started = time.monotonic()
+            def call_llm():
+                return llm_service.chat_completion(
+                    messages=messages,
+                    model=model,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    stream=stream,
+                    deadline=turn_deadline
+                )
+            
+            if preamble_text:
+                # The upstream call runs while the preamble is being sent
+                upstream_future = call_in_background(call_llm)
+            else:
+                llm_response = call_llm()
             
             # Handle streaming response if stream=True
             if stream:
+                client_conn = client_socket(request.environ)
+                
                 # Define a generator function to yield chunks from real LLM response
-                def generate_chunks():
-                    try:
-                        app.logger.info(">>> Starting generate_chunks with LLM response")
+                def generate_chunks(llm_response):
+                    # Close the upstream stream as soon as the voice client hangs up (e.g. on barge-in)
+                    # It also enforces the turn deadline until the first token arrives
+                    canceller = StreamCanceller(llm_response, client_conn,
+                                                poll_interval=STREAM_DISCONNECT_POLL_INTERVAL,
+                                                deadline=turn_deadline)
+                    streamed_parts = []
+                    frames_sent = 0
+                    ttft = None
+                    stream_error = None
+                    usage = None
+                    
+                    def upstream_chunks():
+                        nonlocal ttft, usage
                         for chunk in llm_response:
+                            if canceller.cancelled:
+                                break
+                            if ttft is None:
+                                # Time to first token feeds the router's latency-based shifting
+                                ttft = time.monotonic() - request_started
+                                router.record_ttft(model, ttft)
                             # Process the chunk (convert to string, format as SSE, etc.)
                             # Assuming the chunk object has a structure we can serialize
                             content_delta = ""
                             if chunk.choices and chunk.choices[0].delta:
                                 content_delta = chunk.choices[0].delta.content or ""
-                            
+                            streamed_parts.append(content_delta)
+                            if content_delta:
+                                canceller.first_token()
+                            if getattr(chunk, 'usage', None):
+                                usage = chunk.usage
+                                if not chunk.choices and not client_wants_usage:
+                                    continue
                             # More complete approach: yield OpenAI-like chunk structure
-                            chunk_dict = chunk.model_dump() 
+                            yield chunk.model_dump()
+                    
+                    def deadline_fallback():
+                        app.logger.warning("No token before the turn deadline; sending fallback utterance")
+                        yield f"data: {json.dumps(fallback_chunk(model, VOICE_FALLBACK_UTTERANCE))}\n\n"
+                        yield "data: [DONE]\n\n"
+                    
+                    canceller.start()
+                    try:
+                        app.logger.info(">>> Starting generate_chunks with LLM response")
+                        # Optionally merge token deltas into fewer frames (the first token is never delayed)
+                        for chunk_dict in coalesce_chunks(upstream_chunks(), SSE_COALESCE_WINDOW, SSE_COALESCE_MAX_BYTES):
                             sse_data = f"data: {json.dumps(chunk_dict)}\n\n"
                             yield sse_data
+                            frames_sent += 1
                             app.logger.info(f"DEBUG: Sent LLM chunk: {sse_data[:100]}...")
                             
-                        # Send final DONE signal
-                        done_signal = "data: [DONE]\n\n"
-                        yield done_signal
-                        app.logger.info(f"DEBUG: Sent [DONE] signal")
+                        if canceller.reason == "deadline":
+                            yield from deadline_fallback()
+                        elif not canceller.cancelled:
+                            # Send final DONE signal
+                            done_signal = "data: [DONE]\n\n"
+                            yield done_signal
+                            app.logger.info(f"DEBUG: Sent [DONE] signal ({len(streamed_parts)} upstream chunks in {frames_sent} frames)")
+                            if injected_image and image_captions.get(injected_image) is None:
+                                # Remember how the image was described, for the next turn's preamble
+                                caption = first_sentence("".join(streamed_parts))
+                                if caption:
+                                    image_captions.put(injected_image, caption)
+                    except GeneratorExit:
+                        # The server failed to write to the client and closed the response
+                        canceller.cancel("client_closed")
+                        raise
                     except Exception as e:
+                        if canceller.reason == "deadline":
+                            # No token arrived in time; the caller is still listening, so say something
+                            yield from deadline_fallback()
+                            return
+                        if canceller.cancelled:
+                            # Reading failed because the upstream was closed on purpose; nobody is listening
+                            return
                         app.logger.error(f"Error during streaming: {str(e)}")
+                        stream_error = f"{type(e).__name__}: {e}"
                         # Optionally yield an error event
                         yield f"data: {json.dumps({'error': str(e)})}\n\n"
                         yield "data: [DONE]\n\n" # Still send DONE even after error
                     finally:
+                        canceller.finish()
+                        output_text = "".join(streamed_parts)
+                        if not canceller.cancelled:
+                            shadow_mirror.record_primary(shadow_pair, llm_provider, model, ttft,
+                                                         time.monotonic() - request_started,
+                                                         output_text, error=stream_error,
+                                                         completion_tokens=usage.completion_tokens if usage else None)
+                        record_turn("cancelled" if canceller.cancelled else "error" if stream_error else "ok",
+                                    ttft, output_text, usage)
+                        if canceller.cancelled:
+                            tokens_streamed = estimate_text_tokens("".join(streamed_parts))
+                            cancellation_stats.record(llm_provider, model, canceller.reason, tokens_streamed,
+                                                      max_tokens=max_tokens,
+                                                      elapsed=time.monotonic() - request_started)
+                            app.logger.info(f"Upstream stream cancelled ({canceller.reason}) after "
+                                            f"~{tokens_streamed} tokens; {llm_provider}/{model} generation stopped")
                         app.logger.info("<<< Exiting generate_chunks")
                 
+                def generate_with_preamble():
+                    upstream = None
+                    try:
+                        yield f"data: {json.dumps(assistant_chunk(model, preamble_text))}\n\n"
+                        try:
+                            upstream = wait_for_stream(upstream_future, turn_deadline)
+                        except Exception as e:
+                            if turn_deadline is not None and is_deadline_error(e):
+                                app.logger.warning("Upstream call missed the turn deadline after the preamble; sending fallback utterance")
+                                yield f"data: {json.dumps(fallback_chunk(model, VOICE_FALLBACK_UTTERANCE))}\n\n"
+                            else:
+                                app.logger.error(f"Error starting stream after preamble: {str(e)}")
+                                yield f"data: {json.dumps({'error': str(e)})}\n\n"
+                            yield "data: [DONE]\n\n"
+                            return
+                        # The model's reply continues the same stream
+                        yield from generate_chunks(upstream)
+                    finally:
+                        if upstream is None:
+                            # The client hung up during the preamble (barge-in): stop the generation nobody will hear
+                            close_when_done(upstream_future)
+                
                 # Return a streaming response using the real LLM service now that we've verified connectivity
                 app.logger.info(">>> Using REAL LLM STREAMING response <<<")
-                response = Response(stream_with_context(generate_chunks()), mimetype='text/event-stream')
+                # The scheduler slot is held until the stream is finished or the client goes away
+                body = generate_with_preamble() if preamble_text else generate_chunks(llm_response)
+                response = Response(stream_with_context(admission.wrap(body)), mimetype='text/event-stream')
+                response.call_on_close(admission.release)
                 # Add headers that might help with cross-origin streaming
                 response.headers['Cache-Control'] = 'no-cache'
                 response.headers['X-Accel-Buffering'] = 'no'  
+                response.headers['X-Context-Tokens'] = str(context_report['tokens_after'])
+                response.headers['X-Routed-Model'] = model
+                if vision_decision:
+                    response.headers['X-Vision-Tokens'] = str(vision_decision.estimated_tokens)
+                if artwork:
+                    response.headers['X-Artwork-Match'] = str(artwork.id)
                 return response
             else:
                 # Non-streaming: Use the real LLM response
+                admission.release()
+                call_latency = time.monotonic() - request_started
+                router.record_call_latency(model, call_latency)
+                output_text = (llm_response.choices[0].message.content or "") if llm_response.choices else ""
+                usage = getattr(llm_response, 'usage', None)
+                shadow_mirror.record_primary(shadow_pair, llm_provider, model, call_latency, call_latency, output_text,
+                                             completion_tokens=usage.completion_tokens if usage else None)
+                record_turn("ok", call_latency, output_text, usage)
                 app.logger.info(">>> Returning NON-STREAMING real LLM response <<<")
                 # Convert the ChatCompletion object to a dictionary before jsonify
-                return jsonify(llm_response.model_dump())
+                response = jsonify(llm_response.model_dump())
+                response.headers['X-Context-Tokens'] = str(context_report['tokens_after'])
+                response.headers['X-Routed-Model'] = model
+                if vision_decision:
+                    response.headers['X-Vision-Tokens'] = str(vision_decision.estimated_tokens)
+                if artwork:
+                    response.headers['X-Artwork-Match'] = str(artwork.id)
+                return response
         
         except Exception as e:
             # This block catches errors specifically from the llm_service.chat_completion call
             # or subsequent response processing (like .model_dump() if not streaming)
+            admission.release()
+            shadow_mirror.record_primary(shadow_pair, llm_provider, model, None, time.monotonic() - request_started,
+                                         error=f"{type(e).__name__}: {e}")
+            if turn_deadline is not None and (is_deadline_error(e) or time.monotonic() >= turn_deadline):
+                # Out of time (quota pacing, image preparation or the upstream call): answer anyway
+                return voice_fallback_response(model, stream, type(e).__name__)
+            if isinstance(e, AdmissionError):
+                # Provider quota could not be met in time; let the caller back off
+                app.logger.warning(f"Upstream quota exhausted for /v1/chat/completions: {e}")
+                return admission_error_response(e, openai_format=True)
             app.logger.error(f"Error during LLM processing or response generation in /v1/chat/completions: {e}")
             import traceback
             app.logger.error(traceback.format_exc())
@@ -606,6 +1399,175 @@ def chat_completions():
             }
         }), 500
 
+@app.route('/admin/scheduler', methods=['GET'])
+def scheduler_metrics():
+    """Report queue depth, in-flight calls and shed counts per provider scheduler."""
+    if not admin_authorized():
+        return jsonify({"error": "Forbidden"}), 403
+    return jsonify(all_scheduler_metrics())
+
+@app.route('/admin/streams', methods=['GET'])
+def stream_stats():
+    """Report streams cancelled because the client went away, with the tokens they delivered."""
+    if not admin_authorized():
+        return jsonify({"error": "Forbidden"}), 403
+    return jsonify(cancellation_stats.snapshot())
+
+@app.route('/admin/ledger', methods=['GET'])
+def ledger_summary():
+    """Report token and latency totals overall and for the most recently active sessions (?limit=N)."""
+    if not admin_authorized():
+        return jsonify({"error": "Forbidden"}), 403
+    return jsonify(session_ledger.sessions(limit=request.args.get('limit', 50, type=int)))
+
+@app.route('/admin/ledger/<session_id>', methods=['GET'])
+def ledger_session(session_id):
+    """Report one session's totals and its recent turns."""
+    if not admin_authorized():
+        return jsonify({"error": "Forbidden"}), 403
+    entry = session_ledger.session(session_id)
+    if entry is None:
+        return jsonify({"error": "Session not found"}), 404
+    return jsonify(entry)
+
+@app.route('/admin/artworks', methods=['GET'])
+def artwork_stats():
+    """Report the artwork index size and how often lookups found a stored description."""
+    if not admin_authorized():
+        return jsonify({"error": "Forbidden"}), 403
+    return jsonify(artwork_index.stats() if artwork_index is not None else {"enabled": False})
+
+@app.route('/admin/shadow', methods=['GET'])
+def shadow_stats():
+    """Report primary vs shadow TTFT, latency, token counts and output length per endpoint."""
+    if not admin_authorized():
+        return jsonify({"error": "Forbidden"}), 403
+    return jsonify(shadow_mirror.snapshot())
+
+@app.route('/admin/router', methods=['GET'])
+def router_stats():
+    """Report model pools, routing counts and p50/p95 time to first token per model."""
+    if not admin_authorized():
+        return jsonify({"error": "Forbidden"}), 403
+    return jsonify(all_router_stats())
+
+def memory_stores():
+    """Entry counts and deep sizes of the in-memory stores that grow with traffic."""
+    stores = {
+        "image_context": store_usage(image_context),
+        "session_map": store_usage(session_map),
+        "sessions": store_usage(sessions),
+        "frame_history": store_usage(frame_history),
+        "image_captions": store_usage(image_captions, image_captions.stats()),
+        "resized_images": store_usage(resized_images, resized_images.stats()),
+        "vision_policy": store_usage(vision_policy),
+        "preamble_picker": store_usage(preamble_picker),
+        "frame_ingestor": store_usage(frame_ingestor),
+        "session_ledger": store_usage(session_ledger),
+        "analysis_jobs": store_usage(analysis_jobs.store, analysis_jobs.stats()),
+        "shadow_mirror": store_usage(shadow_mirror),
+        "stream_cancellations": store_usage(cancellation_stats),
+        "frontend_assets": store_usage(frontend_assets, frontend_assets.stats()),
+    }
+    # The Gemini service is imported on first use; its caches exist only once it has been
+    gemini = sys.modules.get('service_gemini')
+    if gemini is not None:
+        service = gemini.GeminiService
+        stores["gemini_image_cache"] = store_usage(service._image_cache, service._image_cache.stats())
+        if service._file_handles is not None:
+            stores["gemini_file_handles"] = store_usage(service._file_handles, service._file_handles.stats())
+    if artwork_index is not None:
+        stores["artwork_index"] = store_usage(artwork_index, artwork_index.stats())
+    if tts_cache is not None:
+        stores["tts_cache"] = store_usage(tts_cache, tts_cache.stats())
+    return stores
+
+def session_memory(limit):
+    """Memory and upload disk usage per session, largest first, plus uploads no session references."""
+    upload_dir = app.config['UPLOAD_FOLDER']
+    users = {}
+    for user_id, session_id in list(session_map.items()):
+        users.setdefault(session_id, []).append(user_id)
+    per_session = {}
+    bound = set()
+    for session_id in set(image_context) | set(frame_history):
+        buffer = frame_history.get(session_id)
+        filenames = set(buffer.filenames()) if buffer else set()
+        if image_context.get(session_id):
+            filenames.add(image_context[session_id])
+        bound |= filenames
+        per_session[session_id] = {
+            "linked_users": len(users.get(session_id, [])),
+            "frames": len(filenames),
+            "frame_disk_bytes": file_sizes(upload_dir, filenames),
+            "frame_buffer_bytes": store_usage(buffer)["bytes"] if buffer else 0,
+        }
+    unbound = [f for f in os.listdir(upload_dir) if f not in bound] if os.path.isdir(upload_dir) else []
+    return {
+        "count": len(per_session),
+        "largest": largest(per_session, "frame_disk_bytes", limit),
+        "unbound_uploads": {"files": len(unbound), "bytes": file_sizes(upload_dir, unbound)},
+    }
+
+@app.route('/admin/memory', methods=['GET'])
+def memory_report():
+    """Report process RSS, per-store sizes, per-session usage (?sessions=N) and disk usage of uploads/ and static/."""
+    if not admin_authorized():
+        return jsonify({"error": "Forbidden"}), 403
+    return jsonify({
+        "process": process_memory(),
+        "stores": memory_stores(),
+        "sessions": session_memory(request.args.get('sessions', 20, type=int)),
+        "disk": {
+            "uploads": directory_usage(app.config['UPLOAD_FOLDER']),
+            "static": directory_usage(os.path.join(os.path.dirname(__file__), 'static')),
+        },
+        "tracemalloc": allocation_tracer.status(),
+    })
+
+@app.route('/admin/memory/trace', methods=['POST'])
+def memory_trace():
+    """Start ({"action": "start", "frames": N}) or stop ({"action": "stop"}) allocation tracing."""
+    if not admin_authorized():
+        return jsonify({"error": "Forbidden"}), 403
+    data = request.get_json(silent=True) or {}
+    action = data.get('action', 'start')
+    if action == 'start':
+        return jsonify(allocation_tracer.start(data.get('frames')))
+    if action == 'stop':
+        return jsonify(allocation_tracer.stop())
+    return jsonify({"error": "action must be 'start' or 'stop'"}), 400
+
+@app.route('/admin/memory/snapshot', methods=['GET'])
+def memory_snapshot():
+    """Report the top allocation sites (?limit=N&group_by=lineno|filename|traceback) and keep them as the diff baseline."""
+    if not admin_authorized():
+        return jsonify({"error": "Forbidden"}), 403
+    group_by = request.args.get('group_by', 'lineno')
+    if group_by not in ('lineno', 'filename', 'traceback'):
+        return jsonify({"error": "group_by must be lineno, filename or traceback"}), 400
+    try:
+        return jsonify(allocation_tracer.snapshot(limit=request.args.get('limit', 20, type=int), group_by=group_by))
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 409
+
+@app.route('/admin/memory/diff', methods=['GET'])
+def memory_diff():
+    """Report the allocation sites that grew most since the last snapshot (?rebase=true moves the baseline)."""
+    if not admin_authorized():
+        return jsonify({"error": "Forbidden"}), 403
+    group_by = request.args.get('group_by', 'lineno')
+    if group_by not in ('lineno', 'filename', 'traceback'):
+        return jsonify({"error": "group_by must be lineno, filename or traceback"}), 400
+    try:
+        return jsonify(allocation_tracer.diff(
+            limit=request.args.get('limit', 20, type=int),
+            group_by=group_by,
+            rebase=request.args.get('rebase', 'false').lower() == 'true'
+        ))
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 409
+
 @app.route('/upload_image_get_url', methods=['POST'])
 def upload_image_get_url():
     """Receive an image file and a session_id, save the image, and return a public URL.
@@ -639,13 +1601,9 @@ def upload_image_get_url():
         # Generate a unique filename (to prevent overwrites/collisions)
         file_extension = os.path.splitext(image_file.filename)[1].lower()
         unique_filename = f"{uuid.uuid4()}{file_extension}"
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
         
-        # Save the image file
-        image_file.save(file_path)
-        
-        # Store mapping in image_context using session_id
-        image_context[session_id] = unique_filename
+        # Save the image file and store mapping in image_context using session_id
+        unique_filename, _ = bind_session_image(session_id, unique_filename, image_file.read())
         app.logger.info(f"Saved image for session {session_id}: {unique_filename}")
         
         # Construct public URL for the image 
@@ -674,6 +1632,24 @@ def serve_image(filename):
         # Sanitize filename (extra security on top of send_from_directory)
         safe_filename = os.path.basename(filename)
         
+        # A vision decision may ask for the image downscaled to fit w x h
+        width = request.args.get('w', type=int)
+        height = request.args.get('h', type=int)
+        if width and height:
+            key = f"{safe_filename}?w={width}&h={height}"
+            resized = resized_images.get(key)
+            if resized is None:
+                with open(os.path.join(app.config['UPLOAD_FOLDER'], safe_filename), 'rb') as f:
+                    data = f.read()
+                size = image_size(data)
+                # Only the size the vision policy issues for this image is produced; other sizes get the original
+                if size and vision_policy.resize_target(*size) == (width, height):
+                    resized = resize_image(data, (width, height))
+                    if resized:
+                        resized_images.put(key, resized)
+            if resized:
+                return Response(resized, mimetype='image/jpeg')
+        
         # Use Flask's secure file serving function
         return send_from_directory(app.config['UPLOAD_FOLDER'], safe_filename)
     except FileNotFoundError:
@@ -854,6 +1830,42 @@ def send_to_elevenlabs_agent(text, agent_id, api_key):
             "message": f"Error: {str(e)}"
         }
 
+def build_elevenlabs_tts_request(text, api_key, voice_id, stream=False):
+    """
+    Build the URL, headers and body for an ElevenLabs TTS call.
+    
+    Args:
+        text: The text to convert to speech
+        api_key: ElevenLabs API key
+        voice_id: The ElevenLabs voice to synthesize with
+        stream: Whether to target the chunked streaming endpoint
+        
+    Returns:
+        Tuple of (url, headers, data)
+    """
+    # ElevenLabs API endpoint for text-to-speech
+    url = f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}"
+    if stream:
+        url = f"{url}/stream"
+    
+    # Headers with API key
+    headers = {
+        "Accept": "audio/mpeg",
+        "Content-Type": "application/json",
+        "xi-api-key": api_key
+    }
+    
+    # Request body
+    data = {
+        "text": text,
+        "model_id": os.getenv('ELEVENLABS_TTS_MODEL', 'eleven_multilingual_v2'),
+        "voice_settings": {
+            "stability": 0.5,
+            "similarity_boost": 0.5
+        }
+    }
+    return url, headers, data
+
 def generate_elevenlabs_audio(text, api_key):
     """
     Generate audio from text using ElevenLabs TTS API.
@@ -873,30 +1885,31 @@ def generate_elevenlabs_audio(text, api_key):
             "message": "ELEVENLABS_VOICE_ID not configured"
         }
     try:
-        # ElevenLabs API endpoint for text-to-speech
-        url = f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}"
+        url, headers, data = build_elevenlabs_tts_request(text, api_key, voice_id)
         
-        # Headers with API key
-        headers = {
-            "Accept": "audio/mpeg",
-            "Content-Type": "application/json",
-            "xi-api-key": api_key
-        }
-        
-        # Request body
-        data = {
-            "text": text,
-            "model_id": "eleven_multilingual_v2",
-            "voice_settings": {
-                "stability": 0.5,
-                "similarity_boost": 0.5
-            }
-        }
+        # Return previously synthesized audio for identical requests
+        cache_key = TTSCache.make_key(text, voice_id, data["model_id"], data["voice_settings"])
+        if tts_cache:
+            cached_filename = tts_cache.get(cache_key)
+            if cached_filename:
+                app.logger.info(f"TTS cache hit: {cached_filename}")
+                return {
+                    "status": "success",
+                    "audio_url": f"/static/tts_cache/{cached_filename}",
+                    "cached": True
+                }
         
         # Make the request
         response = requests.post(url, json=data, headers=headers)
         
-        if response.status_code == 200:
+        if response.status_code == 200 and tts_cache:
+            cached_filename = tts_cache.put(cache_key, response.content)
+            return {
+                "status": "success",
+                "audio_url": f"/static/tts_cache/{cached_filename}",
+                "cached": False
+            }
+        elif response.status_code == 200:
             # Save the audio file
             filename = f"speech_{uuid.uuid4()}.mp3"
             filepath = os.path.join(os.path.dirname(__file__), 'static', filename)
@@ -928,6 +1941,133 @@ def generate_elevenlabs_audio(text, api_key):
             "status": "error",
             "message": f"Error: {str(e)}"
         }
+
+def stream_elevenlabs_audio(upstream, tee_path=None, chunk_size=4096, on_complete=None):
+    """
+    Relay audio chunks from an open ElevenLabs streaming response.
+    
+    Chunks are yielded as soon as they arrive so playback can start on the
+    first one. If tee_path is given, the audio is also written to disk; the
+    file only appears under its final name once the stream completed.
+    
+    Args:
+        upstream: A requests.Response opened with stream=True
+        tee_path: Optional path to save a copy of the audio to
+        chunk_size: Maximum number of bytes per relayed chunk
+        on_complete: Optional callback receiving tee_path once the full audio was written
+        
+    Yields:
+        Raw audio bytes
+    """
+    tee_file = None
+    partial_path = f"{tee_path}.part" if tee_path else None
+    completed = False
+    try:
+        if tee_path:
+            os.makedirs(os.path.dirname(tee_path), exist_ok=True)
+            tee_file = open(partial_path, 'wb')
+        for chunk in upstream.iter_content(chunk_size=chunk_size):
+            if not chunk:
+                continue
+            if tee_file:
+                tee_file.write(chunk)
+            yield chunk
+        completed = True
+    finally:
+        upstream.close()
+        if tee_file:
+            tee_file.close()
+            if completed:
+                os.replace(partial_path, tee_path)
+                if on_complete:
+                    on_complete(tee_path)
+            else:
+                # Client went away mid-stream; don't leave a truncated file behind
+                try:
+                    os.remove(partial_path)
+                except OSError:
+                    pass
+
+@app.route('/elevenlabs/tts/stream', methods=['POST', 'OPTIONS'])
+def stream_elevenlabs_tts():
+    """
+    Stream synthesized speech to the client as it is generated.
+    
+    Expects a JSON body with 'text' and optionally 'voice_id' and 'save'.
+    Audio is relayed with chunked transfer encoding, so time-to-first-audio is
+    the provider's first-chunk latency rather than the full synthesis time.
+    When 'save' is true the audio is also written to static/ and its URL is
+    returned in the X-Audio-Url header. With the TTS cache enabled, completed
+    streams are always cached and repeated requests are served from disk.
+    """
+    if request.method == 'OPTIONS':
+        return handle_preflight()
+    
+    data = request.get_json(silent=True) or {}
+    text = data.get('text')
+    if not text:
+        return jsonify({"error": "No text provided"}), 400
+    
+    api_key = os.getenv('ELEVENLABS_API_KEY')
+    if not api_key:
+        app.logger.error("Error: ELEVENLABS_API_KEY not found in environment variables")
+        return jsonify({"error": "ELEVENLABS_API_KEY not configured"}), 500
+    
+    voice_id = data.get('voice_id') or os.getenv('ELEVENLABS_VOICE_ID', 'pNInz6obpgDQGcFmaJgB')
+    url, headers, body = build_elevenlabs_tts_request(text, api_key, voice_id, stream=True)
+    
+    cache_key = TTSCache.make_key(text, voice_id, body["model_id"], body["voice_settings"])
+    if tts_cache:
+        cached_filename = tts_cache.get(cache_key)
+        if cached_filename:
+            app.logger.info(f"TTS cache hit: {cached_filename}")
+            response = send_from_directory(TTS_CACHE_DIR, cached_filename, mimetype='audio/mpeg')
+            response.headers['X-Audio-Url'] = f"/static/tts_cache/{cached_filename}"
+            response.headers['X-TTS-Cache'] = 'hit'
+            return response
+    
+    try:
+        # Open the upstream stream before responding so provider errors still map to a status code
+        upstream = requests.post(url, json=body, headers=headers, stream=True)
+    except requests.exceptions.RequestException as e:
+        app.logger.error(f"Error opening ElevenLabs TTS stream: {str(e)}")
+        return jsonify({"error": f"Failed to communicate with ElevenLabs API: {str(e)}"}), 502
+    
+    if upstream.status_code != 200:
+        details = upstream.text
+        upstream.close()
+        app.logger.error(f"Error from ElevenLabs TTS stream API: {upstream.status_code} - {details}")
+        return jsonify({
+            "status": "error",
+            "message": f"ElevenLabs TTS API error: {upstream.status_code}",
+            "details": details
+        }), 502
+    
+    tee_path = None
+    audio_url = None
+    on_complete = None
+    if tts_cache:
+        # Tee into the cache's staging area; the file is adopted once the stream completes
+        tee_path = tts_cache.staging_path(cache_key)
+        audio_url = f"/static/tts_cache/{TTSCache.filename_for(cache_key)}"
+        on_complete = lambda path: tts_cache.put_file(cache_key, path)
+    elif data.get('save'):
+        filename = f"speech_{uuid.uuid4()}.mp3"
+        tee_path = os.path.join(os.path.dirname(__file__), 'static', filename)
+        audio_url = f"/static/{filename}"
+    
+    chunk_size = int(os.getenv('TTS_STREAM_CHUNK_SIZE', '4096'))
+    response = Response(stream_with_context(stream_elevenlabs_audio(upstream, tee_path, chunk_size, on_complete)),
+                        mimetype='audio/mpeg')
+    # The generator's cleanup never runs if the response is closed before the first read
+    response.call_on_close(upstream.close)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    if tts_cache:
+        response.headers['X-TTS-Cache'] = 'miss'
+    if audio_url:
+        response.headers['X-Audio-Url'] = audio_url
+    return response
     
 @app.route('/upload_image', methods=['POST'])
 def upload_image():
@@ -958,30 +2098,36 @@ def upload_image():
             
         # Generate safe filename with timestamp to avoid collisions
         filename = f"{uuid.uuid4()}_{secure_filename(image_file.filename)}"
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
         
         # Create directory if it doesn't exist
         os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
         
-        # Save the image
-        image_file.save(file_path)
-        app.logger.info(f"Image saved at: {file_path}")
-        
-        # Store the image filename in our session context dict
-        image_context[session_id] = filename
+        # Save the image and store the filename in our session context dict
+        # (near-duplicate frames aren't written; the previous keyframe stays linked)
+        filename, kept = bind_session_image(session_id, filename, image_file.read())
+        if kept:
+            app.logger.info(f"Image saved at: {os.path.join(app.config['UPLOAD_FOLDER'], filename)}")
         app.logger.info(f"Image {filename} linked to session {session_id}")
         
+        # Link photos of previously analyzed artworks to their stored description
+        artwork = match_artwork(session_id, filename)
+        if artwork:
+            app.logger.info(f"Image {filename} matches known artwork {artwork.id} (distance {artwork.distance})")
+        
         # Return success with the public image URL
         base_url = request.host_url.rstrip('/')
         public_image_url = f"{base_url}/serve_image/{filename}"
         
-        return jsonify({
+        result = {
             "status": "success",
             "message": "Image uploaded successfully",
             "filename": filename,
             "session_id": session_id,
             "public_image_url": public_image_url
-        })
+        }
+        if artwork:
+            result["artwork"] = artwork.to_dict()
+        return jsonify(result)
         
     except Exception as e:
         app.logger.error(f"Error uploading image: {str(e)}")
@@ -997,16 +2143,16 @@ def catch_all(path):
     This enables client-side routing to work properly.
     """
     # Check if the requested path is a file in the dist directory
-    file_path = os.path.join(app.root_path, 'frontend', 'dist', path)
-    if os.path.isfile(file_path):
-        return send_from_directory(os.path.join(app.root_path, 'frontend', 'dist'), path)
+    if frontend_assets.get(path):
+        return serve_frontend_file(path)
     
     # For all other routes, serve the main index.html (client-side routing)
-    return send_from_directory(os.path.join(app.root_path, 'frontend', 'dist'), 'index.html')
+    return serve_frontend_file('index.html')
 
 if __name__ == '__main__':
     # Load environment variables FIRST
     load_dotenv()
+    print_environment_debug()
 
     # --- Perform Cleanup BEFORE Running ---
     app.logger.info("Performing startup cleanup...")
@@ -1014,6 +2160,11 @@ if __name__ == '__main__':
     app.logger.info("Startup cleanup finished.")
     # --- End Cleanup ---
 
+    # Resume stored /analyze jobs right away in the serving process; with debug=True the
+    # reloader's watcher process also runs this block but never serves
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        analysis_jobs.start()
+
     # Run the app
     app.logger.info("Starting Flask application...")
     # Use host='0.0.0.0' to make it accessible on the network if needed
@@ -0,0 +1,180 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from image_utils import hamming_distance
+
+
+class BKTree:
+    """Burkhard-Keller tree over perceptual hashes for Hamming-distance range queries."""
+
+    def __init__(self):
+        # Each node is [hash, values, {distance: child}]
+        self._root: Optional[list] = None
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, image_hash: int, value: Any):
+        """Insert a value under a hash (values sharing a hash share a node)."""
+        self._size += 1
+        if self._root is None:
+            self._root = [image_hash, [value], {}]
+            return
+        node = self._root
+        while True:
+            distance = hamming_distance(image_hash, node[0])
+            if distance == 0:
+                node[1].append(value)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [image_hash, [value], {}]
+                return
+            node = child
+
+    def search(self, image_hash: int, max_distance: int) -> List[Tuple[int, Any]]:
+        """Return (distance, value) pairs within max_distance of a hash, nearest first."""
+        if self._root is None:
+            return []
+        matches = []
+        pending = [self._root]
+        while pending:
+            node = pending.pop()
+            distance = hamming_distance(image_hash, node[0])
+            if distance <= max_distance:
+                matches.extend((distance, value) for value in node[1])
+            # Triangle inequality: only children within max_distance of this distance can match
+            for child_distance, child in node[2].items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    pending.append(child)
+        matches.sort(key=lambda match: match[0])
+        return matches
+
+
+class ArtworkMatch:
+    """A previously analyzed image found near a query hash."""
+
+    def __init__(self, artwork_id: int, distance: int, description: str, prompt: str):
+        self.id = artwork_id
+        self.distance = distance
+        self.description = description
+        self.prompt = prompt
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"id": self.id, "distance": self.distance}
+
+
+def normalize_prompt(prompt: Optional[str]) -> str:
+    return " ".join((prompt or "").lower().split())
+
+
+class ArtworkIndex:
+    """
+    Persistent index of analyzed images by perceptual hash (dHash).
+
+    Descriptions are stored in SQLite per image and prompt, and the hashes are
+    held in a BK-tree so a new photo of an artwork that was analyzed before, in
+    any session, is matched to the stored description within max_distance bits.
+    """
+
+    def __init__(self, path: str, max_distance: int = 8):
+        """
+        Open the index and load its hashes.
+
+        Args:
+            path: SQLite database file
+            max_distance: Maximum Hamming distance for two photos to count as the same artwork
+        """
+        self.path = path
+        self.max_distance = max_distance
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._tree = BKTree()
+        self._entries: Dict[int, Tuple[int, str, str]] = {}
+        self._counters = {"lookups": 0, "hits": 0, "added": 0}
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS artworks ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT, hash TEXT NOT NULL, prompt TEXT NOT NULL,"
+                " description TEXT NOT NULL, provider TEXT, model TEXT, created_at REAL NOT NULL,"
+                " hits INTEGER NOT NULL DEFAULT 0, last_hit REAL)"
+            )
+            rows = self._conn.execute("SELECT id, hash, prompt, description FROM artworks").fetchall()
+        for artwork_id, image_hash, prompt, description in rows:
+            # Hashes are stored as hex text; SQLite integers are signed 64-bit
+            self._insert(artwork_id, int(image_hash, 16), prompt, description)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def lookup(self, image_hash: Optional[int], prompt: Optional[str] = None) -> Optional[ArtworkMatch]:
+        """
+        Find the stored description of a near-identical image.
+
+        Args:
+            image_hash: dHash of the new image (None never matches)
+            prompt: Only accept descriptions made for this prompt; None accepts any, nearest first
+
+        Returns:
+            The best ArtworkMatch, or None
+        """
+        if image_hash is None:
+            return None
+        wanted = normalize_prompt(prompt) if prompt is not None else None
+        with self._lock:
+            self._counters["lookups"] += 1
+            for distance, artwork_id in self._tree.search(image_hash, self.max_distance):
+                _, entry_prompt, description = self._entries[artwork_id]
+                if wanted is None or entry_prompt == wanted:
+                    self._counters["hits"] += 1
+                    match = ArtworkMatch(artwork_id, distance, description, entry_prompt)
+                    break
+            else:
+                return None
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE artworks SET hits = hits + 1, last_hit = ? WHERE id = ?",
+                               (time.time(), match.id))
+        return match
+
+    def add(self, image_hash: Optional[int], description: str, prompt: str,
+            provider: Optional[str] = None, model: Optional[str] = None) -> Optional[int]:
+        """
+        Store the description of an analyzed image.
+
+        A near-identical image already described for the same prompt keeps its
+        description, so repeated photos don't grow the index.
+
+        Returns:
+            The ID of the new or existing entry, or None if there was nothing to store
+        """
+        if image_hash is None or not description:
+            return None
+        prompt = normalize_prompt(prompt)
+        with self._lock:
+            for _, artwork_id in self._tree.search(image_hash, self.max_distance):
+                if self._entries[artwork_id][1] == prompt:
+                    return artwork_id
+            with self._conn:
+                cursor = self._conn.execute(
+                    "INSERT INTO artworks (hash, prompt, description, provider, model, created_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    (format(image_hash, "x"), prompt, description, provider, model, time.time())
+                )
+            self._insert(cursor.lastrowid, image_hash, prompt, description)
+            self._counters["added"] += 1
+            return cursor.lastrowid
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the entry count, match threshold and lookup counters."""
+        with self._lock:
+            return {"entries": len(self._entries), "max_distance": self.max_distance, **self._counters}
+
+    def _insert(self, artwork_id: int, image_hash: int, prompt: str, description: str):
+        self._entries[artwork_id] = (image_hash, prompt, description)
+        self._tree.add(image_hash, artwork_id)
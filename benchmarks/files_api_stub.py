@@ -0,0 +1,205 @@
+"""
+Local stub of the Gemini Files API for exercising provider-side file handles.
+
+Implements the resumable upload protocol used by file_handles.GeminiFilesClient
+(start + "upload, finalize"), GET/DELETE of file metadata and a /stats endpoint,
+with a configurable handle lifetime and injected upload failures.
+
+Usage:
+    # Serve the stub and point the backend at it
+    python benchmarks/files_api_stub.py --port 8089 --ttl 3600
+    GEMINI_FILE_HANDLES=true GEMINI_FILES_BASE_URL=http://127.0.0.1:8089 python app.py
+
+    # Check upload-once, expiry and inline fallback of FileHandleCache against the stub,
+    # and which chat errors count as a rejected handle
+    python benchmarks/files_api_stub.py --self-test
+
+--self-test exits with status 1 if a check fails.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+from werkzeug.serving import make_server
+from werkzeug.wrappers import Request, Response
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from file_handles import FileHandleCache, GeminiFilesClient  # noqa: E402
+
+
+class FilesApiStub:
+    """WSGI app holding uploaded files in memory."""
+
+    def __init__(self, ttl=48 * 3600, fail_rate=0.0):
+        self.ttl = ttl
+        self.fail_rate = fail_rate
+        self.files = {}
+        self.sessions = {}
+        self.counters = {"uploads": 0, "upload_bytes": 0, "failed": 0}
+        self.lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        request = Request(environ)
+        response = self.dispatch(request)
+        return response(environ, start_response)
+
+    def dispatch(self, request):
+        path = request.path
+        if request.method == "POST" and path == "/upload/v1beta/files":
+            if request.headers.get("X-Goog-Upload-Command") != "start":
+                return self.error(400, "expected X-Goog-Upload-Command: start")
+            session_id = uuid.uuid4().hex
+            with self.lock:
+                self.sessions[session_id] = {
+                    "mime_type": request.headers.get("X-Goog-Upload-Header-Content-Type", "application/octet-stream"),
+                    "display_name": (request.get_json(silent=True) or {}).get("file", {}).get("display_name", ""),
+                }
+            response = Response(status=200)
+            response.headers["X-Goog-Upload-URL"] = f"{request.host_url}upload/v1beta/files/session/{session_id}"
+            return response
+        if request.method == "POST" and path.startswith("/upload/v1beta/files/session/"):
+            with self.lock:
+                session = self.sessions.pop(path.rsplit("/", 1)[-1], None)
+            if session is None:
+                return self.error(404, "unknown upload session")
+            if random.random() < self.fail_rate:
+                with self.lock:
+                    self.counters["failed"] += 1
+                return self.error(503, "injected failure")
+            data = request.get_data()
+            file_id = uuid.uuid4().hex[:16]
+            expires = datetime.fromtimestamp(time.time() + self.ttl, tz=timezone.utc)
+            info = {
+                "name": f"files/{file_id}",
+                "displayName": session["display_name"],
+                "mimeType": session["mime_type"],
+                "sizeBytes": str(len(data)),
+                "uri": f"{request.host_url}v1beta/files/{file_id}",
+                "expirationTime": expires.strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
+                "state": "ACTIVE",
+            }
+            with self.lock:
+                self.files[file_id] = info
+                self.counters["uploads"] += 1
+                self.counters["upload_bytes"] += len(data)
+            return self.json({"file": info})
+        if path.startswith("/v1beta/files/"):
+            file_id = path.rsplit("/", 1)[-1]
+            with self.lock:
+                info = self.files.pop(file_id, None) if request.method == "DELETE" else self.files.get(file_id)
+            if info is None:
+                return self.error(404, "file not found")
+            return self.json({} if request.method == "DELETE" else info)
+        if path == "/stats":
+            with self.lock:
+                return self.json({"files": len(self.files), **self.counters})
+        return self.error(404, "not found")
+
+    @staticmethod
+    def json(data, status=200):
+        return Response(json.dumps(data), status=status, mimetype="application/json")
+
+    def error(self, status, message):
+        return self.json({"error": {"code": status, "message": message}}, status=status)
+
+
+def serve_in_background(stub):
+    """Start the stub on a free local port and return (server, base URL)."""
+    server = make_server("127.0.0.1", 0, stub, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def self_test():
+    """Exercise FileHandleCache against the stub and return a list of failed checks."""
+    failures = []
+
+    def check(name, condition):
+        print(f"{'ok  ' if condition else 'FAIL'} {name}")
+        if not condition:
+            failures.append(name)
+
+    image = b"\xff\xd8\xff" + os.urandom(64 * 1024)
+    loads = []
+
+    def load():
+        loads.append(1)
+        return image, "image/jpeg"
+
+    stub = FilesApiStub(ttl=3600)
+    server, base_url = serve_in_background(stub)
+    try:
+        cache = FileHandleCache(GeminiFilesClient("stub", base_url=base_url), refresh_margin=60)
+        first = cache.get_or_upload("http://host/serve_image/a.jpg", load)
+        second = cache.get_or_upload("http://host/serve_image/a.jpg", load)
+        check("first use uploads and returns a handle", first is not None and first.uri.startswith(base_url))
+        check("later turns reuse the handle without reloading", second is first and len(loads) == 1)
+        check("stub saw exactly one upload", stub.counters["uploads"] == 1)
+
+        # A handle inside the refresh margin is replaced by a fresh upload
+        first.expires_at = time.time() + 30
+        third = cache.get_or_upload("http://host/serve_image/a.jpg", load)
+        check("expiring handle is re-uploaded", third is not first and stub.counters["uploads"] == 2)
+
+        cache.invalidate("http://host/serve_image/a.jpg")
+        cache.get_or_upload("http://host/serve_image/a.jpg", load)
+        check("invalidated handle is re-uploaded", stub.counters["uploads"] == 3)
+
+        stub.fail_rate = 1.0
+        failed = cache.get_or_upload("http://host/serve_image/b.jpg", load)
+        check("failed upload falls back to inline", failed is None)
+        stub.fail_rate = 0.0
+        retried = cache.get_or_upload("http://host/serve_image/b.jpg", load)
+        check("failed image stays inline until retry_after", retried is None)
+        print(json.dumps(cache.stats()))
+    finally:
+        server.shutdown()
+
+    # Only chat errors about the handles that were sent trigger an inline retry
+    import httpx
+    from openai import BadRequestError
+    from service_gemini import GeminiService
+
+    def bad_request(message, status="INVALID_ARGUMENT"):
+        response = httpx.Response(400, request=httpx.Request("POST", "http://host/chat/completions"))
+        return BadRequestError(message, response=response, body={"code": 400, "message": message, "status": status})
+
+    handles = {"http://host/serve_image/a.jpg": f"{base_url}/v1beta/files/abc123",
+               "http://host/serve_image/b.jpg": f"{base_url}/v1beta/files/def456"}
+    rejected = GeminiService.rejected_handles(bad_request("File files/abc123 is not found."), handles)
+    check("error naming a handle rejects only that handle", rejected == ["http://host/serve_image/a.jpg"])
+    rejected = GeminiService.rejected_handles(bad_request("The file URI is invalid or has expired."), handles)
+    check("unnamed file error rejects every handle", rejected == list(handles))
+    rejected = GeminiService.rejected_handles(
+        bad_request("Invalid value during security profile check: temperature must be <= 2."), handles)
+    check("unrelated error (during, security, profile) is not retried", rejected == [])
+    rejected = GeminiService.rejected_handles(bad_request("The file is too large.", status="RESOURCE_EXHAUSTED"), handles)
+    check("file error without an argument/lookup status is not retried", rejected == [])
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--ttl", type=float, default=48 * 3600, help="Handle lifetime in seconds")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Fraction of uploads answered with 503")
+    parser.add_argument("--self-test", action="store_true", help="Run the FileHandleCache checks and exit")
+    args = parser.parse_args()
+
+    if args.self_test:
+        sys.exit(1 if self_test() else 0)
+
+    server = make_server("127.0.0.1", args.port, FilesApiStub(args.ttl, args.fail_rate), threaded=True)
+    print(f"Files API stub listening on http://127.0.0.1:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+"""
+Micro-benchmarks for the per-turn request-path helpers.
+
+Cases (each timed in-process on realistic multi-turn payloads with large base64 images):
+  - chat_link_inject      POST /v1/chat/completions (non-streaming): session linking,
+                          image injection, context fit and routing, with a canned upstream
+  - chat_sse_framing      POST /v1/chat/completions (streaming): SSE framing of 200 upstream
+                          chunks in generate_chunks()
+  - gemini_process_image  GeminiService.process_image on 2 MB of image bytes (cache miss)
+  - gemini_process_cached GeminiService.process_image on the same bytes (cache hit)
+  - gemini_prepare        GeminiService.prepare_messages on a 12-turn history with data-URI images
+  - openai_process_image  OpenAIService.process_image on 2 MB of image bytes
+  - anthropic_convert     AnthropicService._convert_to_anthropic_format on the 12-turn history
+
+Each case reports the median time per call over several rounds and is compared
+with the stored baseline (benchmarks/baselines/micro_benchmark.json). Baselines
+are machine-specific; record them on the machine that runs the check.
+
+Usage:
+    python benchmarks/micro_benchmark.py                      # compare with the baseline
+    python benchmarks/micro_benchmark.py --update-baseline    # record a new baseline
+    python benchmarks/micro_benchmark.py --only gemini --tolerance 0.3
+
+Exits with status 1 when a case is slower than its baseline by more than --tolerance.
+"""
+import argparse
+import base64
+import contextlib
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_PATH = os.path.join(REPO_ROOT, "benchmarks", "baselines", "micro_benchmark.json")
+
+IMAGE_BYTES = 2 * 1024 * 1024
+HISTORY_TURNS = 12
+STREAM_CHUNKS = 200
+
+
+def make_image(size):
+    """A JPEG header followed by filler is enough for MIME sniffing and content hashing."""
+    return b"\xff\xd8\xff\xe0" + os.urandom(size - 4)
+
+
+def make_history(image, turns):
+    """Build a multi-turn OpenAI-format conversation with an inline image every few turns."""
+    data_uri = "data:image/jpeg;base64," + base64.b64encode(image).decode()
+    messages = [{"role": "system", "content": "You are a friendly museum guide. Keep answers short."}]
+    for turn in range(turns):
+        content = [{"type": "text", "text": f"What can you tell me about this part ({turn})?"}]
+        if turn % 4 == 0:
+            content.append({"type": "image_url", "image_url": {"url": data_uri, "detail": "low"}})
+        messages.append({"role": "user", "content": content})
+        messages.append({"role": "assistant", "content": "It's an oil painting from the late period. " * 4})
+    messages.append({"role": "user", "content": "And who painted it?"})
+    return messages
+
+
+class CannedChunk:
+    def __init__(self, text):
+        self.text = text
+        self.usage = None
+        self.choices = [type("Choice", (), {"delta": type("Delta", (), {"content": text})()})()]
+
+    def model_dump(self):
+        return {"id": "bench", "object": "chat.completion.chunk", "model": "bench",
+                "choices": [{"index": 0, "delta": {"content": self.text}, "finish_reason": None}]}
+
+
+class CannedCompletion:
+    usage = None
+    choices = [type("Choice", (), {"message": type("Message", (), {"content": "ok"})()})()]
+
+    def model_dump(self):
+        return {"id": "bench", "object": "chat.completion", "choices": [
+            {"index": 0, "message": {"role": "assistant", "content": "ok"}, "finish_reason": "stop"}]}
+
+
+class CannedService:
+    """Stands in for the provider so only the proxy's own work is timed."""
+
+    def chat_completion(self, messages, stream=False, **kwargs):
+        if stream:
+            return iter([CannedChunk(f"word{i} ") for i in range(STREAM_CHUNKS)])
+        return CannedCompletion()
+
+
+def time_case(func, number, repeat):
+    """Return the median seconds per call over repeat rounds of number calls."""
+    func()  # warm up caches and lazy imports
+    rounds = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        rounds.append((time.perf_counter() - started) / number)
+    return statistics.median(rounds)
+
+
+def build_cases():
+    """Import the app and services with a canned upstream and return {name: (func, number)}."""
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+    os.environ.setdefault("ANTHROPIC_API_KEY", "benchmark")
+    os.environ["TTS_CACHE_ENABLED"] = "false"
+    os.environ["CONTEXT_TOKEN_BUDGET"] = "0"
+    sys.path.insert(0, REPO_ROOT)
+    with contextlib.redirect_stdout(open(os.devnull, "w")):
+        import app
+    from image_utils import ImageCache
+    from service_claude import AnthropicService
+    from service_gemini import GeminiService
+    from service_openapi import OpenAIService
+
+    app.app.logger.setLevel(logging.WARNING)
+    app.create_llm_service = lambda provider=None: CannedService()
+    client = app.app.test_client()
+
+    image = make_image(IMAGE_BYTES)
+    history = make_history(image, HISTORY_TURNS)
+
+    # One linked voice session with a bound camera frame, as after /upload_image
+    session_id = "bench-session"
+    app.session_map["bench-user"] = session_id
+    app.bind_session_image(session_id, "bench_frame.jpg", image)
+    chat_body = json.dumps({"model": "gpt-4o", "user_id": "bench-user", "stream": False,
+                            "messages": [m for m in history if not isinstance(m["content"], list)]})
+    stream_body = json.dumps({"model": "gpt-4o", "user_id": "bench-user", "stream": True,
+                              "messages": [{"role": "user", "content": "Tell me a story."}]})
+
+    def chat_link_inject():
+        response = client.post("/v1/chat/completions", data=chat_body, content_type="application/json")
+        assert response.status_code == 200, response.status_code
+
+    def chat_sse_framing():
+        response = client.post("/v1/chat/completions", data=stream_body, content_type="application/json")
+        assert response.data.endswith(b"data: [DONE]\n\n")
+
+    gemini = GeminiService()
+    openai_service = OpenAIService()
+    anthropic = AnthropicService()
+
+    def gemini_process_image():
+        GeminiService._image_cache = ImageCache()
+        gemini.process_image(image)
+
+    cached = ImageCache()
+
+    def gemini_process_cached():
+        GeminiService._image_cache = cached
+        gemini.process_image(image)
+
+    def gemini_prepare():
+        gemini.prepare_messages(history)
+
+    def openai_process_image():
+        openai_service.process_image(image)
+
+    def anthropic_convert():
+        anthropic._convert_to_anthropic_format(history)
+
+    return {
+        "chat_link_inject": (chat_link_inject, 20),
+        "chat_sse_framing": (chat_sse_framing, 10),
+        "gemini_process_image": (gemini_process_image, 10),
+        "gemini_process_cached": (gemini_process_cached, 50),
+        "gemini_prepare": (gemini_prepare, 200),
+        "openai_process_image": (openai_process_image, 10),
+        "anthropic_convert": (anthropic_convert, 200),
+    }
+
+
+def load_baseline():
+    if not os.path.exists(BASELINE_PATH):
+        return {}
+    with open(BASELINE_PATH) as f:
+        return json.load(f).get("cases", {})
+
+
+def save_baseline(results):
+    os.makedirs(os.path.dirname(BASELINE_PATH), exist_ok=True)
+    with open(BASELINE_PATH, "w") as f:
+        json.dump({
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cases": {name: {"median_us": round(seconds * 1e6, 1)} for name, seconds in results.items()},
+        }, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="Timed rounds per case")
+    parser.add_argument("--only", help="Run only cases whose name contains this text")
+    parser.add_argument("--tolerance", type=float, default=0.5,
+                        help="Allowed slowdown over the baseline as a fraction (0.5 = 50%%)")
+    parser.add_argument("--update-baseline", action="store_true", help="Store the results as the new baseline")
+    args = parser.parse_args()
+
+    # Run from a scratch directory so the bound frame lands outside the repo
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        cases = build_cases()
+        results = {}
+        for name, (func, number) in cases.items():
+            if args.only and args.only not in name:
+                continue
+            with contextlib.redirect_stdout(open(os.devnull, "w")):
+                results[name] = time_case(func, number, args.repeat)
+
+    baseline = load_baseline()
+    regressions = []
+    print(f"{'case':<24}{'median':>12}{'baseline':>12}{'change':>10}")
+    for name, seconds in results.items():
+        base = baseline.get(name, {}).get("median_us")
+        change = ""
+        if base:
+            ratio = seconds * 1e6 / base
+            change = f"{(ratio - 1) * 100:+.0f}%"
+            if ratio > 1 + args.tolerance:
+                regressions.append(name)
+                change += " !"
+        print(f"{name:<24}{seconds * 1e6:>10.1f}us{(f'{base:.1f}us' if base else '-'):>12}{change:>10}")
+
+    if args.update_baseline:
+        save_baseline({**{name: entry["median_us"] / 1e6 for name, entry in baseline.items()}, **results})
+        print(f"Baseline written to {os.path.relpath(BASELINE_PATH, REPO_ROOT)}")
+        return
+    if regressions:
+        print(f"Regressed beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
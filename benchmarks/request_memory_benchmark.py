@@ -0,0 +1,120 @@
+"""
+Memory benchmark for large /v1/chat/completions request bodies.
+
+Posts a chat request carrying a large inline base64 image to the app in a fresh
+interpreter process and measures, for that one request:
+  - peak Python heap allocation during the request (tracemalloc)
+  - growth of the process's peak resident set size (ru_maxrss)
+  - request latency
+
+The upstream model call is replaced by a canned completion inside the probe
+process, so only the proxy's own request handling is measured.
+
+Usage:
+    python benchmarks/request_memory_benchmark.py --image-mb 10 --runs 3
+
+Exits with status 1 when the median heap peak exceeds --budget-multiple times
+the request body size.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = r"""
+import base64, json, os, resource, sys, time, tracemalloc
+sys.path.insert(0, {repo_root!r})
+import app
+
+class CannedCompletion:
+    def model_dump(self):
+        return {{"id": "bench", "object": "chat.completion", "choices": [
+            {{"index": 0, "message": {{"role": "assistant", "content": "ok"}}, "finish_reason": "stop"}}]}}
+
+class CannedService:
+    def chat_completion(self, messages, **kwargs):
+        return CannedCompletion()
+
+app.create_llm_service = lambda provider=None: CannedService()
+
+# A JPEG header followed by filler is enough for MIME sniffing and content hashing
+image = b"\xff\xd8\xff\xe0" + os.urandom({image_bytes} - 4)
+body = json.dumps({{
+    "model": "bench",
+    "stream": False,
+    "messages": [{{"role": "user", "content": [
+        {{"type": "text", "text": "What is in this picture?"}},
+        {{"type": "image_url", "image_url": {{"url": "data:image/jpeg;base64," + base64.b64encode(image).decode()}}}},
+    ]}}],
+}}).encode()
+del image
+
+client = app.app.test_client()
+rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+tracemalloc.start()
+started = time.perf_counter()
+response = client.post("/v1/chat/completions", data=body, content_type="application/json")
+elapsed = time.perf_counter() - started
+_, peak = tracemalloc.get_traced_memory()
+tracemalloc.stop()
+rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+assert response.status_code == 200, response.status_code
+print(json.dumps({{
+    "body_mb": len(body) / 1e6,
+    "heap_peak_mb": peak / 1e6,
+    "rss_growth_mb": (rss_after - rss_before) / 1024,
+    "latency_ms": elapsed * 1000,
+}}))
+"""
+
+
+def run_once(image_bytes, env):
+    """Send one large request in a fresh interpreter and return its measurements."""
+    code = PROBE.format(repo_root=REPO_ROOT, image_bytes=image_bytes)
+    # Run from a scratch directory so extracted images land outside the repo
+    with tempfile.TemporaryDirectory() as workdir:
+        result = subprocess.run([sys.executable, "-c", code], cwd=workdir, env=env,
+                                capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--image-mb", type=float, default=10, help="Size of the inline image before base64 encoding")
+    parser.add_argument("--runs", type=int, default=3, help="Number of measured requests (one process each)")
+    parser.add_argument("--no-extraction", action="store_true",
+                        help="Disable inline image extraction to compare against pass-through")
+    parser.add_argument("--budget-multiple", type=float, default=3.0,
+                        help="Allowed median heap peak as a multiple of the body size")
+    parser.add_argument("--json", action="store_true", help="Print the summary as JSON only")
+    args = parser.parse_args()
+
+    env = dict(os.environ, LLM_PROVIDER="openai", OPENAI_API_KEY="benchmark", CONTEXT_TOKEN_BUDGET="0",
+               INLINE_IMAGE_EXTRACTION="false" if args.no_extraction else "true")
+    samples = [run_once(int(args.image_mb * 1024 * 1024), env) for _ in range(args.runs)]
+    summary = {metric: round(statistics.median(sample[metric] for sample in samples), 1) for metric in samples[0]}
+    over_budget = summary["heap_peak_mb"] > args.budget_multiple * summary["body_mb"]
+
+    if args.json:
+        print(json.dumps({"summary": summary, "budget_multiple": args.budget_multiple,
+                          "over_budget": over_budget}, indent=2))
+    else:
+        print(f"Requests: {args.runs} (body {summary['body_mb']:.1f} MB, "
+              f"extraction {'off' if args.no_extraction else 'on'})")
+        print(f"  heap peak    median {summary['heap_peak_mb']:>8.1f} MB")
+        print(f"  RSS growth   median {summary['rss_growth_mb']:>8.1f} MB")
+        print(f"  latency      median {summary['latency_ms']:>8.1f} ms")
+        status = "OVER BUDGET" if over_budget else "within budget"
+        print(f"Heap peak is {summary['heap_peak_mb'] / summary['body_mb']:.1f}x the body ({status}, "
+              f"budget {args.budget_multiple:.1f}x)")
+
+    return 1 if over_budget else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
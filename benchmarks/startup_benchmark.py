@@ -0,0 +1,101 @@
+"""
+Startup-time benchmark for the Flask backend.
+
+Runs the app in fresh interpreter processes and measures:
+  - cold import time of app.py
+  - time to the first served request (GET /health through the WSGI app)
+  - first-use cost of resolving the configured LLM provider (lazy import)
+  - total wall time of the process, including interpreter startup
+
+Usage:
+    python benchmarks/startup_benchmark.py --runs 10 --budget-ms 1500
+
+Exits with status 1 when the median time-to-first-request exceeds the budget.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = r"""
+import json, sys, time
+t0 = time.perf_counter()
+sys.path.insert(0, {repo_root!r})
+import app
+t_import = time.perf_counter()
+response = app.app.test_client().get('/health')
+assert response.status_code == 200, response.status_code
+t_first_request = time.perf_counter()
+from llm_factory import get_provider_class
+get_provider_class({provider!r})
+t_provider = time.perf_counter()
+print(json.dumps({{
+    "import_ms": (t_import - t0) * 1000,
+    "first_request_ms": (t_first_request - t0) * 1000,
+    "provider_import_ms": (t_provider - t_first_request) * 1000,
+}}))
+"""
+
+
+def run_once(provider):
+    """Run one cold start in a fresh interpreter and return its timings."""
+    code = PROBE.format(repo_root=REPO_ROOT, provider=provider)
+    # Run from a scratch directory so the probe doesn't create uploads/ in the repo
+    with tempfile.TemporaryDirectory() as workdir:
+        started = time.perf_counter()
+        result = subprocess.run([sys.executable, "-c", code], cwd=workdir,
+                                capture_output=True, text=True, check=True)
+        wall_ms = (time.perf_counter() - started) * 1000
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    timings["process_wall_ms"] = wall_ms
+    return timings
+
+
+def summarize(samples):
+    """Return median/p95/max for each metric."""
+    summary = {}
+    for metric in samples[0]:
+        values = sorted(sample[metric] for sample in samples)
+        p95_index = min(len(values) - 1, int(round(0.95 * (len(values) - 1))))
+        summary[metric] = {
+            "median": round(statistics.median(values), 1),
+            "p95": round(values[p95_index], 1),
+            "max": round(values[-1], 1),
+        }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10, help="Number of cold starts to measure")
+    parser.add_argument("--provider", default=os.getenv("LLM_PROVIDER", "openai").lower(),
+                        help="Provider whose lazy import cost is measured")
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("STARTUP_BUDGET_MS", "1500")),
+                        help="Budget for the median time-to-first-request")
+    parser.add_argument("--json", action="store_true", help="Print the summary as JSON only")
+    args = parser.parse_args()
+
+    samples = [run_once(args.provider) for _ in range(args.runs)]
+    summary = summarize(samples)
+    over_budget = summary["first_request_ms"]["median"] > args.budget_ms
+
+    if args.json:
+        print(json.dumps({"summary": summary, "budget_ms": args.budget_ms, "over_budget": over_budget}, indent=2))
+    else:
+        print(f"Cold starts: {args.runs} (provider: {args.provider})")
+        for metric, stats in summary.items():
+            print(f"  {metric:<20} median {stats['median']:>8.1f} ms   p95 {stats['p95']:>8.1f} ms   max {stats['max']:>8.1f} ms")
+        status = "OVER BUDGET" if over_budget else "within budget"
+        print(f"Time to first request: {summary['first_request_ms']['median']:.1f} ms ({status}, budget {args.budget_ms:.0f} ms)")
+
+    return 1 if over_budget else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+import threading
+import time
+from typing import Any, Callable, Dict, Tuple
+
+from image_utils import sniff_image_mime
+
+EXTENSIONS = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/webp": ".webp",
+    "image/gif": ".gif",
+}
+
+
+class FrameIngestor:
+    """
+    Accepts binary camera frames streamed over a persistent connection.
+    Frames are validated, rate-limited per session (frames arriving faster than
+    min_interval are dropped) and handed to a bind callback that deduplicates
+    them and updates the session's bound image.
+    """
+
+    def __init__(self,
+                 bind: Callable[[str, str, bytes], Tuple[str, bool]],
+                 min_interval: float = 0.25,
+                 max_frame_bytes: int = 5 * 1024 * 1024):
+        """
+        Initialize the ingestor.
+
+        Args:
+            bind: Function (session_id, extension, image_bytes) -> (bound filename, whether the frame was kept)
+            min_interval: Minimum seconds between accepted frames of one session
+            max_frame_bytes: Largest accepted frame
+        """
+        self.bind = bind
+        self.min_interval = min_interval
+        self.max_frame_bytes = max_frame_bytes
+        self._last_accepted: Dict[str, float] = {}
+        self._stats = {"accepted": 0, "duplicate": 0, "throttled": 0, "rejected": 0}
+        self._lock = threading.Lock()
+
+    def ingest(self, session_id: str, data: bytes) -> Dict[str, Any]:
+        """
+        Process one frame.
+
+        Args:
+            session_id: Session the frame belongs to
+            data: Encoded image bytes
+
+        Returns:
+            Acknowledgement with 'status' of accepted, duplicate, throttled or rejected
+        """
+        if not data or len(data) > self.max_frame_bytes:
+            return self._count({"status": "rejected", "reason": "empty or oversized frame"})
+        mime_type = sniff_image_mime(data, default="")
+        if mime_type not in EXTENSIONS:
+            return self._count({"status": "rejected", "reason": "unsupported image format"})
+
+        now = time.monotonic()
+        with self._lock:
+            last = self._last_accepted.get(session_id)
+            if last is not None and now - last < self.min_interval:
+                throttled = True
+            else:
+                throttled = False
+                self._last_accepted[session_id] = now
+        if throttled:
+            return self._count({"status": "throttled", "retry_after_ms": int((self.min_interval - (now - last)) * 1000)})
+
+        filename, kept = self.bind(session_id, EXTENSIONS[mime_type], data)
+        return self._count({"status": "accepted" if kept else "duplicate", "filename": filename})
+
+    def forget(self, session_id: str = None):
+        """Drop rate-limit state for a session (all sessions if None)."""
+        with self._lock:
+            if session_id is None:
+                self._last_accepted.clear()
+            else:
+                self._last_accepted.pop(session_id, None)
+
+    def stats(self) -> Dict[str, int]:
+        """Return counts of frames by outcome."""
+        with self._lock:
+            return dict(self._stats)
+
+    def _count(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            self._stats[result["status"]] += 1
+        return result
@@ -0,0 +1,120 @@
+import queue
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, List
+
+
+def chunk_content(chunk: Dict[str, Any]) -> str:
+    """Return the text delta of an OpenAI-style chat.completion.chunk dict."""
+    choices = chunk.get("choices") or []
+    if not choices:
+        return ""
+    return (choices[0].get("delta") or {}).get("content") or ""
+
+
+def is_mergeable(chunk: Dict[str, Any]) -> bool:
+    """
+    Return True for plain text deltas that can be folded into a neighbour.
+
+    Chunks carrying tool calls, several choices, a finish reason or usage are
+    passed through on their own so their structure is preserved.
+    """
+    choices = chunk.get("choices") or []
+    if len(choices) != 1 or chunk.get("usage"):
+        return False
+    choice = choices[0]
+    if choice.get("finish_reason") is not None or choice.get("logprobs"):
+        return False
+    delta = choice.get("delta") or {}
+    return all(key in ("content", "role") or value is None for key, value in delta.items())
+
+
+def merge_chunks(chunks: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Merge consecutive mergeable chunks into one.
+
+    The first chunk supplies the envelope (id, model, created, role) and the
+    text deltas are concatenated.
+    """
+    if len(chunks) == 1:
+        return chunks[0]
+    merged = dict(chunks[0])
+    choice = dict(merged["choices"][0])
+    delta = dict(choice.get("delta") or {})
+    delta["content"] = "".join(chunk_content(chunk) for chunk in chunks)
+    choice["delta"] = delta
+    merged["choices"] = [choice]
+    return merged
+
+
+def coalesce_chunks(chunks: Iterable[Dict[str, Any]],
+                    window: float,
+                    max_bytes: int = 1024) -> Iterator[Dict[str, Any]]:
+    """
+    Merge streamed text deltas into one chunk per time window or byte threshold.
+
+    The upstream is read on a helper thread so a buffered window is flushed on
+    time even while the provider is between tokens. Chunks are passed through
+    unmerged until the first one with text has been sent, so time to first
+    token is unchanged.
+
+    Args:
+        chunks: OpenAI-style chat.completion.chunk dicts
+        window: Seconds a delta may wait for others to merge with (<= 0 disables coalescing)
+        max_bytes: Flush as soon as the buffered text reaches this many bytes
+
+    Yields:
+        Chunk dicts, merged where possible, in order
+    """
+    if window <= 0:
+        yield from chunks
+        return
+
+    items: "queue.Queue" = queue.Queue()
+    stopped = threading.Event()
+
+    def produce():
+        try:
+            for chunk in chunks:
+                if stopped.is_set():
+                    return
+                items.put(("chunk", chunk))
+            items.put(("end", None))
+        except BaseException as e:
+            items.put(("error", e))
+
+    threading.Thread(target=produce, name="sse-coalesce", daemon=True).start()
+
+    buffer: List[Dict[str, Any]] = []
+    buffered_bytes = 0
+    flush_at = 0.0
+    first_text_sent = False
+    try:
+        while True:
+            timeout = max(0.0, flush_at - time.monotonic()) if buffer else None
+            try:
+                kind, item = items.get(timeout=timeout)
+            except queue.Empty:
+                yield merge_chunks(buffer)
+                buffer, buffered_bytes = [], 0
+                continue
+            if kind != "chunk" or not first_text_sent or not is_mergeable(item):
+                if buffer:
+                    yield merge_chunks(buffer)
+                    buffer, buffered_bytes = [], 0
+                if kind == "end":
+                    return
+                if kind == "error":
+                    raise item
+                yield item
+                first_text_sent = first_text_sent or bool(chunk_content(item))
+                continue
+            if not buffer:
+                flush_at = time.monotonic() + window
+            buffer.append(item)
+            buffered_bytes += len(chunk_content(item).encode("utf-8"))
+            if buffered_bytes >= max_bytes:
+                yield merge_chunks(buffer)
+                buffer, buffered_bytes = [], 0
+    finally:
+        stopped.set()
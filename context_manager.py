@@ -0,0 +1,261 @@
+import math
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Rough characters-per-token ratio for English text across the supported models
+CHARS_PER_TOKEN = 4
+# Fixed per-message overhead (role, separators) added by chat formats
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_text_tokens(text: str) -> int:
+    """
+    Estimate the token count of a piece of text.
+
+    Args:
+        text: The text to estimate
+
+    Returns:
+        Approximate number of tokens
+    """
+    if not text:
+        return 0
+    return max(1, math.ceil(len(text) / CHARS_PER_TOKEN))
+
+
+def estimate_image_tokens(provider: str,
+                          detail: str = "auto",
+                          width: Optional[int] = None,
+                          height: Optional[int] = None) -> int:
+    """
+    Estimate the prompt tokens an image costs with a given provider.
+
+    Args:
+        provider: The LLM provider ('openai', 'gemini', 'anthropic')
+        detail: OpenAI-style detail hint ('low', 'high' or 'auto')
+        width: Image width in pixels, if known
+        height: Image height in pixels, if known
+
+    Returns:
+        Approximate number of tokens for the image
+    """
+    provider = (provider or "openai").lower()
+    # Assume a typical 1024x1024 photo when the dimensions are unknown
+    width = width or 1024
+    height = height or 1024
+
+    if provider == "gemini":
+        # Small images are a single 258-token tile; larger ones are cut into 768px tiles
+        if width <= 384 and height <= 384:
+            return 258
+        return 258 * math.ceil(width / 768) * math.ceil(height / 768)
+
+    if provider == "anthropic":
+        scale = min(1.0, 1568 / max(width, height))
+        return math.ceil((width * scale) * (height * scale) / 750)
+
+    # OpenAI: low detail is a flat cost; high detail is 170 per 512px tile plus a base of 85
+    if detail == "low":
+        return 85
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    return 85 + 170 * math.ceil(width / 512) * math.ceil(height / 512)
+
+
+def message_has_image(message: Dict[str, Any]) -> bool:
+    """Return True if a message carries an image part."""
+    content = message.get("content")
+    return isinstance(content, list) and any(
+        isinstance(part, dict) and part.get("type") == "image_url" for part in content
+    )
+
+
+def message_text(message: Dict[str, Any]) -> str:
+    """Return the concatenated text parts of a message."""
+    content = message.get("content")
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return " ".join(part.get("text", "") for part in content
+                        if isinstance(part, dict) and part.get("type") == "text")
+    return ""
+
+
+class ContextManager:
+    """
+    Keeps chat history within a token budget before it is sent upstream.
+    System messages, image-bearing messages and the most recent turns are always
+    kept; older turns are dropped oldest-first (tool calls together with their
+    results) and summarized in the leading system prompt.
+    """
+
+    def __init__(self,
+                 provider: str = "openai",
+                 budget: int = 8000,
+                 keep_recent: int = 6,
+                 summary_tokens: int = 200,
+                 summarizer: Optional[Callable[[List[Dict[str, Any]], int], str]] = None):
+        """
+        Initialize the context manager.
+
+        Args:
+            provider: The LLM provider, used to price images
+            budget: Maximum prompt tokens; 0 disables trimming (counts are still reported)
+            keep_recent: Number of most recent messages that are never trimmed
+            summary_tokens: Token allowance for the summary of trimmed turns; 0 drops them silently
+            summarizer: Optional function (dropped_messages, max_tokens) -> summary text
+        """
+        self.provider = provider
+        self.budget = budget
+        self.keep_recent = keep_recent
+        self.summary_tokens = summary_tokens
+        self.summarizer = summarizer or self.extractive_summary
+
+    def estimate_message_tokens(self, message: Dict[str, Any]) -> int:
+        """
+        Estimate the prompt tokens of a single message, including images.
+
+        Args:
+            message: An OpenAI-format chat message
+
+        Returns:
+            Approximate number of tokens
+        """
+        tokens = MESSAGE_OVERHEAD_TOKENS
+        content = message.get("content")
+        if isinstance(content, str):
+            return tokens + estimate_text_tokens(content)
+        if isinstance(content, list):
+            for part in content:
+                if not isinstance(part, dict):
+                    continue
+                if part.get("type") == "text":
+                    tokens += estimate_text_tokens(part.get("text", ""))
+                elif part.get("type") == "image_url":
+                    image_url = part.get("image_url")
+                    detail = image_url.get("detail", "auto") if isinstance(image_url, dict) else "auto"
+                    tokens += estimate_image_tokens(self.provider, detail)
+        return tokens
+
+    def count_tokens(self, messages: List[Dict[str, Any]]) -> int:
+        """Estimate the total prompt tokens of a message list."""
+        return sum(self.estimate_message_tokens(message) for message in messages)
+
+    def count_image_tokens(self, messages: List[Dict[str, Any]]) -> int:
+        """Estimate the prompt tokens spent on images in a message list."""
+        tokens = 0
+        for message in messages:
+            content = message.get("content")
+            if not isinstance(content, list):
+                continue
+            for part in content:
+                if isinstance(part, dict) and part.get("type") == "image_url":
+                    image_url = part.get("image_url")
+                    detail = image_url.get("detail", "auto") if isinstance(image_url, dict) else "auto"
+                    tokens += estimate_image_tokens(self.provider, detail)
+        return tokens
+
+    @staticmethod
+    def extractive_summary(dropped: List[Dict[str, Any]], max_tokens: int) -> str:
+        """
+        Build a cheap summary of trimmed turns from their leading text.
+
+        Args:
+            dropped: The trimmed messages, in order
+            max_tokens: Token allowance for the summary
+
+        Returns:
+            Summary text
+        """
+        budget_chars = max_tokens * CHARS_PER_TOKEN
+        per_message = max(40, budget_chars // max(1, len(dropped)))
+        lines = []
+        for message in dropped:
+            text = " ".join(message_text(message).split())
+            if not text:
+                continue
+            if len(text) > per_message:
+                text = text[:per_message - 3].rstrip() + "..."
+            lines.append(f"{message.get('role', 'user')}: {text}")
+        summary = "Summary of earlier conversation:\n" + "\n".join(lines)
+        return summary[:budget_chars]
+
+    def fit(self, messages: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """
+        Trim a message list to the token budget.
+
+        Args:
+            messages: OpenAI-format chat messages (not modified)
+
+        Returns:
+            Tuple of (messages to send, report with token counts and number of trimmed messages)
+        """
+        costs = [self.estimate_message_tokens(message) for message in messages]
+        total = sum(costs)
+        report = {"tokens_before": total, "tokens_after": total, "trimmed_messages": 0, "budget": self.budget}
+        if not self.budget or total <= self.budget:
+            return list(messages), report
+
+        recent_start = max(0, len(messages) - self.keep_recent)
+        protected = [
+            index >= recent_start or message.get("role") == "system" or message_has_image(message)
+            for index, message in enumerate(messages)
+        ]
+
+        # Reserve room for the summary so adding it can't push us back over budget
+        reserve = self.summary_tokens + MESSAGE_OVERHEAD_TOKENS if self.summary_tokens else 0
+        dropped = set()
+        for group in self.turn_groups(messages):
+            if total + (reserve if dropped else 0) <= self.budget:
+                break
+            # A tool call and its results are kept or dropped together
+            if any(protected[index] for index in group):
+                continue
+            dropped.update(group)
+            total -= sum(costs[index] for index in group)
+
+        if not dropped:
+            return list(messages), report
+
+        trimmed = [message for index, message in enumerate(messages) if index not in dropped]
+        if self.summary_tokens:
+            summary = self.summarizer([messages[index] for index in sorted(dropped)], self.summary_tokens)
+            trimmed = self.with_summary(trimmed, summary)
+
+        report["tokens_after"] = self.count_tokens(trimmed)
+        report["trimmed_messages"] = len(dropped)
+        return trimmed, report
+
+    @staticmethod
+    def turn_groups(messages: List[Dict[str, Any]]) -> List[List[int]]:
+        """
+        Group message indices into units that can only be trimmed as a whole:
+        an assistant message that calls tools together with the tool results
+        that follow it, and every other message on its own.
+        """
+        groups: List[List[int]] = []
+        for index, message in enumerate(messages):
+            if message.get("role") in ("tool", "function") and groups:
+                leader = messages[groups[-1][0]]
+                if leader.get("role") == "assistant" and (leader.get("tool_calls") or leader.get("function_call")):
+                    groups[-1].append(index)
+                    continue
+            groups.append([index])
+        return groups
+
+    @staticmethod
+    def with_summary(messages: List[Dict[str, Any]], summary: str) -> List[Dict[str, Any]]:
+        """
+        Add the summary of trimmed turns to the leading system prompt (or add
+        one), since not every provider accepts a system message mid-conversation.
+        """
+        if messages and messages[0].get("role") == "system":
+            system = dict(messages[0])
+            content = system.get("content")
+            if isinstance(content, list):
+                system["content"] = content + [{"type": "text", "text": summary}]
+            else:
+                system["content"] = f"{content}\n\n{summary}" if content else summary
+            return [system] + messages[1:]
+        return [{"role": "system", "content": summary}] + messages
@@ -0,0 +1,213 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import requests
+
+from image_utils import sniff_image_mime
+
+
+class FileHandle:
+    """A file uploaded to a provider's file storage, referenced by URI until it expires."""
+
+    def __init__(self, name: str, uri: str, mime_type: str, size: int, expires_at: float):
+        self.name = name
+        self.uri = uri
+        self.mime_type = mime_type
+        self.size = size
+        self.expires_at = expires_at
+
+    def usable(self, margin: float = 0.0) -> bool:
+        """Return True if the handle stays valid for at least another margin seconds."""
+        return time.time() + margin < self.expires_at
+
+
+def parse_expiration(value: Optional[str]) -> Optional[float]:
+    """Parse an RFC 3339 timestamp (e.g. 2025-01-01T00:00:00.123456789Z) to epoch seconds."""
+    if not value:
+        return None
+    # fromisoformat takes at most microseconds
+    value = re.sub(r"(\.\d{6})\d+", r"\1", value.replace("Z", "+00:00"))
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        return None
+
+
+class GeminiFilesClient:
+    """
+    Minimal client for the Gemini Files API (resumable upload protocol).
+
+    base_url can point at a local stub (see benchmarks/files_api_stub.py) to
+    exercise uploads, expiry and fallback without the real service.
+    """
+
+    DEFAULT_BASE_URL = "https://generativelanguage.googleapis.com"
+
+    def __init__(self, api_key: Optional[str], base_url: Optional[str] = None,
+                 timeout: float = 30.0, default_ttl: float = 48 * 3600):
+        """
+        Initialize the client.
+
+        Args:
+            api_key: Gemini API key
+            base_url: API origin (default: the public Gemini API)
+            timeout: Seconds per HTTP request
+            default_ttl: Lifetime assumed when the response carries no expirationTime
+        """
+        self.api_key = api_key
+        self.base_url = (base_url or self.DEFAULT_BASE_URL).rstrip("/")
+        self.timeout = timeout
+        self.default_ttl = default_ttl
+
+    def upload(self, data: bytes, mime_type: str, display_name: str) -> FileHandle:
+        """
+        Upload a file.
+
+        Raises:
+            requests.exceptions.RequestException: If the upload fails
+            ValueError: If the response doesn't describe the file
+        """
+        start = requests.post(
+            f"{self.base_url}/upload/v1beta/files",
+            params={"key": self.api_key},
+            headers={
+                "X-Goog-Upload-Protocol": "resumable",
+                "X-Goog-Upload-Command": "start",
+                "X-Goog-Upload-Header-Content-Length": str(len(data)),
+                "X-Goog-Upload-Header-Content-Type": mime_type,
+            },
+            json={"file": {"display_name": display_name[:128]}},
+            timeout=self.timeout
+        )
+        start.raise_for_status()
+        upload_url = start.headers.get("X-Goog-Upload-URL")
+        if not upload_url:
+            raise ValueError("Files API did not return an upload URL")
+        response = requests.post(
+            upload_url,
+            headers={
+                "X-Goog-Upload-Offset": "0",
+                "X-Goog-Upload-Command": "upload, finalize",
+                "Content-Length": str(len(data)),
+            },
+            data=data,
+            timeout=self.timeout
+        )
+        response.raise_for_status()
+        info = response.json().get("file") or {}
+        if not info.get("uri"):
+            raise ValueError("Files API response has no file URI")
+        expires_at = parse_expiration(info.get("expirationTime")) or time.time() + self.default_ttl
+        return FileHandle(info.get("name", ""), info["uri"], info.get("mimeType", mime_type), len(data), expires_at)
+
+
+class FileHandleCache:
+    """
+    Maps images (by source URL) to provider file handles so each image is
+    uploaded once and referenced by handle on later turns. Handles are
+    re-uploaded shortly before they expire, and a failed upload returns None
+    (the caller sends the image inline) and isn't retried for a while.
+    """
+
+    def __init__(self,
+                 client: Any,
+                 refresh_margin: float = 600.0,
+                 max_entries: int = 1024,
+                 retry_after: float = 60.0):
+        """
+        Initialize the cache.
+
+        Args:
+            client: Uploader with upload(data, mime_type, display_name) -> FileHandle
+            refresh_margin: Seconds before expiry at which a handle is no longer handed out
+            max_entries: Handles remembered (least recently used are forgotten)
+            retry_after: Seconds to send an image inline after its upload failed
+        """
+        self.client = client
+        self.refresh_margin = refresh_margin
+        self.max_entries = max_entries
+        self.retry_after = retry_after
+        self._handles: "OrderedDict[str, FileHandle]" = OrderedDict()
+        self._failed: Dict[str, float] = {}
+        self._key_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "uploads": 0, "upload_bytes": 0, "expired": 0, "failures": 0,
+                          "invalidated": 0}
+
+    def get_or_upload(self, key: str, load: Callable[[], Tuple[bytes, Optional[str]]]) -> Optional[FileHandle]:
+        """
+        Return a usable handle for an image, uploading it if needed.
+
+        Args:
+            key: Stable identifier of the image (e.g. its URL)
+            load: Function returning (image bytes, MIME type or None)
+
+        Returns:
+            The handle, or None if the image should be sent inline
+        """
+        handle = self._cached(key)
+        if handle:
+            return handle
+        with self._lock:
+            if self._failed.get(key, 0) > time.monotonic():
+                return None
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        # One upload per image even if several turns need it at once
+        with key_lock:
+            handle = self._cached(key, count_hit=False)
+            if handle:
+                return handle
+            with self._lock:
+                if self._failed.get(key, 0) > time.monotonic():
+                    return None
+            try:
+                data, mime_type = load()
+                handle = self.client.upload(data, mime_type or sniff_image_mime(data), key.rsplit("/", 1)[-1])
+            except Exception as e:
+                print(f"File upload for {key} failed, sending inline: {str(e)}")
+                with self._lock:
+                    now = time.monotonic()
+                    self._failed = {failed: until for failed, until in self._failed.items() if until > now}
+                    self._failed[key] = now + self.retry_after
+                    self._counters["failures"] += 1
+                    self._key_locks.pop(key, None)
+                return None
+            with self._lock:
+                self._handles[key] = handle
+                self._handles.move_to_end(key)
+                while len(self._handles) > self.max_entries:
+                    self._handles.popitem(last=False)
+                self._failed.pop(key, None)
+                self._key_locks.pop(key, None)
+                self._counters["uploads"] += 1
+                self._counters["upload_bytes"] += handle.size
+            return handle
+
+    def invalidate(self, key: str):
+        """Forget a handle the provider rejected; the next turn uploads the image again."""
+        with self._lock:
+            if self._handles.pop(key, None) is not None:
+                self._counters["invalidated"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the number of live handles and upload/hit counters."""
+        with self._lock:
+            return {"handles": len(self._handles), **self._counters}
+
+    def _cached(self, key: str, count_hit: bool = True) -> Optional[FileHandle]:
+        with self._lock:
+            handle = self._handles.get(key)
+            if handle is None:
+                return None
+            if not handle.usable(self.refresh_margin):
+                del self._handles[key]
+                self._counters["expired"] += 1
+                return None
+            self._handles.move_to_end(key)
+            if count_hit:
+                self._counters["hits"] += 1
+            return handle
@@ -0,0 +1,127 @@
+import threading
+import time
+from collections import deque
+from typing import List, Optional, Tuple
+
+from context_manager import estimate_image_tokens
+from image_utils import hamming_distance
+
+
+class Frame:
+    """A stored camera frame, its perceptual hash and its dimensions."""
+
+    __slots__ = ("filename", "frame_hash", "timestamp", "size")
+
+    def __init__(self, filename: str, frame_hash: Optional[int], timestamp: float,
+                 size: Optional[Tuple[int, int]] = None):
+        self.filename = filename
+        self.frame_hash = frame_hash
+        self.timestamp = timestamp
+        self.size = size
+
+
+class FrameBuffer:
+    """
+    Ring buffer of the last K keyframes of a session's camera feed.
+    A new frame is only kept if it differs from the most recent keyframe by more
+    than duplicate_distance bits of its perceptual hash, so a static scene
+    doesn't push motion context out of the buffer.
+    """
+
+    def __init__(self, max_frames: int = 4, duplicate_distance: int = 6):
+        """
+        Initialize the buffer.
+
+        Args:
+            max_frames: Number of keyframes to retain
+            duplicate_distance: Maximum hash distance at which a frame counts as a near-duplicate
+        """
+        self.duplicate_distance = duplicate_distance
+        self._frames = deque(maxlen=max(1, max_frames))
+        self._lock = threading.Lock()
+
+    def add(self, filename: str, frame_hash: Optional[int],
+            size: Optional[Tuple[int, int]] = None) -> Tuple[bool, Optional[str]]:
+        """
+        Offer a frame to the buffer.
+
+        Args:
+            filename: Stored filename of the frame
+            frame_hash: Perceptual hash of the frame (None if it couldn't be computed)
+            size: (width, height) of the frame, if known
+
+        Returns:
+            Tuple of (whether the frame was kept, filename evicted from the buffer if any)
+        """
+        with self._lock:
+            if self._frames and frame_hash is not None and self._frames[-1].frame_hash is not None:
+                if hamming_distance(frame_hash, self._frames[-1].frame_hash) <= self.duplicate_distance:
+                    return False, None
+            evicted = None
+            if len(self._frames) == self._frames.maxlen:
+                evicted = self._frames[0].filename
+            self._frames.append(Frame(filename, frame_hash, time.time(), size))
+            return True, evicted
+
+    def is_duplicate(self, frame_hash: Optional[int]) -> bool:
+        """Return True if a hash is a near-duplicate of the latest keyframe."""
+        with self._lock:
+            if not self._frames or frame_hash is None or self._frames[-1].frame_hash is None:
+                return False
+            return hamming_distance(frame_hash, self._frames[-1].frame_hash) <= self.duplicate_distance
+
+    def get(self, filename: str) -> Optional[Frame]:
+        """Return the stored frame with the given filename, if it is still buffered."""
+        with self._lock:
+            for frame in self._frames:
+                if frame.filename == filename:
+                    return frame
+            return None
+
+    def latest(self) -> Optional[str]:
+        """Return the filename of the most recent keyframe."""
+        with self._lock:
+            return self._frames[-1].filename if self._frames else None
+
+    def filenames(self) -> List[str]:
+        """Return all keyframe filenames, oldest first."""
+        with self._lock:
+            return [frame.filename for frame in self._frames]
+
+    def __len__(self):
+        return len(self._frames)
+
+
+def select_frames(filenames: List[str],
+                  max_frames: int = 1,
+                  token_budget: int = 0,
+                  provider: str = "openai") -> List[Tuple[str, str]]:
+    """
+    Choose which frames to inject into a turn and at what detail.
+
+    The newest frame is always sent at 'auto' detail. Earlier keyframes are added
+    newest-first at 'low' detail while they fit in the vision token budget.
+
+    Args:
+        filenames: Keyframe filenames, oldest first
+        max_frames: Maximum number of frames to inject
+        token_budget: Vision token budget for the frames; 0 means no limit
+        provider: The LLM provider, used to price images
+
+    Returns:
+        List of (filename, detail) pairs, oldest first
+    """
+    if not filenames:
+        return []
+    selected = [(filenames[-1], "auto")]
+    spent = estimate_image_tokens(provider, "auto")
+    low_cost = estimate_image_tokens(provider, "low")
+    for filename in reversed(filenames[:-1]):
+        if len(selected) >= max_frames:
+            break
+        if token_budget and spent + low_cost > token_budget:
+            break
+        selected.append((filename, "low"))
+        spent += low_cost
+    selected.reverse()
+    return selected
@@ -1,4 +1,4 @@
-import React, { useEffect, useState } from 'react';
+import React, { useEffect, useRef, useState } from 'react';
 import './MobileContainer.css';
 import Captions from './components/Captions';
 import VoiceWaveform from './components/VoiceWaveform';
@@ -6,6 +6,8 @@ import NeumorphicButton from './components/NeumorphicButton';
 import ProjectionScreen from './components/ProjectionScreen';
 import AvatarSelection from './components/AvatarSelection';
 
+const CAMERA_BACKEND_URL = 'https://1point.artsensei.ai/';
+
 function MobileContainer({ 
   children,
   uploadedImageUrl,
@@ -32,10 +34,39 @@ function MobileContainer({
   const [isAutoCapturing, setIsAutoCapturing] = useState(false);
   const [lastCaptureTimestamp, setLastCaptureTimestamp] = useState(0);
   
+  // Persistent WebSocket for streaming camera frames (falls back to POST /upload_image)
+  const cameraSocketRef = useRef(null);
+  
   useEffect(() => {
     setWaveformKey(prev => prev + 1);
   }, [status]);
 
+  // Open the camera frame channel while the camera is on and the bot is connected
+  useEffect(() => {
+    if (!cameraActive || status !== 'connected') return undefined;
+    
+    const wsBase = CAMERA_BACKEND_URL.replace(/^http/, 'ws').replace(/\/$/, '');
+    const query = conversation?.sessionId ? `?session_id=${encodeURIComponent(conversation.sessionId)}` : '';
+    const socket = new WebSocket(`${wsBase}/ws/camera${query}`);
+    socket.onmessage = (event) => {
+      try {
+        const ack = JSON.parse(event.data);
+        if (ack.status === 'rejected') {
+          console.warn('Camera frame rejected:', ack.reason);
+        }
+      } catch (error) {
+        console.error('Invalid camera channel message:', error);
+      }
+    };
+    socket.onerror = () => console.warn('Camera channel error; falling back to HTTP uploads');
+    cameraSocketRef.current = socket;
+    
+    return () => {
+      cameraSocketRef.current = null;
+      socket.close();
+    };
+  }, [cameraActive, status, conversation?.sessionId]);
+
   // Direct click handler to upload image
   const onUploadClick = () => {
     console.log("Upload button clicked directly!!!");
@@ -110,13 +141,19 @@ function MobileContainer({
       return;
     }
     
+    // Prefer the open camera channel: one binary message per frame, no per-request overhead
+    const socket = cameraSocketRef.current;
+    if (socket && socket.readyState === WebSocket.OPEN) {
+      socket.send(imageFile);
+      return;
+    }
+    
     try {
       // Call the same upload endpoint but don't update UI state for selected image
       console.log(`Sending camera image to backend`);
       
       // Using the same endpoint as regular image uploads
-      const backendUrl = 'https://1point.artsensei.ai/';
-      const response = await fetch(`${backendUrl}/upload_image`, {
+      const response = await fetch(`${CAMERA_BACKEND_URL}/upload_image`, {
         method: 'POST',
         body: formData
       });
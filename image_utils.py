@@ -0,0 +1,211 @@
+import base64
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import requests
+
+# Leading magic bytes of the image formats the providers accept
+_SIGNATURES = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"BM", "image/bmp"),
+)
+
+_HEIF_BRANDS = {b"heic": "image/heic", b"heix": "image/heic", b"mif1": "image/heif", b"heif": "image/heif"}
+
+
+def sniff_image_mime(data: bytes, default: str = "image/jpeg") -> str:
+    """
+    Detect an image's MIME type from its header bytes without decoding it.
+
+    Args:
+        data: The image bytes (only the first 16 are inspected)
+        default: MIME type to return if the format is not recognized
+
+    Returns:
+        The detected MIME type
+    """
+    header = data[:16]
+    for signature, mime_type in _SIGNATURES:
+        if header.startswith(signature):
+            return mime_type
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "image/webp"
+    if header[4:8] == b"ftyp":
+        return _HEIF_BRANDS.get(header[8:12], default)
+    return default
+
+
+def to_data_uri(data: bytes, mime_type: Optional[str] = None) -> str:
+    """Encode image bytes as a base64 data URI, sniffing the MIME type if not given."""
+    mime_type = mime_type or sniff_image_mime(data)
+    return f"data:{mime_type};base64,{base64.b64encode(data).decode('utf-8')}"
+
+
+def fetch_image(url: str, timeout: float = 10.0) -> Tuple[bytes, Optional[str]]:
+    """
+    Download an image.
+
+    Args:
+        url: The http(s) URL of the image
+        timeout: Connect and read timeout in seconds
+
+    Returns:
+        Tuple of (image bytes, Content-Type header if it names an image type)
+
+    Raises:
+        requests.exceptions.RequestException: If the download fails or times out
+    """
+    response = requests.get(url, timeout=timeout)
+    response.raise_for_status()
+    content_type = response.headers.get("Content-Type", "").split(";")[0].strip().lower()
+    return response.content, content_type if content_type.startswith("image/") else None
+
+
+def content_key(data: bytes) -> str:
+    """Return a cache key for raw image bytes."""
+    return "sha1:" + hashlib.sha1(data).hexdigest()
+
+
+class ImageCache:
+    """
+    Thread-safe LRU cache of prepared images (e.g. data URIs), bounded by total
+    size and optionally expiring entries after a TTL.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, ttl: Optional[float] = None):
+        """
+        Initialize the cache.
+
+        Args:
+            max_bytes: Total size budget of cached values
+            ttl: Seconds after which an entry is considered stale (None keeps entries until evicted)
+        """
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached value for a key, or None on a miss or expired entry."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, stored_at = entry
+            if self.ttl is not None and time.monotonic() - stored_at > self.ttl:
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: str, value: str):
+        """Store a value, evicting least-recently-used entries beyond the size budget."""
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, time.monotonic())
+            self._total_bytes += len(value)
+            while self._total_bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def stats(self) -> dict:
+        """Return entry count and byte usage."""
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._total_bytes, "max_bytes": self.max_bytes}
+
+    def _remove(self, key: str):
+        """Drop an entry. Caller holds the lock."""
+        value, _ = self._entries.pop(key)
+        self._total_bytes -= len(value)
+
+
+def dhash(data: bytes, hash_size: int = 8) -> Optional[int]:
+    """
+    Compute a difference hash (dHash) of an image for near-duplicate detection.
+
+    Args:
+        data: The encoded image bytes
+        hash_size: Hash width; the result has hash_size * hash_size bits
+
+    Returns:
+        The hash as an integer, or None if the image can't be decoded
+    """
+    try:
+        # Pillow is imported lazily so the request path doesn't pay for it at startup
+        from io import BytesIO
+        from PIL import Image
+        with Image.open(BytesIO(data)) as img:
+            # draft() lets JPEG decoding skip straight to a reduced size
+            img.draft("L", (hash_size * 8, hash_size * 8))
+            pixels = list(img.convert("L").resize((hash_size + 1, hash_size)).getdata())
+    except Exception:
+        return None
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """Return the number of differing bits between two hashes."""
+    return bin(a ^ b).count("1")
+
+
+def image_size(data: bytes) -> Optional[Tuple[int, int]]:
+    """
+    Read an image's dimensions from its header without decoding the pixels.
+
+    Args:
+        data: The encoded image bytes
+
+    Returns:
+        Tuple of (width, height), or None if the format isn't recognized
+    """
+    try:
+        from io import BytesIO
+        from PIL import Image
+        # Image.open only parses the header; pixel data is decoded lazily on load()
+        with Image.open(BytesIO(data)) as img:
+            return img.size
+    except Exception:
+        return None
+
+
+def resize_image(data: bytes, size: Tuple[int, int], quality: int = 85) -> Optional[bytes]:
+    """
+    Downscale an image to fit within a size and re-encode it as JPEG.
+
+    Args:
+        data: The encoded image bytes
+        size: (max_width, max_height) to fit within, keeping the aspect ratio
+        quality: JPEG quality of the result
+
+    Returns:
+        The resized JPEG, or None if the image already fits or can't be decoded
+    """
+    try:
+        from io import BytesIO
+        from PIL import Image
+        with Image.open(BytesIO(data)) as img:
+            if img.width <= size[0] and img.height <= size[1]:
+                return None
+            # draft() lets JPEG decoding skip straight to a reduced size
+            img.draft("RGB", size)
+            resized = img.convert("RGB")
+            resized.thumbnail(size, Image.LANCZOS)
+            output = BytesIO()
+            resized.save(output, format="JPEG", quality=quality)
+            return output.getvalue()
+    except Exception:
+        return None
@@ -0,0 +1,422 @@
+import hashlib
+import hmac
+import ipaddress
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import urlsplit
+
+import requests
+
+# Job lifecycle states
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+FINISHED_STATES = (JOB_SUCCEEDED, JOB_FAILED)
+
+
+def webhook_url_error(url: str, allowed_hosts: Optional[List[str]] = None) -> Optional[str]:
+    """
+    Check that a webhook URL may be called from this server.
+
+    With an allowlist, the host must be listed (".example.com" also matches
+    subdomains). Without one, every address the host resolves to must be
+    public, so callers can't make the server POST to loopback, private,
+    link-local (e.g. cloud metadata) or other internal addresses.
+
+    Args:
+        url: The webhook URL
+        allowed_hosts: Hostnames allowed as webhook targets (None: any public host)
+
+    Returns:
+        Why the URL is refused, or None if it is allowed
+    """
+    try:
+        parts = urlsplit(url)
+        host = parts.hostname
+        port = parts.port
+    except ValueError:
+        return "webhook_url is not a valid URL"
+    if parts.scheme not in ("http", "https") or not host:
+        return "webhook_url must be an http(s) URL"
+    host = host.lower().rstrip(".")
+    if allowed_hosts:
+        if any(host == allowed or (allowed.startswith(".") and host.endswith(allowed)) for allowed in allowed_hosts):
+            return None
+        return f"webhook host '{host}' is not in WEBHOOK_ALLOWED_HOSTS"
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, port or 443, proto=socket.IPPROTO_TCP)}
+    except (socket.gaierror, UnicodeError):
+        return f"webhook host '{host}' does not resolve"
+    for address in addresses:
+        ip = ipaddress.ip_address(address.split("%", 1)[0])
+        if not ip.is_global or ip.is_multicast:
+            return f"webhook host '{host}' resolves to a non-public address"
+    return None
+
+
+class Job:
+    """One unit of background work, its payload and its outcome."""
+
+    def __init__(self,
+                 job_id: str,
+                 payload: Dict[str, Any],
+                 webhook_url: Optional[str] = None,
+                 status: str = JOB_QUEUED,
+                 result: Optional[Dict[str, Any]] = None,
+                 error: Optional[str] = None,
+                 created_at: Optional[float] = None,
+                 started_at: Optional[float] = None,
+                 finished_at: Optional[float] = None):
+        self.id = job_id
+        self.payload = payload
+        self.webhook_url = webhook_url
+        self.status = status
+        self.result = result
+        self.error = error
+        self.created_at = created_at if created_at is not None else time.time()
+        self.started_at = started_at
+        self.finished_at = finished_at
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Public view of the job (the payload is not echoed back)."""
+        data = {
+            "id": self.id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+        if self.status == JOB_SUCCEEDED:
+            data["result"] = self.result
+        elif self.status == JOB_FAILED:
+            data["error"] = self.error
+        return data
+
+
+class MemoryJobStore:
+    """Keeps jobs in a dict; they are lost when the process exits."""
+
+    def __init__(self):
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def save(self, job: Job):
+        with self._lock:
+            self._jobs[job.id] = job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def pending(self, now: float) -> List[Job]:
+        return []
+
+    def claim(self, job_id: str, owner: str, lease_until: float) -> bool:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status != JOB_QUEUED:
+                return False
+            job.status = JOB_RUNNING
+            job.started_at = time.time()
+            return True
+
+    def renew(self, owner: str, lease_until: float) -> int:
+        return 0
+
+    def prune(self, older_than: float) -> int:
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job.status in FINISHED_STATES and (job.finished_at or 0) < older_than]
+            for job_id in expired:
+                del self._jobs[job_id]
+            return len(expired)
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            counts: Dict[str, int] = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+            return counts
+
+
+class SQLiteJobStore:
+    """
+    Persists jobs in a SQLite database so queued work survives a restart.
+    A running job is leased to the queue that claimed it; the queue renews
+    the lease while it is alive, so only jobs whose lease ran out (their
+    process stopped) are handed back by pending() and run again. Several
+    processes may share a database.
+    """
+
+    COLUMNS = ("id", "status", "payload", "webhook_url", "result", "error",
+               "created_at", "started_at", "finished_at", "owner", "lease_until")
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY, status TEXT NOT NULL, payload TEXT NOT NULL, webhook_url TEXT,"
+                " result TEXT, error TEXT, created_at REAL NOT NULL, started_at REAL, finished_at REAL,"
+                " owner TEXT, lease_until REAL)"
+            )
+            # Databases created before leases were added
+            existing = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+            for column, kind in (("owner", "TEXT"), ("lease_until", "REAL")):
+                if column not in existing:
+                    self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, finished_at)")
+
+    def save(self, job: Job):
+        """Store a queued or finished job; saving releases any lease on it."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO jobs (" + ", ".join(self.COLUMNS) + ") VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, NULL, NULL)",
+                (job.id, job.status, json.dumps(job.payload), job.webhook_url,
+                 json.dumps(job.result) if job.result is not None else None, job.error,
+                 job.created_at, job.started_at, job.finished_at)
+            )
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            row = self._conn.execute(self._select + " WHERE id = ?", (job_id,)).fetchone()
+        return self._from_row(row) if row else None
+
+    def pending(self, now: float) -> List[Job]:
+        """Return queued jobs and running jobs whose lease has expired, oldest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                self._select + " WHERE status = ? OR (status = ? AND (lease_until IS NULL OR lease_until < ?))"
+                " ORDER BY created_at", (JOB_QUEUED, JOB_RUNNING, now)
+            ).fetchall()
+        return [self._from_row(row) for row in rows]
+
+    def claim(self, job_id: str, owner: str, lease_until: float) -> bool:
+        """Lease a job to an owner unless another owner holds a live lease on it or it has finished."""
+        now = time.time()
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, started_at = ?, owner = ?, lease_until = ? WHERE id = ? AND"
+                " (status = ? OR (status = ? AND (lease_until IS NULL OR lease_until < ?)))",
+                (JOB_RUNNING, now, owner, lease_until, job_id, JOB_QUEUED, JOB_RUNNING, now)
+            )
+            return cursor.rowcount == 1
+
+    def renew(self, owner: str, lease_until: float) -> int:
+        """Extend the leases an owner holds on running jobs; returns how many were renewed."""
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE owner = ? AND status = ?", (lease_until, owner, JOB_RUNNING)
+            )
+            return cursor.rowcount
+
+    def prune(self, older_than: float) -> int:
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?", (*FINISHED_STATES, older_than)
+            )
+            return cursor.rowcount
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return dict(rows)
+
+    @property
+    def _select(self) -> str:
+        return "SELECT " + ", ".join(self.COLUMNS[:9]) + " FROM jobs"
+
+    @staticmethod
+    def _from_row(row) -> Job:
+        job_id, status, payload, webhook_url, result, error, created_at, started_at, finished_at = row
+        return Job(job_id, json.loads(payload), webhook_url, status,
+                   json.loads(result) if result is not None else None, error,
+                   created_at, started_at, finished_at)
+
+
+class JobQueue:
+    """
+    Runs jobs on a bounded in-process worker pool, recording their state in a
+    store and optionally POSTing the outcome to a webhook.
+
+    Jobs left in a persistent store by a stopped process are picked up only
+    after start(), which the serving process calls once.
+    """
+
+    def __init__(self,
+                 handler: Callable[[Dict[str, Any]], Dict[str, Any]],
+                 store=None,
+                 workers: int = 2,
+                 retention: float = 3600.0,
+                 webhook_secret: Optional[str] = None,
+                 webhook_timeout: float = 10.0,
+                 webhook_retries: int = 3,
+                 webhook_allowed_hosts: Optional[List[str]] = None,
+                 lease: float = 60.0):
+        """
+        Initialize the queue. Pending jobs in the store are not touched until start().
+
+        Args:
+            handler: Function turning a job payload into a JSON-serializable result
+            store: MemoryJobStore or SQLiteJobStore (default: in memory)
+            workers: Jobs run concurrently
+            retention: Seconds finished jobs stay available for polling
+            webhook_secret: If set, webhooks carry an X-Signature-256 HMAC of the body
+            webhook_timeout: Seconds per webhook delivery attempt
+            webhook_retries: Delivery attempts before giving up
+            webhook_allowed_hosts: Hostnames webhooks may target (None: any host resolving to public addresses)
+            lease: Seconds a running job stays claimed without a renewal before another queue may take it over
+        """
+        self.handler = handler
+        self.store = store or MemoryJobStore()
+        self.retention = retention
+        self.webhook_secret = webhook_secret
+        self.webhook_timeout = webhook_timeout
+        self.webhook_retries = webhook_retries
+        self.webhook_allowed_hosts = webhook_allowed_hosts
+        self.lease = lease
+        # Running jobs are leased to this instance; a process that stops stops renewing them
+        self.instance_id = uuid.uuid4().hex
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._counters = {"submitted": 0, "succeeded": 0, "failed": 0, "webhooks_failed": 0, "resumed": 0}
+        self._lock = threading.Lock()
+        # IDs of jobs handed to this instance's executor and not finished yet
+        self._active = set()
+        self._resuming = False
+        self._leases: Optional[threading.Thread] = None
+
+    def start(self):
+        """
+        Start resuming jobs from the store that are queued or were abandoned by a
+        stopped process. Safe to call more than once.
+        """
+        with self._lock:
+            self._resuming = True
+        self._ensure_leases()
+
+    def _ensure_leases(self):
+        # Leases are renewed (and, once started, abandoned jobs resumed) on a background thread
+        with self._lock:
+            if self._leases is not None:
+                return
+            self._leases = threading.Thread(target=self._maintain_leases, name="job-leases", daemon=True)
+        self._leases.start()
+
+    def submit(self, payload: Dict[str, Any], webhook_url: Optional[str] = None) -> Job:
+        """
+        Enqueue a job.
+
+        Args:
+            payload: JSON-serializable input for the handler
+            webhook_url: Optional URL to POST the finished job to
+
+        Returns:
+            The queued Job
+        """
+        self.store.prune(time.time() - self.retention)
+        job = Job(uuid.uuid4().hex, payload, webhook_url)
+        self.store.save(job)
+        with self._lock:
+            self._counters["submitted"] += 1
+            self._active.add(job.id)
+        self._ensure_leases()
+        self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Return a job by ID, or None if it doesn't exist or has expired."""
+        return self.store.get(job_id)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return job counts by state and lifetime counters."""
+        with self._lock:
+            counters = dict(self._counters)
+        return {"jobs": self.store.counts(), **counters}
+
+    def _maintain_leases(self):
+        while True:
+            now = time.time()
+            try:
+                self.store.renew(self.instance_id, now + self.lease)
+                pending = self.store.pending(now) if self._resuming else []
+            except sqlite3.Error as e:
+                print(f"Job lease renewal failed: {str(e)}")
+                pending = []
+            for job in pending:
+                with self._lock:
+                    if job.id in self._active:
+                        continue
+                    self._active.add(job.id)
+                    self._counters["resumed"] += 1
+                self._executor.submit(self._run, job)
+            time.sleep(self.lease / 3)
+
+    def _run(self, job: Job):
+        try:
+            self._run_claimed(job)
+        finally:
+            with self._lock:
+                self._active.discard(job.id)
+
+    def _run_claimed(self, job: Job):
+        # Claiming is atomic and a live queue keeps renewing its lease, so a job
+        # shared through a persistent store is not taken over while it runs
+        if not self.store.claim(job.id, self.instance_id, time.time() + self.lease):
+            return
+        job.status = JOB_RUNNING
+        job.started_at = time.time()
+        try:
+            job.result = self.handler(job.payload)
+            job.status = JOB_SUCCEEDED
+        except Exception as e:
+            job.error = str(e)
+            job.status = JOB_FAILED
+            print(f"Job {job.id} failed: {str(e)}")
+        job.finished_at = time.time()
+        # The payload may carry large inputs (e.g. image bytes); they aren't needed once the job is done
+        job.payload = {}
+        self.store.save(job)
+        with self._lock:
+            self._counters[job.status] += 1
+        if job.webhook_url:
+            self._deliver_webhook(job)
+
+    def _deliver_webhook(self, job: Job):
+        # Checked again at delivery: DNS may have changed, and stored jobs may predate the rules
+        error = webhook_url_error(job.webhook_url, self.webhook_allowed_hosts)
+        if error:
+            print(f"Webhook for job {job.id} not delivered: {error}")
+            with self._lock:
+                self._counters["webhooks_failed"] += 1
+            return
+        body = json.dumps(job.to_dict()).encode("utf-8")
+        headers = {"Content-Type": "application/json"}
+        if self.webhook_secret:
+            signature = hmac.new(self.webhook_secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+            headers["X-Signature-256"] = f"sha256={signature}"
+        for attempt in range(self.webhook_retries):
+            try:
+                # Redirects aren't followed; they could point at an address the check above refuses
+                response = requests.post(job.webhook_url, data=body, headers=headers, timeout=self.webhook_timeout,
+                                         allow_redirects=False)
+                if response.status_code < 500:
+                    return
+            except requests.exceptions.RequestException as e:
+                print(f"Webhook delivery for job {job.id} failed (attempt {attempt + 1}): {str(e)}")
+            if attempt + 1 < self.webhook_retries:
+                time.sleep(2 ** attempt)
+        with self._lock:
+            self._counters["webhooks_failed"] += 1
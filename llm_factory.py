@@ -1,25 +1,68 @@
-from typing import Optional
+import importlib
+from typing import Dict, Optional, Type
 from llm_service import LLMService
-from service_openapi import OpenAIService
-from service_gemini import GeminiService
+
+# Registry of provider name -> "module:ClassName". Provider modules (and their
+# heavy dependencies such as openai and Pillow) are only imported the first time
+# the provider is requested, keeping worker boot fast.
+PROVIDER_REGISTRY: Dict[str, str] = {
+    "openai": "service_openapi:OpenAIService",
+    "gemini": "service_gemini:GeminiService",
+}
+
+_provider_classes: Dict[str, Type[LLMService]] = {}
+
+def register_provider(provider: str, target: str) -> None:
+    """
+    Register an LLM provider for lazy loading.
+
+    Args:
+        provider: Provider name as used in LLM_PROVIDER (case-insensitive)
+        target: Import path of the service class in "module:ClassName" form
+    """
+    provider = provider.lower()
+    PROVIDER_REGISTRY[provider] = target
+    _provider_classes.pop(provider, None)
+
+def get_provider_class(provider: str) -> Type[LLMService]:
+    """
+    Resolve the service class for a provider, importing its module on first use.
+
+    Args:
+        provider: The LLM provider name
+
+    Returns:
+        The LLMService implementation registered for the provider
+
+    Raises:
+        ValueError: If the provider is not supported
+    """
+    provider = provider.lower()
+    service_class = _provider_classes.get(provider)
+    if service_class is not None:
+        return service_class
+
+    target = PROVIDER_REGISTRY.get(provider)
+    if target is None:
+        supported = ", ".join(PROVIDER_REGISTRY)
+        raise ValueError(f"Unsupported LLM provider: {provider}. Supported providers are: {supported}")
+
+    module_name, class_name = target.split(":")
+    service_class = getattr(importlib.import_module(module_name), class_name)
+    _provider_classes[provider] = service_class
+    return service_class
 
 def create_llm_service(provider: str = "openai") -> LLMService:
     """
     Factory function to create an LLM service based on the specified provider.
-    
+
     Args:
         provider: The LLM provider to use ('openai' or 'gemini')
-        api_key: Optional API key for the provider
-        
+
     Returns:
         An instance of the appropriate LLMService implementation
-        
+
     Raises:
         ValueError: If the provider is not supported
     """
-    if provider.lower() == "openai":
-        return OpenAIService()
-    elif provider.lower() == "gemini":
-        return GeminiService()
-    else:
-        raise ValueError(f"Unsupported LLM provider: {provider}. Supported providers are: openai, gemini")
+    return get_provider_class(provider)()
@@ -13,7 +13,8 @@ class LLMService(ABC):
                         model: Optional[str] = None,
                         temperature: Optional[float] = None,
                         max_tokens: Optional[int] = None,
-                        stream: bool = False) -> Union[Dict[str, Any], Any]:
+                        stream: bool = False,
+                        deadline: Optional[float] = None) -> Union[Dict[str, Any], Any]:
         """
         Generate a chat completion response.
         
@@ -23,6 +24,8 @@ class LLMService(ABC):
             temperature: Optional temperature parameter for response randomness
             max_tokens: Optional maximum number of tokens to generate
             stream: Whether to stream the response
+            deadline: Optional absolute time.monotonic() bounding the call; rate-limit pacing,
+                retries, image preparation and each attempt's timeout never run past it
             
         Returns:
             Either a completion response object or a stream
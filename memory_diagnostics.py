@@ -0,0 +1,259 @@
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import types
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# Objects whose referents are not part of a store: code, modules and running threads
+NOT_FOLLOWED = (type, types.ModuleType, types.FunctionType, types.MethodType,
+                types.BuiltinFunctionType, types.CodeType, types.FrameType, threading.Thread)
+
+# Frames of the tracer itself are left out of snapshots
+TRACE_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+def deep_size(obj: Any, max_objects: int = 200000) -> int:
+    """
+    Approximate the bytes held by an object and everything it references
+    through containers, instance attributes and slots.
+
+    Shared objects are counted once. Functions, classes, modules and threads
+    are counted but not followed, so a store holding a callback doesn't
+    account for the whole application.
+
+    Args:
+        obj: The object to measure
+        max_objects: Stop after visiting this many objects (the result is then a lower bound)
+    """
+    seen = set()
+    stack = [obj]
+    total = 0
+    while stack and len(seen) < max_objects:
+        current = stack.pop()
+        if id(current) in seen:
+            continue
+        seen.add(id(current))
+        total += sys.getsizeof(current, 0)
+        if isinstance(current, NOT_FOLLOWED):
+            continue
+        try:
+            if isinstance(current, dict):
+                stack.extend(list(current.items()))
+            elif isinstance(current, (list, tuple, set, frozenset, deque)):
+                stack.extend(list(current))
+            else:
+                attributes = getattr(current, "__dict__", None)
+                if isinstance(attributes, dict):
+                    stack.append(attributes)
+                for cls in type(current).__mro__:
+                    slots = cls.__dict__.get("__slots__", ())
+                    for slot in (slots,) if isinstance(slots, str) else slots:
+                        if hasattr(current, slot):
+                            stack.append(getattr(current, slot))
+        except RuntimeError:
+            # A container changed size while it was copied; its entries are skipped this time
+            continue
+    return total
+
+
+def store_usage(store: Any, stats: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Return the entry count (from its length or its stats) and deep size of an in-memory store."""
+    entries = len(store) if hasattr(store, "__len__") else (stats or {}).get("entries")
+    usage = {"entries": entries, "bytes": deep_size(store)}
+    if stats is not None:
+        usage["stats"] = stats
+    return usage
+
+
+def file_sizes(directory: str, filenames: Iterable[str]) -> int:
+    """Return the total size of the named files in a directory, ignoring files that are gone."""
+    total = 0
+    for filename in filenames:
+        try:
+            total += os.path.getsize(os.path.join(directory, filename))
+        except OSError:
+            pass
+    return total
+
+
+def directory_usage(path: str) -> Dict[str, Any]:
+    """
+    Return file count and bytes on disk under a directory, with a breakdown
+    by top-level subdirectory (e.g. static/tts_cache).
+    """
+    if not os.path.isdir(path):
+        return {"path": path, "exists": False}
+    usage = {"path": path, "exists": True, "files": 0, "bytes": 0, "subdirectories": {}}
+    for root, _, files in os.walk(path):
+        relative = os.path.relpath(root, path)
+        top = None if relative == "." else relative.split(os.sep, 1)[0]
+        for filename in files:
+            try:
+                size = os.path.getsize(os.path.join(root, filename))
+            except OSError:
+                continue
+            usage["files"] += 1
+            usage["bytes"] += size
+            if top is not None:
+                entry = usage["subdirectories"].setdefault(top, {"files": 0, "bytes": 0})
+                entry["files"] += 1
+                entry["bytes"] += size
+    return usage
+
+
+def process_memory() -> Dict[str, Any]:
+    """Return the process's current and peak resident set size, where the platform reports them."""
+    memory: Dict[str, Any] = {"rss_bytes": None, "peak_rss_bytes": None}
+    try:
+        with open("/proc/self/statm") as f:
+            memory["rss_bytes"] = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports kilobytes, macOS bytes
+        memory["peak_rss_bytes"] = peak if sys.platform == "darwin" else peak * 1024
+    return memory
+
+
+class AllocationTracer:
+    """
+    On-demand tracemalloc snapshots of the largest allocation sites, and diffs
+    against a baseline snapshot to find what grew.
+
+    Tracing slows allocations and uses memory of its own, so it stays off until
+    started. Only allocations made while tracing is on are seen.
+    """
+
+    def __init__(self, frames: int = 10):
+        """
+        Initialize the tracer.
+
+        Args:
+            frames: Default number of frames stored per allocation traceback
+        """
+        self.frames = frames
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+        self._baseline_time: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def start(self, frames: Optional[int] = None) -> Dict[str, Any]:
+        """Start tracing (restarting it if the frame depth changes) and return the status."""
+        frames = max(1, frames or self.frames)
+        with self._lock:
+            if tracemalloc.is_tracing() and tracemalloc.get_traceback_limit() != frames:
+                tracemalloc.stop()
+                self._baseline = None
+                self._baseline_time = None
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(frames)
+        return self.status()
+
+    def stop(self) -> Dict[str, Any]:
+        """Stop tracing and drop the baseline snapshot."""
+        with self._lock:
+            tracemalloc.stop()
+            self._baseline = None
+            self._baseline_time = None
+        return self.status()
+
+    def status(self) -> Dict[str, Any]:
+        """Return whether tracing is on, the memory it has seen and its own overhead."""
+        tracing = tracemalloc.is_tracing()
+        current, peak = tracemalloc.get_traced_memory() if tracing else (0, 0)
+        return {
+            "tracing": tracing,
+            "frames": tracemalloc.get_traceback_limit() if tracing else None,
+            "traced_bytes": current,
+            "traced_peak_bytes": peak,
+            "tracer_overhead_bytes": tracemalloc.get_tracemalloc_memory() if tracing else 0,
+            "baseline_age_seconds": round(time.time() - self._baseline_time, 1) if self._baseline_time else None,
+        }
+
+    def snapshot(self, limit: int = 20, group_by: str = "lineno", set_baseline: bool = True) -> Dict[str, Any]:
+        """
+        Return the top allocation sites.
+
+        Args:
+            limit: Number of sites returned
+            group_by: "lineno", "filename" or "traceback"
+            set_baseline: Keep this snapshot as the baseline for later diffs
+
+        Raises:
+            RuntimeError: If tracing is off
+        """
+        snapshot = self._take()
+        stats = snapshot.statistics(group_by)
+        if set_baseline:
+            with self._lock:
+                self._baseline = snapshot
+                self._baseline_time = time.time()
+        return {
+            **self.status(),
+            "total_bytes": sum(stat.size for stat in stats),
+            "top": [self._stat_to_dict(stat) for stat in stats[:limit]],
+        }
+
+    def diff(self, limit: int = 20, group_by: str = "lineno", rebase: bool = False) -> Dict[str, Any]:
+        """
+        Return the allocation sites that grew (or shrank) most since the baseline snapshot.
+
+        Args:
+            limit: Number of sites returned
+            group_by: "lineno", "filename" or "traceback"
+            rebase: Make the new snapshot the baseline for the next diff
+
+        Raises:
+            RuntimeError: If tracing is off or no baseline snapshot was taken
+        """
+        with self._lock:
+            baseline = self._baseline
+        if baseline is None:
+            raise RuntimeError("No baseline snapshot; take one first")
+        snapshot = self._take()
+        stats = snapshot.compare_to(baseline, group_by)
+        if rebase:
+            with self._lock:
+                self._baseline = snapshot
+                self._baseline_time = time.time()
+        return {
+            **self.status(),
+            "size_diff_bytes": sum(stat.size_diff for stat in stats),
+            "top": [self._stat_to_dict(stat) for stat in stats[:limit]],
+        }
+
+    def _take(self) -> tracemalloc.Snapshot:
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("Allocation tracing is off; start it first")
+        return tracemalloc.take_snapshot().filter_traces(TRACE_FILTERS)
+
+    @staticmethod
+    def _stat_to_dict(stat: Any) -> Dict[str, Any]:
+        entry: Dict[str, Any] = {
+            "size_bytes": stat.size,
+            "count": stat.count,
+            "traceback": [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback],
+        }
+        if isinstance(stat, tracemalloc.StatisticDiff):
+            entry["size_diff_bytes"] = stat.size_diff
+            entry["count_diff"] = stat.count_diff
+        return entry
+
+
+def largest(entries: Dict[str, Dict[str, Any]], key: str, limit: int) -> List[Dict[str, Any]]:
+    """Return up to limit entries (with their id) ordered by a numeric field, largest first."""
+    ordered = sorted(entries.items(), key=lambda item: item[1].get(key) or 0, reverse=True)
+    return [{"id": entry_id, **entry} for entry_id, entry in ordered[:limit]]
@@ -0,0 +1,276 @@
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from context_manager import message_has_image
+
+# Routing modes: "off" always uses the client's model, "auto" routes requests whose model is
+# missing or "auto", "always" routes everything except explicit overrides
+ROUTING_MODES = ("off", "auto", "always")
+AUTO_MODEL = "auto"
+
+# Fast model per provider used when ROUTER_FAST_MODELS isn't set; the vision pool
+# defaults to the provider's default model
+DEFAULT_FAST_MODELS = {
+    "openai": "gpt-4o-mini",
+    "gemini": "gemini-2.0-flash",
+}
+
+# Name prefixes of models a provider serves besides those in its pools (ROUTER_MODEL_PREFIXES
+# overrides them); providers not listed accept any model name
+DEFAULT_MODEL_PREFIXES = {
+    "gemini": ["gemini-", "gemma-", "models/"],
+}
+
+
+class RoutingDecision:
+    """The model chosen for one request and why."""
+
+    def __init__(self, model: str, reason: str, has_images: bool, routed: bool):
+        self.model = model
+        self.reason = reason
+        self.has_images = has_images
+        self.routed = routed
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "reason": self.reason,
+            "has_images": self.has_images,
+            "routed": self.routed,
+        }
+
+
+class LatencyWindow:
+    """Recent time-to-first-token samples of one model, bounded by count and age."""
+
+    def __init__(self, max_samples: int = 50, max_age: float = 300.0):
+        self.max_age = max_age
+        self.samples: Deque[Tuple[float, float]] = deque(maxlen=max_samples)
+
+    def add(self, seconds: float):
+        self.samples.append((time.monotonic(), seconds))
+
+    def percentiles(self) -> Tuple[int, Optional[float], Optional[float]]:
+        """
+        Return the sample count and p50/p95 in seconds, dropping expired samples first.
+
+        Expired samples age out so a model that was routed around gets probed again.
+        """
+        cutoff = time.monotonic() - self.max_age
+        while self.samples and self.samples[0][0] < cutoff:
+            self.samples.popleft()
+        if not self.samples:
+            return 0, None, None
+        values = sorted(seconds for _, seconds in self.samples)
+        p95_index = min(len(values) - 1, int(round(0.95 * (len(values) - 1))))
+        return len(values), values[len(values) // 2], values[p95_index]
+
+
+class ModelRouter:
+    """
+    Chooses a model per request: text-only turns go to the fast pool and image-bearing
+    turns to the vision pool. Within a pool, the first model meeting the TTFT SLO at
+    p95 wins; if none do, the one with the lowest p95 is used.
+    """
+
+    def __init__(self,
+                 provider: str,
+                 fast_models: List[str],
+                 vision_models: List[str],
+                 default_model: str,
+                 mode: str = "auto",
+                 ttft_slo: float = 1.5,
+                 min_samples: int = 5,
+                 window: int = 50,
+                 max_age: float = 300.0,
+                 model_prefixes: Optional[List[str]] = None):
+        """
+        Initialize the router.
+
+        Args:
+            provider: The LLM provider name
+            fast_models: Models for text-only turns, in order of preference
+            vision_models: Image-capable models, in order of preference
+            default_model: Model used for unrouted requests that don't name one
+            mode: One of ROUTING_MODES
+            ttft_slo: Target p95 time to first token in seconds
+            min_samples: Samples needed before a model's latency is trusted
+            window: Samples kept per model
+            max_age: Seconds after which a sample no longer counts
+            model_prefixes: Name prefixes of other models the provider serves (None: any model)
+        """
+        if mode not in ROUTING_MODES:
+            raise ValueError(f"Unknown routing mode '{mode}' (expected one of {', '.join(ROUTING_MODES)})")
+        self.provider = provider
+        self.fast_models = fast_models
+        self.vision_models = vision_models
+        self.default_model = default_model
+        self.mode = mode
+        self.ttft_slo = ttft_slo
+        self.min_samples = max(1, min_samples)
+        self.window = window
+        self.max_age = max_age
+        self.model_prefixes = model_prefixes
+        self._latency: Dict[str, LatencyWindow] = {}
+        # Whole-response latency of non-streamed calls, reported but not used for routing
+        self._call_latency: Dict[str, LatencyWindow] = {}
+        self._routed: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def route(self,
+              messages: List[Dict[str, Any]],
+              requested_model: Optional[str] = None,
+              override: Optional[str] = None) -> RoutingDecision:
+        """
+        Pick the model for a request.
+
+        Args:
+            messages: The messages about to be sent (including injected images)
+            requested_model: The model named in the request body, if any
+            override: An explicit override (header or extra body), always honored
+
+        Returns:
+            The RoutingDecision
+        """
+        has_images = any(message_has_image(message) for message in messages)
+        if override:
+            return self._count(RoutingDecision(override, "override", has_images, routed=False))
+        # A model of another provider (e.g. a client's fixed "gpt-4o" while Gemini is configured) is not a choice
+        client_chose = requested_model and requested_model != AUTO_MODEL and self.serves(requested_model)
+        if self.mode == "off" or (self.mode == "auto" and client_chose):
+            model = requested_model if client_chose else self.default_model
+            return self._count(RoutingDecision(model, "client" if client_chose else "default", has_images, routed=False))
+
+        # Vision-capable models can serve text too, so they back up the fast pool
+        candidates = self.vision_models if has_images else self.fast_models + self.vision_models
+        pool = "vision" if has_images else "fast"
+        fallback = None
+        for model in candidates:
+            samples, _, p95 = self._percentiles(model)
+            if samples < self.min_samples or p95 <= self.ttft_slo:
+                reason = pool if model in (self.vision_models if has_images else self.fast_models) else f"{pool}:shifted"
+                return self._count(RoutingDecision(model, reason, has_images, routed=True))
+            if fallback is None or p95 < fallback[1]:
+                fallback = (model, p95)
+        return self._count(RoutingDecision(fallback[0], f"{pool}:lowest_p95", has_images, routed=True))
+
+    def serves(self, model: str) -> bool:
+        """Return True if the model belongs to this provider: it is pooled, the default or has a known prefix."""
+        if model in self.fast_models or model in self.vision_models or model == self.default_model:
+            return True
+        return self.model_prefixes is None or any(model.startswith(prefix) for prefix in self.model_prefixes)
+
+    def record_ttft(self, model: str, seconds: float):
+        """Record the time to first token observed for a model (streamed calls only)."""
+        self._record(self._latency, model, seconds)
+
+    def record_call_latency(self, model: str, seconds: float):
+        """Record the latency of a non-streamed call; it is reported but doesn't steer routing."""
+        self._record(self._call_latency, model, seconds)
+
+    def _record(self, windows: Dict[str, LatencyWindow], model: str, seconds: float):
+        with self._lock:
+            window = windows.get(model)
+            if window is None:
+                window = windows[model] = LatencyWindow(self.window, self.max_age)
+            window.add(seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the pools, routing counts and p50/p95 TTFT (ms) per model."""
+        with self._lock:
+            routed = dict(self._routed)
+        return {
+            "mode": self.mode,
+            "fast_models": self.fast_models,
+            "vision_models": self.vision_models,
+            "default_model": self.default_model,
+            "ttft_slo_ms": self.ttft_slo * 1000,
+            "routed": routed,
+            "ttft": self._latency_stats(self._latency),
+            "non_streaming_latency": self._latency_stats(self._call_latency),
+        }
+
+    def _latency_stats(self, windows: Dict[str, LatencyWindow]) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            models = list(windows)
+        latency = {}
+        for model in models:
+            samples, p50, p95 = self._percentiles(model, windows)
+            latency[model] = {
+                "samples": samples,
+                "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+                "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            }
+        return latency
+
+    def _percentiles(self, model: str,
+                     windows: Optional[Dict[str, LatencyWindow]] = None) -> Tuple[int, Optional[float], Optional[float]]:
+        with self._lock:
+            window = (self._latency if windows is None else windows).get(model)
+            return window.percentiles() if window else (0, None, None)
+
+    def _count(self, decision: RoutingDecision) -> RoutingDecision:
+        with self._lock:
+            self._routed[decision.model] = self._routed.get(decision.model, 0) + 1
+        return decision
+
+
+_routers: Dict[str, ModelRouter] = {}
+_routers_lock = threading.Lock()
+
+
+def get_router(provider: str) -> ModelRouter:
+    """
+    Return the shared router for a provider, creating it from the environment on first use.
+
+    Settings are read from MODEL_ROUTING, ROUTER_FAST_MODELS, ROUTER_VISION_MODELS (comma
+    separated), ROUTER_MODEL_PREFIXES (comma separated), ROUTER_TTFT_SLO_MS, ROUTER_MIN_SAMPLES,
+    ROUTER_WINDOW and ROUTER_MAX_AGE;
+    each can be overridden per provider by appending the provider name, e.g.
+    ROUTER_FAST_MODELS_GEMINI.
+
+    Args:
+        provider: The LLM provider name
+
+    Returns:
+        The provider's ModelRouter
+    """
+    provider = provider.lower()
+    with _routers_lock:
+        router = _routers.get(provider)
+        if router is None:
+            def setting(name, default):
+                return os.getenv(f"{name}_{provider.upper()}", os.getenv(name, default))
+
+            def models(name, default):
+                value = setting(name, "")
+                return [model.strip() for model in value.split(",") if model.strip()] or default
+
+            if provider == "gemini":
+                default_model = os.getenv("GEMINI_DEFAULT_MODEL", "gemini-2.5-pro-preview-05-06")
+            else:
+                default_model = os.getenv("DEFAULT_MODEL", "gpt-4o")
+            router = ModelRouter(
+                provider,
+                fast_models=models("ROUTER_FAST_MODELS", [DEFAULT_FAST_MODELS.get(provider, default_model)]),
+                vision_models=models("ROUTER_VISION_MODELS", [default_model]),
+                default_model=default_model,
+                mode=setting("MODEL_ROUTING", "auto").lower(),
+                ttft_slo=float(setting("ROUTER_TTFT_SLO_MS", "1500")) / 1000,
+                min_samples=int(setting("ROUTER_MIN_SAMPLES", "5")),
+                window=int(setting("ROUTER_WINDOW", "50")),
+                max_age=float(setting("ROUTER_MAX_AGE", "300")),
+                model_prefixes=models("ROUTER_MODEL_PREFIXES", DEFAULT_MODEL_PREFIXES.get(provider)),
+            )
+            _routers[provider] = router
+        return router
+
+
+def all_router_stats() -> Dict[str, Dict[str, Any]]:
+    """Return stats for every provider router created so far."""
+    with _routers_lock:
+        routers = list(_routers.values())
+    return {router.provider: router.stats() for router in routers}
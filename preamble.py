@@ -0,0 +1,142 @@
+import random
+import re
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, List, Optional
+
+DEFAULT_PREAMBLES = [
+    "Let me take a look.",
+    "One moment, I'm looking at it.",
+    "Okay, let me see.",
+    "Hmm, let me have a look.",
+]
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+# Conversational openers that say nothing about the image ("Great question!", "Sure, let me look.")
+_FILLER = re.compile(
+    r"^(great|good|nice|interesting|what a|sure|of course|absolutely|certainly|okay|ok|alright|"
+    r"well|hmm|oh|wow|ah|hi|hello|hey|thanks|thank you|i'd be happy|i would be happy|happy to|let me|"
+    r"let's|i can|i'll|i will)\b",
+    re.IGNORECASE,
+)
+
+
+def first_sentence(text: str, max_chars: int = 160, max_sentences: int = 3) -> Optional[str]:
+    """
+    Return the first descriptive sentence of a reply, to reuse as a caption.
+
+    Openers like "Great question!" and questions back to the user are skipped,
+    and so are fragments under four words; if none of the first max_sentences
+    sentences qualifies, nothing is cached.
+    """
+    sentences = _SENTENCE_END.split(text.strip(), maxsplit=max_sentences)[:max_sentences]
+    for sentence in sentences:
+        sentence = sentence.strip()
+        if not sentence or len(sentence) > max_chars or sentence[-1] not in ".!":
+            continue
+        if _FILLER.match(sentence) or len(sentence.split()) < 4:
+            continue
+        return sentence
+    return None
+
+
+class PreamblePicker:
+    """
+    Chooses the acknowledgement spoken while a vision request is in flight.
+    A cached caption of the image is preferred; otherwise a phrase is drawn
+    from the configured set, never repeating the previous one for a session.
+    """
+
+    def __init__(self, phrases: List[str], caption_template: str = "", max_sessions: int = 1024):
+        """
+        Initialize the picker.
+
+        Args:
+            phrases: Acknowledgements to choose from
+            caption_template: Format string with a {caption} field; empty disables captions
+            max_sessions: Sessions whose last phrase is remembered
+        """
+        self.phrases = phrases or DEFAULT_PREAMBLES
+        self.caption_template = caption_template
+        self.max_sessions = max_sessions
+        self._last: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def choose(self, session_id: Optional[str], caption: Optional[str] = None) -> str:
+        """
+        Pick the preamble for a turn.
+
+        Args:
+            session_id: The conversation the turn belongs to (None for no memory)
+            caption: A short cached description of the image, if known
+
+        Returns:
+            The preamble text, ending with a space so the model's reply follows on naturally
+        """
+        if caption and self.caption_template:
+            return self.caption_template.format(caption=caption).strip() + " "
+        with self._lock:
+            last = self._last.get(session_id) if session_id else None
+            choices = [index for index in range(len(self.phrases)) if index != last] or [0]
+            index = random.choice(choices)
+            if session_id:
+                if len(self._last) >= self.max_sessions and session_id not in self._last:
+                    self._last.pop(next(iter(self._last)))
+                self._last[session_id] = index
+        return self.phrases[index] + " "
+
+
+def call_in_background(call: Callable[[], Any]) -> Future:
+    """Start a call on a daemon thread and return a Future for its result."""
+    future: Future = Future()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(call())
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name="upstream-call", daemon=True).start()
+    return future
+
+
+def wait_for_stream(future: Future, deadline: Optional[float] = None) -> Any:
+    """
+    Wait for a background upstream call to return its stream.
+
+    Args:
+        future: Future from call_in_background
+        deadline: Absolute time.monotonic() to stop waiting at (None waits indefinitely)
+
+    Returns:
+        The call's result
+
+    Raises:
+        FutureTimeoutError: If the deadline passed first; the stream is closed once it arrives
+        Exception: Whatever the call raised
+    """
+    timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeoutError:
+        close_when_done(future)
+        raise
+
+
+def close_when_done(future: Future):
+    """Close the stream a background call returns, now or whenever it arrives, because nobody will read it."""
+    def close_stream(done: Future):
+        if done.cancelled() or done.exception() is not None:
+            return
+        close = getattr(done.result(), "close", None)
+        if close:
+            try:
+                close()
+            except Exception as e:
+                print(f"Error closing abandoned upstream stream: {str(e)}")
+    future.add_done_callback(close_stream)
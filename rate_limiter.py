@@ -0,0 +1,253 @@
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from openai import APIConnectionError, APIStatusError
+
+from scheduler import AdmissionError
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class RateLimitExceeded(AdmissionError):
+    """The call could not be paced or retried within the caller's deadline."""
+
+    status_code = 429
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled continuously at a per-minute rate.
+    Reservations debit the bucket immediately and return how long the caller
+    must wait, so concurrent callers are paced evenly instead of bursting.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        """
+        Initialize the bucket.
+
+        Args:
+            rate_per_minute: Sustained refill rate
+            capacity: Maximum burst size (defaults to one minute of quota)
+        """
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float) -> float:
+        """
+        Take tokens from the bucket.
+
+        Args:
+            amount: Number of tokens to take (capped at the bucket capacity)
+
+        Returns:
+            Seconds to wait before the reservation is covered
+        """
+        with self._lock:
+            self._refill()
+            self.tokens -= min(amount, self.capacity)
+            return max(0.0, -self.tokens / self.rate)
+
+    def refund(self, amount: float):
+        """Give back tokens from a reservation that was not used or was over-estimated."""
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + min(amount, self.capacity))
+
+
+class ProviderRateLimiter:
+    """
+    Client-side pacing for one provider/model pair using request and token buckets.
+    A limit of 0 disables the corresponding bucket.
+    """
+
+    def __init__(self, name: str, requests_per_minute: float = 0, tokens_per_minute: float = 0):
+        self.name = name
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+
+    def acquire(self, tokens: int, deadline: Optional[float] = None):
+        """
+        Wait until the request and token quota allow a call.
+
+        Args:
+            tokens: Estimated tokens the call will consume
+            deadline: Absolute time.monotonic() by which the call must have started
+
+        Raises:
+            RateLimitExceeded: If the required wait would run past the deadline
+        """
+        delays = []
+        if self.request_bucket:
+            delays.append(self.request_bucket.reserve(1))
+        if self.token_bucket:
+            delays.append(self.token_bucket.reserve(tokens))
+        delay = max(delays, default=0.0)
+        if delay <= 0:
+            return
+        if deadline is not None and time.monotonic() + delay > deadline:
+            self.refund(1, tokens)
+            raise RateLimitExceeded(f"{self.name} quota exhausted for the next {delay:.1f}s", retry_after=delay)
+        time.sleep(delay)
+
+    def refund(self, requests: int = 0, tokens: int = 0):
+        """Return unused quota, e.g. after a failed call or an over-estimate."""
+        if requests and self.request_bucket:
+            self.request_bucket.refund(requests)
+        if tokens and self.token_bucket:
+            self.token_bucket.refund(tokens)
+
+
+_limiters: Dict[Tuple[str, str], ProviderRateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(provider: str, model: str) -> ProviderRateLimiter:
+    """
+    Return the shared limiter for a provider/model pair.
+
+    Quotas come from LLM_RPM and LLM_TPM, optionally overridden per provider
+    (e.g. LLM_RPM_GEMINI). Each model gets its own buckets with those quotas.
+
+    Args:
+        provider: The LLM provider name
+        model: The model identifier
+
+    Returns:
+        The ProviderRateLimiter for the pair
+    """
+    provider = provider.lower()
+    key = (provider, model)
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            def setting(name):
+                return float(os.getenv(f"{name}_{provider.upper()}", os.getenv(name, "0")))
+
+            limiter = ProviderRateLimiter(f"{provider}/{model}", setting("LLM_RPM"), setting("LLM_TPM"))
+            _limiters[key] = limiter
+        return limiter
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """
+    Read the server's requested backoff from an API error, if any.
+
+    Args:
+        error: The exception raised by the client
+
+    Returns:
+        Seconds to wait, or None if the response carried no hint
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return float(retry_after)
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def request_timeout(deadline: Optional[float], minimum: float = 0.5) -> Dict[str, float]:
+    """
+    Return client keyword arguments bounding one attempt by the time left before a deadline.
+
+    Args:
+        deadline: Absolute time.monotonic() (None for no bound)
+        minimum: Smallest timeout to give an attempt that is allowed to start
+
+    Returns:
+        {"timeout": seconds}, or an empty dict without a deadline (keeping the client default)
+    """
+    if deadline is None:
+        return {}
+    return {"timeout": max(minimum, deadline - time.monotonic())}
+
+
+def is_retryable(error: Exception) -> bool:
+    """Return True for rate limits, transient server errors and connection failures."""
+    if isinstance(error, APIStatusError):
+        return error.status_code in RETRYABLE_STATUS_CODES
+    return isinstance(error, APIConnectionError)
+
+
+def call_with_retry(call: Callable[[], Any],
+                    limiter: Optional[ProviderRateLimiter] = None,
+                    estimated_tokens: int = 0,
+                    deadline: Optional[float] = None,
+                    max_retries: Optional[int] = None,
+                    base_delay: Optional[float] = None,
+                    max_delay: Optional[float] = None) -> Any:
+    """
+    Run an upstream call with quota pacing and jittered exponential backoff.
+
+    Retries honor the server's Retry-After hint and are abandoned as soon as the
+    next attempt could not start before the caller's deadline.
+
+    Args:
+        call: Zero-argument function performing the request
+        limiter: Optional rate limiter to pace attempts with
+        estimated_tokens: Tokens to reserve per attempt on the token bucket
+        deadline: Absolute time.monotonic() after which no attempt may start
+        max_retries: Retries after the first attempt (default LLM_MAX_RETRIES or 3)
+        base_delay: Initial backoff in seconds (default LLM_RETRY_BASE_DELAY or 0.5)
+        max_delay: Backoff cap in seconds (default LLM_RETRY_MAX_DELAY or 8)
+
+    Returns:
+        The result of the call
+
+    Raises:
+        RateLimitExceeded: If quota pacing would overrun the deadline
+        Exception: The last error from the call once retries are exhausted
+    """
+    if max_retries is None:
+        max_retries = int(os.getenv("LLM_MAX_RETRIES", "3"))
+    if base_delay is None:
+        base_delay = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))
+    if max_delay is None:
+        max_delay = float(os.getenv("LLM_RETRY_MAX_DELAY", "8"))
+
+    attempt = 0
+    while True:
+        if limiter:
+            limiter.acquire(estimated_tokens, deadline)
+        try:
+            return call()
+        except Exception as e:
+            if not is_retryable(e) or attempt >= max_retries:
+                raise
+            # Full jitter, but never retry sooner than the server asked
+            delay = random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+            hinted = retry_after_seconds(e)
+            if hinted is not None:
+                delay = max(delay, hinted)
+            if deadline is not None and time.monotonic() + delay >= deadline:
+                raise
+            attempt += 1
+            print(f"Retrying upstream call in {delay:.2f}s (attempt {attempt}/{max_retries}): {str(e)}")
+            time.sleep(delay)
@@ -0,0 +1,139 @@
+import binascii
+import hashlib
+import json
+import os
+from typing import Any, Callable, Dict, List, Tuple
+
+from image_utils import sniff_image_mime
+
+EXTENSIONS = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/webp": ".webp",
+    "image/gif": ".gif",
+    "image/bmp": ".bmp",
+    "image/heic": ".heic",
+    "image/heif": ".heif",
+}
+
+
+class BodyTooLarge(Exception):
+    """The request body exceeds the configured limit."""
+
+    def __init__(self, limit: int):
+        super().__init__(f"Request body exceeds the {limit} byte limit")
+        self.limit = limit
+
+
+def read_json_body(request, max_bytes: int) -> Any:
+    """
+    Read and parse a JSON request body exactly once.
+
+    The body is read straight from the input stream (bypassing Flask's cached
+    copy) and released as soon as it has been parsed.
+
+    Args:
+        request: The Flask request
+        max_bytes: Largest accepted body; 0 disables the limit
+
+    Returns:
+        The parsed JSON document
+
+    Raises:
+        BodyTooLarge: If the declared or actual body size exceeds max_bytes
+        json.JSONDecodeError: If the body isn't valid JSON
+    """
+    if max_bytes and request.content_length is not None and request.content_length > max_bytes:
+        raise BodyTooLarge(max_bytes)
+    if not max_bytes:
+        raw = request.get_data(cache=False)
+    else:
+        # read(n) preallocates n bytes, so ask for the declared length rather than the limit
+        declared = request.content_length
+        raw = request.stream.read(declared if declared is not None else max_bytes + 1)
+    if max_bytes and len(raw) > max_bytes:
+        raise BodyTooLarge(max_bytes)
+    # Decode explicitly so the raw bytes can be dropped before the parse allocates the document
+    text = raw.decode("utf-8")
+    del raw
+    return json.loads(text)
+
+
+def summarize_payload(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Describe a chat payload for logging without copying or re-serializing it.
+
+    Args:
+        data: The parsed request body
+
+    Returns:
+        Keys, message count, roles and the number of image parts
+    """
+    messages = data.get("messages") if isinstance(data, dict) else None
+    summary = {"keys": sorted(data.keys()) if isinstance(data, dict) else []}
+    if isinstance(messages, list):
+        summary["messages"] = len(messages)
+        summary["roles"] = [message.get("role") for message in messages if isinstance(message, dict)]
+        summary["image_parts"] = sum(
+            1
+            for message in messages if isinstance(message, dict) and isinstance(message.get("content"), list)
+            for part in message["content"] if isinstance(part, dict) and part.get("type") == "image_url"
+        )
+    return summary
+
+
+def extract_inline_images(messages: List[Dict[str, Any]],
+                          store_dir: str,
+                          make_url: Callable[[str], str],
+                          min_bytes: int = 0) -> Tuple[int, int]:
+    """
+    Move inline base64 data-URI images into the upload store and reference them by URL.
+
+    Each image is stored once under a content-hash filename, so repeated turns
+    carrying the same image don't write it again. Parts are rewritten in place.
+
+    Args:
+        messages: Parsed chat messages owned by the caller
+        store_dir: Directory to store extracted images in
+        make_url: Function turning a stored filename into the URL to send upstream
+        min_bytes: Only extract data URIs at least this long
+
+    Returns:
+        Tuple of (number of images extracted, characters of base64 removed from the payload)
+    """
+    extracted = 0
+    removed = 0
+    for message in messages:
+        content = message.get("content") if isinstance(message, dict) else None
+        if not isinstance(content, list):
+            continue
+        for part in content:
+            if not isinstance(part, dict) or part.get("type") != "image_url":
+                continue
+            image_url = part.get("image_url")
+            url = image_url.get("url") if isinstance(image_url, dict) else None
+            if not isinstance(url, str) or not url.startswith("data:") or len(url) < min_bytes:
+                continue
+            header, _, encoded = url.partition(",")
+            if ";base64" not in header:
+                continue
+            try:
+                # a2b_base64 reads the ASCII str in place; b64decode would first copy it to bytes
+                image_bytes = binascii.a2b_base64(encoded)
+            except (binascii.Error, ValueError):
+                continue
+            mime_type = sniff_image_mime(image_bytes, default="")
+            extension = EXTENSIONS.get(mime_type)
+            if not extension:
+                continue
+            filename = f"inline_{hashlib.sha256(image_bytes).hexdigest()[:32]}{extension}"
+            path = os.path.join(store_dir, filename)
+            if not os.path.exists(path):
+                tmp_path = f"{path}.tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(image_bytes)
+                os.replace(tmp_path, path)
+            image_url["url"] = make_url(filename)
+            extracted += 1
+            removed += len(url)
+    return extracted, removed
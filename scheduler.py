@@ -0,0 +1,258 @@
+import heapq
+import itertools
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+# Priority classes; lower values are served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: "interactive",
+    PRIORITY_BATCH: "batch",
+}
+
+
+class AdmissionError(Exception):
+    """Base class for requests the scheduler refused to run."""
+
+    status_code = 503
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionRejected(AdmissionError):
+    """The queue for the provider is full; the caller should back off."""
+
+    status_code = 429
+
+
+class QueueTimeout(AdmissionError):
+    """The request waited longer than its queue deadline."""
+
+    status_code = 503
+
+
+class Admission:
+    """
+    A granted slot on a provider scheduler.
+    Must be released exactly once when the upstream call (or stream) is finished;
+    release() is idempotent so it can be wired to several cleanup paths.
+    """
+
+    def __init__(self, scheduler: "ProviderScheduler", priority: int, wait_time: float):
+        self.scheduler = scheduler
+        self.priority = priority
+        self.wait_time = wait_time
+        self._released = False
+        self._lock = threading.Lock()
+
+    def release(self):
+        """Return the slot to the scheduler."""
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        self.scheduler._release(self.priority)
+
+    def wrap(self, iterable: Iterable[Any]) -> Iterator[Any]:
+        """Yield from an iterable and release the slot once it is exhausted or closed."""
+        try:
+            yield from iterable
+        finally:
+            self.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+        return False
+
+
+class ProviderScheduler:
+    """
+    Bounded-concurrency admission control for one upstream provider.
+    Requests queue by priority class (interactive ahead of batch), a number of
+    slots is reserved for interactive work so batch bursts can't occupy them,
+    and requests are shed with an AdmissionError when the queue is full or their
+    queue-time deadline passes.
+    """
+
+    def __init__(self,
+                 name: str,
+                 max_concurrency: int = 8,
+                 max_queue: int = 32,
+                 reserved_interactive: int = 2,
+                 queue_timeouts: Optional[Dict[int, float]] = None):
+        """
+        Initialize the scheduler.
+
+        Args:
+            name: Provider name, used in metrics
+            max_concurrency: Maximum number of in-flight upstream calls
+            max_queue: Maximum number of waiting requests before new ones are rejected
+            reserved_interactive: Slots that batch requests may never occupy
+            queue_timeouts: Default queue deadline in seconds per priority class
+        """
+        self.name = name
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max_queue
+        self.reserved_interactive = min(max(0, reserved_interactive), self.max_concurrency - 1)
+        self.queue_timeouts = queue_timeouts or {PRIORITY_INTERACTIVE: 2.0, PRIORITY_BATCH: 30.0}
+
+        self._cond = threading.Condition()
+        self._queue = []
+        self._sequence = itertools.count()
+        self._in_flight = {priority: 0 for priority in PRIORITY_NAMES}
+        self._counters = {
+            "admitted": 0,
+            "rejected": 0,
+            "timed_out": 0,
+        }
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def _limit_for(self, priority: int) -> int:
+        if priority == PRIORITY_INTERACTIVE:
+            return self.max_concurrency
+        return self.max_concurrency - self.reserved_interactive
+
+    def _can_run(self, priority: int) -> bool:
+        # Batch work may only start while the reserved interactive slots stay free
+        return sum(self._in_flight.values()) < self._limit_for(priority)
+
+    def acquire(self, priority: int = PRIORITY_BATCH, timeout: Optional[float] = None) -> Admission:
+        """
+        Wait for a slot.
+
+        Args:
+            priority: PRIORITY_INTERACTIVE or PRIORITY_BATCH
+            timeout: Maximum seconds to wait in the queue (defaults per priority)
+
+        Returns:
+            An Admission that must be released when the upstream work is done
+
+        Raises:
+            AdmissionRejected: If the queue is full
+            QueueTimeout: If no slot became available before the deadline
+        """
+        if timeout is None:
+            timeout = self.queue_timeouts.get(priority, 30.0)
+        started = time.monotonic()
+        deadline = started + timeout
+
+        with self._cond:
+            if not self._queue and self._can_run(priority):
+                return self._admit(priority, started)
+
+            if len(self._queue) >= self.max_queue:
+                self._counters["rejected"] += 1
+                raise AdmissionRejected(f"{self.name} queue is full ({self.max_queue} waiting)")
+
+            entry = (priority, next(self._sequence))
+            heapq.heappush(self._queue, entry)
+            try:
+                while True:
+                    if self._queue[0] == entry and self._can_run(priority):
+                        heapq.heappop(self._queue)
+                        # Let the next waiter re-check, it may fit as well
+                        self._cond.notify_all()
+                        return self._admit(priority, started)
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._queue.remove(entry)
+                        heapq.heapify(self._queue)
+                        self._counters["timed_out"] += 1
+                        self._cond.notify_all()
+                        raise QueueTimeout(f"{self.name} queue wait exceeded {timeout:.1f}s")
+                    self._cond.wait(remaining)
+            except BaseException:
+                if entry in self._queue:
+                    self._queue.remove(entry)
+                    heapq.heapify(self._queue)
+                    self._cond.notify_all()
+                raise
+
+    def _admit(self, priority: int, started: float) -> Admission:
+        """Record a granted slot. Caller holds the condition lock."""
+        wait_time = time.monotonic() - started
+        self._in_flight[priority] += 1
+        self._counters["admitted"] += 1
+        self._total_wait += wait_time
+        self._max_wait = max(self._max_wait, wait_time)
+        return Admission(self, priority, wait_time)
+
+    def _release(self, priority: int):
+        with self._cond:
+            self._in_flight[priority] -= 1
+            self._cond.notify_all()
+
+    def metrics(self) -> Dict[str, Any]:
+        """Return queue depth, in-flight counts and admission counters."""
+        with self._cond:
+            depth = {name: 0 for name in PRIORITY_NAMES.values()}
+            for priority, _ in self._queue:
+                depth[PRIORITY_NAMES.get(priority, str(priority))] += 1
+            admitted = self._counters["admitted"]
+            return {
+                "provider": self.name,
+                "max_concurrency": self.max_concurrency,
+                "reserved_interactive": self.reserved_interactive,
+                "max_queue": self.max_queue,
+                "queue_depth": depth,
+                "in_flight": {PRIORITY_NAMES[p]: count for p, count in self._in_flight.items()},
+                **self._counters,
+                "avg_wait_ms": round(self._total_wait / admitted * 1000, 1) if admitted else 0.0,
+                "max_wait_ms": round(self._max_wait * 1000, 1),
+            }
+
+
+_schedulers: Dict[str, ProviderScheduler] = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(provider: str) -> ProviderScheduler:
+    """
+    Return the shared scheduler for a provider, creating it from the environment on first use.
+
+    Settings are read from LLM_MAX_CONCURRENCY, LLM_MAX_QUEUE, LLM_RESERVED_INTERACTIVE,
+    LLM_QUEUE_TIMEOUT_INTERACTIVE and LLM_QUEUE_TIMEOUT_BATCH; each can be overridden per
+    provider by appending the provider name, e.g. LLM_MAX_CONCURRENCY_GEMINI.
+
+    Args:
+        provider: The LLM provider name
+
+    Returns:
+        The provider's ProviderScheduler
+    """
+    provider = provider.lower()
+    with _schedulers_lock:
+        scheduler = _schedulers.get(provider)
+        if scheduler is None:
+            def setting(name, default):
+                return os.getenv(f"{name}_{provider.upper()}", os.getenv(name, default))
+
+            scheduler = ProviderScheduler(
+                provider,
+                max_concurrency=int(setting("LLM_MAX_CONCURRENCY", "8")),
+                max_queue=int(setting("LLM_MAX_QUEUE", "32")),
+                reserved_interactive=int(setting("LLM_RESERVED_INTERACTIVE", "2")),
+                queue_timeouts={
+                    PRIORITY_INTERACTIVE: float(setting("LLM_QUEUE_TIMEOUT_INTERACTIVE", "2")),
+                    PRIORITY_BATCH: float(setting("LLM_QUEUE_TIMEOUT_BATCH", "30")),
+                },
+            )
+            _schedulers[provider] = scheduler
+        return scheduler
+
+
+def all_scheduler_metrics() -> Dict[str, Dict[str, Any]]:
+    """Return metrics for every provider scheduler created so far."""
+    with _schedulers_lock:
+        schedulers = list(_schedulers.values())
+    return {scheduler.name: scheduler.metrics() for scheduler in schedulers}
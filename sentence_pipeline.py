@@ -0,0 +1,125 @@
+import queue
+import re
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple
+
+
+class SentenceSegmenter:
+    """
+    Incrementally splits streamed text into complete sentences.
+    Text is fed as it arrives from the model; a sentence is emitted once its
+    terminating punctuation is followed by whitespace, so decimals like "3.5"
+    are not split and short fragments are merged into the next sentence.
+    """
+
+    SENTENCE_END = re.compile(r'[.!?…]+["\'”’)\]]*\s+|\n+')
+
+    def __init__(self, min_chars: int = 20):
+        """
+        Initialize the segmenter.
+
+        Args:
+            min_chars: Minimum sentence length; shorter sentences are joined with the next one
+        """
+        self.min_chars = min_chars
+        self.buffer = ""
+
+    def feed(self, text: str) -> List[str]:
+        """
+        Add streamed text and return any sentences it completed.
+
+        Args:
+            text: The next text delta from the model
+
+        Returns:
+            List of complete sentences, in order
+        """
+        self.buffer += text
+        sentences = []
+        start = 0
+        for match in self.SENTENCE_END.finditer(self.buffer):
+            candidate = self.buffer[start:match.end()].strip()
+            if len(candidate) < self.min_chars:
+                continue
+            sentences.append(candidate)
+            start = match.end()
+        self.buffer = self.buffer[start:]
+        return sentences
+
+    def flush(self) -> List[str]:
+        """Return whatever text remains once the stream has ended."""
+        remainder = self.buffer.strip()
+        self.buffer = ""
+        return [remainder] if remainder else []
+
+
+def pipeline_synthesis(sentences: Iterable[str],
+                       synthesize: Callable[[str], Any],
+                       max_workers: int = 3) -> Iterator[Dict[str, Any]]:
+    """
+    Synthesize sentences concurrently while they are still being produced.
+
+    The sentence iterable is consumed on a background thread and each sentence
+    is submitted to a worker as soon as it is yielded, so synthesis of early
+    sentences overlaps with generation of later ones. Results are yielded
+    strictly in sentence order, each one as soon as it and every earlier
+    sentence have been synthesized, without waiting for the next sentence.
+
+    Args:
+        sentences: Iterable of sentences, typically consuming a model stream
+        synthesize: Function turning one sentence into an audio result
+        max_workers: Maximum number of concurrent synthesis calls
+
+    Yields:
+        Dictionaries with 'index', 'text' and 'audio' (the synthesize result)
+
+    Raises:
+        Exception: Whatever the sentence iterable raised, after the sentences before it
+    """
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    # Wakes the consumer when a sentence arrives, a synthesis finishes or the producer ends
+    events: "queue.Queue[Tuple[str, Any]]" = queue.Queue()
+    stopped = threading.Event()
+
+    def produce():
+        iterator = iter(sentences)
+        try:
+            for index, sentence in enumerate(iterator):
+                if stopped.is_set():
+                    break
+                future = executor.submit(synthesize, sentence)
+                events.put(("sentence", (index, sentence, future)))
+                future.add_done_callback(lambda _: events.put(("synthesized", None)))
+            events.put(("end", None))
+        except Exception as e:
+            events.put(("error", e))
+        finally:
+            if stopped.is_set() and hasattr(iterator, "close"):
+                iterator.close()
+
+    threading.Thread(target=produce, name="sentence-producer", daemon=True).start()
+    pending = deque()
+    produced_all = False
+    error = None
+    try:
+        while not produced_all or pending:
+            kind, value = events.get()
+            if kind == "sentence":
+                pending.append(value)
+            elif kind == "end":
+                produced_all = True
+            elif kind == "error":
+                produced_all, error = True, value
+            # Emit finished segments right away so the client can start playback
+            while pending and pending[0][2].done():
+                index_done, text, future = pending.popleft()
+                yield {"index": index_done, "text": text, "audio": future.result()}
+        if error is not None:
+            raise error
+    finally:
+        stopped.set()
+        for _, _, future in pending:
+            future.cancel()
+        executor.shutdown(wait=False)
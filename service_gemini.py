@@ -1,12 +1,22 @@
+import json
 import os
-import base64
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Optional, Union, Any
-from openai import OpenAI, APIError
+from openai import OpenAI, APIError, BadRequestError
 import requests
-from io import BytesIO
-from PIL import Image
 
 from llm_service import LLMService
+from image_utils import ImageCache, content_key, fetch_image, to_data_uri
+from context_manager import ContextManager
+from rate_limiter import call_with_retry, get_rate_limiter, request_timeout
+from file_handles import FileHandleCache, GeminiFilesClient
+from model_router import get_router
+
+# How Gemini reports a request naming a file it can't use (deleted, expired or not readable)
+HANDLE_ERROR_STATUS = re.compile(r"\b(INVALID_ARGUMENT|NOT_FOUND|PERMISSION_DENIED)\b")
+HANDLE_ERROR_WORDS = re.compile(r"\b(files?|uris?)\b", re.IGNORECASE)
 
 class GeminiService(LLMService):
     """
@@ -16,6 +26,18 @@ class GeminiService(LLMService):
     
     GEMINI_BASE_URL = "https://generativelanguage.googleapis.com/v1beta/openai/"
     DEFAULT_MODEL = os.environ.get("GEMINI_DEFAULT_MODEL", "gemini-2.5-pro-preview-05-06")
+    IMAGE_FETCH_TIMEOUT = float(os.environ.get("IMAGE_FETCH_TIMEOUT", "10"))
+    
+    # Shared across instances: prepared data URIs keyed by URL or content hash, and the download pool
+    _image_cache = ImageCache(
+        max_bytes=int(os.environ.get("IMAGE_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+        ttl=float(os.environ.get("IMAGE_CACHE_TTL", "600"))
+    )
+    _image_executor = ThreadPoolExecutor(max_workers=int(os.environ.get("IMAGE_FETCH_WORKERS", "4")))
+    # Experimental, off by default: upload each image URL once to the Files API and reference it by
+    # handle afterwards. Whether the OpenAI-compatible chat endpoint accepts Files API URIs is unverified.
+    FILE_HANDLES_ENABLED = os.environ.get("GEMINI_FILE_HANDLES", "false").lower() == "true"
+    _file_handles: Optional[FileHandleCache] = None
     
     def __init__(self):
         """
@@ -25,42 +47,49 @@ class GeminiService(LLMService):
             api_key: Gemini API key (will use environment variable if not provided)
         """
         self.api_key = os.environ.get("GEMINI_API_KEY")
+        # Retries are handled by call_with_retry so they can honor quotas and deadlines
         self.client = OpenAI(
             api_key=self.api_key,
-            base_url=self.GEMINI_BASE_URL
+            base_url=self.GEMINI_BASE_URL,
+            max_retries=0
         )
+        if self.FILE_HANDLES_ENABLED and GeminiService._file_handles is None:
+            GeminiService._file_handles = FileHandleCache(
+                GeminiFilesClient(self.api_key, base_url=os.environ.get("GEMINI_FILES_BASE_URL")),
+                refresh_margin=float(os.environ.get("FILE_HANDLE_REFRESH_MARGIN", "600"))
+            )
     
     def chat_completion(self, 
                        messages: List[Dict[str, Any]], 
                        model: Optional[str] = None,
                        temperature: Optional[float] = 0.7,
                        max_tokens: Optional[int] = None,
-                       stream: bool = False) -> Union[Dict[str, Any], Any]:
+                       stream: bool = False,
+                       deadline: Optional[float] = None) -> Union[Dict[str, Any], Any]:
         """
         Generate a chat completion using Google's Gemini API through the OpenAI client.
         
         Args:
             messages: List of message objects with role and content
-            model: Gemini model to use (default: gemini-2.5-pro-preview-05-06)
+            model: Gemini model to use (default: GEMINI_DEFAULT_MODEL)
             temperature: Temperature parameter (default: 0.7)
             max_tokens: Maximum number of tokens to generate
             stream: Whether to stream the response
+            deadline: Optional absolute time.monotonic() bounding pacing, retries and each attempt
             
         Returns:
             Either a completion response object or a stream
         """
         try:
-            # Process messages to handle image URLs
-            for message in messages:
-                if isinstance(message.get('content'), list):
-                    for content_part in message['content']:
-                        if content_part.get('type') == 'image_url':
-                            image_url_data = content_part.get('image_url')
-                            if image_url_data and 'url' in image_url_data:
-                                # Convert URL to base64 data URI
-                                image_url_data['url'] = self.process_image(image_url_data['url'])
-            # Ensure we always have a model parameter
-            model_name = self.DEFAULT_MODEL
+            # Convert image URLs to file handles or base64 data URIs (on a copy of the messages)
+            source_messages = messages
+            handles = {}
+            messages = self.prepare_messages(messages, deadline=deadline, handles=handles)
+            # Use the requested model unless the router says it belongs to another provider
+            model_name = model or self.DEFAULT_MODEL
+            if not get_router("gemini").serves(model_name):
+                print(f"Model '{model_name}' is not a Gemini model; using {self.DEFAULT_MODEL}")
+                model_name = self.DEFAULT_MODEL
             # Prepare parameters for the API call
             params = {
                 "model": model_name,
@@ -72,45 +101,171 @@ class GeminiService(LLMService):
             # Add max_tokens if provided
             if max_tokens is not None:
                 params["max_tokens"] = max_tokens
+            if stream:
+                # Ask for a final usage chunk so streamed turns can be accounted per session
+                params["stream_options"] = {"include_usage": True}
                 
-            response = self.client.chat.completions.create(**params)
+            # Pace against the provider quota and retry rate limits / transient errors
+            limiter = get_rate_limiter("gemini", model_name)
+            estimated_tokens = ContextManager("gemini").count_tokens(messages) + (max_tokens or 512)
+            # Each attempt is also bounded by the time left before the caller's deadline
+            def create():
+                return call_with_retry(lambda: self.client.chat.completions.create(**params, **request_timeout(deadline)),
+                                       limiter=limiter,
+                                       estimated_tokens=estimated_tokens,
+                                       deadline=deadline)
+            try:
+                response = create()
+            except BadRequestError as e:
+                # Only errors about a file handle are retried inline; other bad requests would fail again
+                rejected = self.rejected_handles(e, handles)
+                if not rejected:
+                    raise
+                # A handle was rejected (e.g. deleted early); forget it and send the images inline
+                print(f"Gemini rejected file handles {rejected}; retrying with inline images")
+                for key in rejected:
+                    self._file_handles.invalidate(key)
+                params["messages"] = self.prepare_messages(source_messages, deadline=deadline, use_handles=False)
+                response = create()
+            if not stream and getattr(response, "usage", None):
+                # Give back the part of the reservation the call didn't use
+                limiter.refund(tokens=max(0, estimated_tokens - response.usage.total_tokens))
             return response
         except APIError as e:
             # Log the error and re-raise
             print(f"Gemini API Error: {str(e)}")
             raise
     
-    def process_image(self, image_data: Union[str, bytes]) -> str:
+    @staticmethod
+    def rejected_handles(error: BadRequestError, handles: Dict[str, str]) -> List[str]:
+        """
+        Return the image URLs whose file handles a bad request error refers to.
+        
+        An error naming sent handles (by URI or files/<id>) rejects just those; one
+        with a Gemini argument/lookup status that mentions a file or URI rejects
+        all of them. Anything else is not about handles and returns [].
+        
+        Args:
+            error: The BadRequestError raised by the chat call
+            handles: Image URL -> handle URI for the handles that were sent
+        """
+        if not handles:
+            return []
+        body = getattr(error, "body", None)
+        text = f"{getattr(error, 'message', None) or error} {json.dumps(body) if body is not None else ''}"
+        named = [url for url, uri in handles.items()
+                 if uri in text or ("/files/" in uri and "files/" + uri.rsplit("/files/", 1)[1] in text)]
+        if named:
+            return named
+        if HANDLE_ERROR_STATUS.search(text) and HANDLE_ERROR_WORDS.search(text):
+            return list(handles)
+        return []
+    
+    def prepare_messages(self,
+                         messages: List[Dict[str, Any]],
+                         deadline: Optional[float] = None,
+                         use_handles: bool = True,
+                         handles: Optional[Dict[str, str]] = None) -> List[Dict[str, Any]]:
+        """
+        Return a copy of the messages with every image converted to a data URI,
+        or to a Files API handle if file handles are enabled.
+        
+        Distinct images are prepared concurrently, so a multi-image turn takes
+        roughly as long as its slowest download. The caller's list is not modified.
+        
+        Args:
+            messages: List of message objects with role and content
+            deadline: Optional absolute time.monotonic() by which all images must be ready
+            use_handles: Whether image URLs may be replaced by file handles
+            handles: If given, receives image URL -> handle URI for images sent as handles
+            
+        Returns:
+            The messages to send to Gemini
+        """
+        prepared = []
+        image_parts = []
+        for message in messages:
+            content = message.get('content')
+            if not isinstance(content, list):
+                prepared.append(message)
+                continue
+            parts = []
+            for content_part in content:
+                image_url_data = content_part.get('image_url') if content_part.get('type') == 'image_url' else None
+                if image_url_data and 'url' in image_url_data:
+                    content_part = {**content_part, 'image_url': dict(image_url_data)}
+                    image_parts.append(content_part['image_url'])
+                parts.append(content_part)
+            prepared.append({**message, 'content': parts})
+        
+        sources = list(dict.fromkeys(part['url'] for part in image_parts))
+        # Downloads never outlast the deadline
+        fetch_timeout = self.IMAGE_FETCH_TIMEOUT
+        if deadline is not None:
+            fetch_timeout = max(0.1, min(fetch_timeout, deadline - time.monotonic()))
+        prepare = self.resolve_image if use_handles and self._file_handles is not None else self.process_image
+        if len(sources) == 1:
+            results = {sources[0]: prepare(sources[0], timeout=fetch_timeout)}
+        elif sources:
+            futures = {source: self._image_executor.submit(prepare, source, timeout=fetch_timeout)
+                       for source in sources}
+            results = {}
+            for source, future in futures.items():
+                timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                results[source] = future.result(timeout=timeout)
+        
+        for part in image_parts:
+            if handles is not None and results[part['url']] != part['url'] and not results[part['url']].startswith('data:'):
+                handles[part['url']] = results[part['url']]
+            part['url'] = results[part['url']]
+        return prepared
+    
+    def resolve_image(self, image_data: Union[str, bytes], timeout: Optional[float] = None) -> str:
+        """
+        Return a file handle URI for an image URL, uploading it on first use.
+        
+        Falls back to process_image (an inline data URI) for non-URL input or
+        when the upload fails.
+        """
+        if isinstance(image_data, str) and image_data.startswith(('http://', 'https://')):
+            handle = self._file_handles.get_or_upload(
+                image_data,
+                lambda: fetch_image(image_data, timeout=timeout or self.IMAGE_FETCH_TIMEOUT)
+            )
+            if handle:
+                return handle.uri
+        return self.process_image(image_data, timeout=timeout)
+    
+    def process_image(self, image_data: Union[str, bytes], timeout: Optional[float] = None) -> str:
         """
         Process an image for inclusion in a Gemini message.
         
         Args:
             image_data: Either a URL string or raw image bytes
+            timeout: Download timeout in seconds (default IMAGE_FETCH_TIMEOUT)
             
         Returns:
             Processed image data in the format expected by Gemini
         """
+        # If it's a string but not a URL, assume it's already a data URI
+        if isinstance(image_data, str) and not (image_data.startswith('http://') or image_data.startswith('https://')):
+            return image_data
+        
+        cache_key = image_data if isinstance(image_data, str) else content_key(image_data)
+        cached = self._image_cache.get(cache_key)
+        if cached:
+            return cached
+        
+        mime_type = None
         # If image_data is a URL, download it.
-        if isinstance(image_data, str) and (image_data.startswith('http://') or image_data.startswith('https://')):
+        if isinstance(image_data, str):
             try:
-                response = requests.get(image_data)
-                response.raise_for_status()
-                image_data = response.content # Now image_data is bytes
+                image_data, mime_type = fetch_image(image_data, timeout=timeout or self.IMAGE_FETCH_TIMEOUT)
             except requests.exceptions.RequestException as e:
                 print(f"Failed to download image from {image_data}: {e}")
                 raise
         
-        # If image_data is bytes (either originally or from a URL), encode as base64
-        if isinstance(image_data, bytes):
-            base64_image = base64.b64encode(image_data).decode('utf-8')
-            try:
-                with Image.open(BytesIO(image_data)) as img:
-                    # Determine MIME type from image format, fallback to a generic one
-                    mime_type = Image.MIME.get(img.format, f"image/{img.format.lower()}")
-            except Exception:
-                # Fallback if image format cannot be determined
-                mime_type = "image/jpeg"
-            return f"data:{mime_type};base64,{base64_image}"
-        
-        # If it's a string but not a URL, assume it's already a data URI
-        return image_data
+        # Encode as a data URI; the MIME type is sniffed from the header bytes if the server didn't say
+        data_uri = to_data_uri(image_data, mime_type)
+        self._image_cache.put(cache_key, data_uri)
+        return data_uri
@@ -2,11 +2,10 @@ import os
 import base64
 from typing import Dict, List, Optional, Union, Any
 from openai import OpenAI, APIError
-import requests
-from io import BytesIO
-from PIL import Image
 
 from llm_service import LLMService
+from context_manager import ContextManager
+from rate_limiter import call_with_retry, get_rate_limiter, request_timeout
 
 class OpenAIService(LLMService):
     """
@@ -22,14 +21,16 @@ class OpenAIService(LLMService):
             api_key: OpenAI API key (will use environment variable if not provided)
         """
         self.api_key = os.environ.get("OPENAI_API_KEY")
-        self.client = OpenAI(api_key=self.api_key)
+        # Retries are handled by call_with_retry so they can honor quotas and deadlines
+        self.client = OpenAI(api_key=self.api_key, max_retries=0)
     
     def chat_completion(self, 
                        messages: List[Dict[str, Any]], 
                        model: Optional[str] = None,
                        temperature: Optional[float] = 0.7,
                        max_tokens: Optional[int] = None,
-                       stream: bool = False) -> Union[Dict[str, Any], Any]:
+                       stream: bool = False,
+                       deadline: Optional[float] = None) -> Union[Dict[str, Any], Any]:
         """
         Generate a chat completion using OpenAI's API.
         
@@ -39,6 +40,7 @@ class OpenAIService(LLMService):
             temperature: Temperature parameter (default: 0.7)
             max_tokens: Maximum number of tokens to generate
             stream: Whether to stream the response
+            deadline: Optional absolute time.monotonic() bounding pacing, retries and each attempt
             
         Returns:
             Either a completion response object or a stream
@@ -57,8 +59,21 @@ class OpenAIService(LLMService):
             # Add max_tokens if provided
             if max_tokens is not None:
                 params["max_tokens"] = max_tokens
+            if stream:
+                # Ask for a final usage chunk so streamed turns can be accounted per session
+                params["stream_options"] = {"include_usage": True}
                 
-            response = self.client.chat.completions.create(**params)
+            # Pace against the provider quota and retry rate limits / transient errors
+            limiter = get_rate_limiter("openai", model_name)
+            estimated_tokens = ContextManager("openai").count_tokens(messages) + (max_tokens or 512)
+            # Each attempt is also bounded by the time left before the caller's deadline
+            response = call_with_retry(lambda: self.client.chat.completions.create(**params, **request_timeout(deadline)),
+                                       limiter=limiter,
+                                       estimated_tokens=estimated_tokens,
+                                       deadline=deadline)
+            if not stream and getattr(response, "usage", None):
+                # Give back the part of the reservation the call didn't use
+                limiter.refund(tokens=max(0, estimated_tokens - response.usage.total_tokens))
             return response
         except APIError as e:
             # Log the error and re-raise
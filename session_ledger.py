@@ -0,0 +1,167 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Optional
+
+# Per-session totals kept in addition to the recent turns
+TOTAL_FIELDS = ("prompt_tokens", "completion_tokens", "image_tokens", "duration_ms")
+
+
+class SessionLedger:
+    """
+    Per-session record of token usage and latency of each chat turn.
+
+    Turns are kept in memory (recent turns plus running totals per session,
+    bounded by session count, and lifetime totals that survive eviction) and appended as JSON lines to a log file by a
+    background flusher, so the history survives restarts for offline analysis
+    while the admin view stays cheap.
+    """
+
+    def __init__(self,
+                 path: Optional[str] = None,
+                 flush_interval: float = 30.0,
+                 max_sessions: int = 1000,
+                 turns_per_session: int = 50):
+        """
+        Initialize the ledger.
+
+        Args:
+            path: Append-only JSONL file (None keeps the ledger in memory only)
+            flush_interval: Seconds between flushes of recorded turns to the file
+            max_sessions: Sessions kept in memory (least recently active are dropped)
+            turns_per_session: Recent turns kept in memory per session
+        """
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_sessions = max_sessions
+        self.turns_per_session = turns_per_session
+        self._sessions: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        # Totals since startup, including sessions no longer held in memory
+        self._lifetime: Dict[str, Any] = {"sessions": 0, "turns": 0, **{field: 0 for field in TOTAL_FIELDS}}
+        self._unflushed: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flusher: Optional[threading.Thread] = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def record(self,
+               session_id: Optional[str],
+               provider: str,
+               model: str,
+               prompt_tokens: int,
+               completion_tokens: int,
+               image_tokens: int = 0,
+               ttft: Optional[float] = None,
+               duration: float = 0.0,
+               usage_source: str = "estimated",
+               status: str = "ok"):
+        """
+        Record one turn.
+
+        Args:
+            session_id: The turn's session (None is recorded as "unlinked")
+            provider: LLM provider
+            model: Model that answered
+            prompt_tokens: Prompt tokens (reported by the provider or estimated)
+            completion_tokens: Completion tokens (reported by the provider or estimated)
+            image_tokens: Estimated share of the prompt spent on images
+            ttft: Seconds to the first token, if one arrived
+            duration: Seconds from the upstream call to the end of the response
+            usage_source: "provider" if the counts came from the provider's usage, else "estimated"
+            status: "ok", "cancelled" or "error"
+        """
+        turn = {
+            "time": time.time(),
+            "session_id": session_id or "unlinked",
+            "provider": provider,
+            "model": model,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "image_tokens": image_tokens,
+            "ttft_ms": round(ttft * 1000) if ttft is not None else None,
+            "duration_ms": round(duration * 1000),
+            "usage_source": usage_source,
+            "status": status,
+        }
+        with self._lock:
+            entry = self._sessions.get(turn["session_id"])
+            if entry is None:
+                entry = self._sessions[turn["session_id"]] = {
+                    "turns": 0,
+                    **{field: 0 for field in TOTAL_FIELDS},
+                    "first_seen": turn["time"],
+                    "recent": deque(maxlen=self.turns_per_session),
+                }
+                self._lifetime["sessions"] += 1
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            self._sessions.move_to_end(turn["session_id"])
+            entry["turns"] += 1
+            self._lifetime["turns"] += 1
+            for field in TOTAL_FIELDS:
+                entry[field] += turn[field]
+                self._lifetime[field] += turn[field]
+            entry["last_seen"] = turn["time"]
+            entry["recent"].append(turn)
+            if self.path:
+                self._unflushed.append(turn)
+        if self.path:
+            self._ensure_flusher()
+
+    def sessions(self, limit: int = 50) -> Dict[str, Any]:
+        """
+        Return totals since startup across all sessions (evicted ones included)
+        and per-session totals of the most recently active ones.
+        """
+        with self._lock:
+            overall = {**self._lifetime, "sessions_in_memory": len(self._sessions)}
+            recent = list(self._sessions.items())[-limit:] if limit > 0 else []
+            per_session = {session_id: self._totals(entry) for session_id, entry in reversed(recent)}
+        return {"totals": overall, "sessions": per_session}
+
+    def session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Return one session's totals and recent turns, or None if it isn't in memory."""
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            return {**self._totals(entry), "recent_turns": list(entry["recent"])}
+
+    def flush(self):
+        """Append turns recorded since the last flush to the ledger file."""
+        with self._flush_lock:
+            with self._lock:
+                turns, self._unflushed = self._unflushed, []
+            if not turns or not self.path:
+                return
+            try:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write("".join(json.dumps(turn) + "\n" for turn in turns))
+            except OSError as e:
+                print(f"Error writing session ledger: {str(e)}")
+                with self._lock:
+                    self._unflushed[:0] = turns
+
+    @staticmethod
+    def _totals(entry: Dict[str, Any]) -> Dict[str, Any]:
+        totals = {key: value for key, value in entry.items() if key != "recent"}
+        ttfts = [turn["ttft_ms"] for turn in entry["recent"] if turn["ttft_ms"] is not None]
+        totals["recent_mean_ttft_ms"] = round(sum(ttfts) / len(ttfts)) if ttfts else None
+        return totals
+
+    def _ensure_flusher(self):
+        if self._flusher is not None:
+            return
+        with self._lock:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(target=self._flush_loop, name="ledger-flush", daemon=True)
+        self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
@@ -0,0 +1,287 @@
+import copy
+import json
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+from context_manager import ContextManager, estimate_text_tokens
+from model_router import LatencyWindow
+from scheduler import AdmissionError, PRIORITY_BATCH, get_scheduler
+
+
+class ShadowStats:
+    """Side-by-side latency and size aggregates of primary and shadow calls, per endpoint."""
+
+    def __init__(self, window: int = 500):
+        self.window = window
+        self._entries: Dict[tuple, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint: str, side: str, target: str, ttft: Optional[float], latency: float,
+               prompt_tokens: int, completion_tokens: int, output_chars: int, error: Optional[str] = None):
+        """
+        Record one call.
+
+        Args:
+            endpoint: "chat" or "analyze"
+            side: "primary" or "shadow"
+            target: "provider/model"
+            ttft: Seconds to the first token (None if the call failed before one)
+            latency: Seconds until the call completed or failed
+            prompt_tokens: Estimated prompt tokens
+            completion_tokens: Completion tokens (reported by the provider or estimated)
+            output_chars: Length of the output text
+            error: Error description if the call failed
+        """
+        with self._lock:
+            entry = self._entries.get((endpoint, side, target))
+            if entry is None:
+                entry = self._entries[(endpoint, side, target)] = {
+                    "calls": 0,
+                    "errors": 0,
+                    "prompt_tokens": 0,
+                    "completion_tokens": 0,
+                    "output_chars": 0,
+                    "ttft": LatencyWindow(self.window, max_age=float("inf")),
+                    "latency": LatencyWindow(self.window, max_age=float("inf")),
+                }
+            entry["calls"] += 1
+            if error:
+                entry["errors"] += 1
+                return
+            entry["prompt_tokens"] += prompt_tokens
+            entry["completion_tokens"] += completion_tokens
+            entry["output_chars"] += output_chars
+            if ttft is not None:
+                entry["ttft"].add(ttft)
+            entry["latency"].add(latency)
+
+    def snapshot(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """Return {endpoint: {side: {target: aggregates}}} with p50/p95 in milliseconds and per-call means."""
+        result: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        with self._lock:
+            for (endpoint, side, target), entry in self._entries.items():
+                succeeded = entry["calls"] - entry["errors"]
+                view: Dict[str, Any] = {"calls": entry["calls"], "errors": entry["errors"]}
+                for name in ("ttft", "latency"):
+                    _, p50, p95 = entry[name].percentiles()
+                    view[f"{name}_p50_ms"] = round(p50 * 1000) if p50 is not None else None
+                    view[f"{name}_p95_ms"] = round(p95 * 1000) if p95 is not None else None
+                for name in ("prompt_tokens", "completion_tokens", "output_chars"):
+                    view[f"mean_{name}"] = round(entry[name] / succeeded, 1) if succeeded else None
+                result.setdefault(endpoint, {}).setdefault(side, {})[target] = view
+        return result
+
+
+class ShadowMirror:
+    """
+    Mirrors a sample of requests to a secondary provider/model in the background
+    and records both calls side by side. The shadow call streams so its time to
+    first token can be measured; its output is discarded and it never touches
+    the user's response. It runs as batch work on the shadow provider's
+    scheduler and is skipped rather than queued when no slot is free.
+    """
+
+    def __init__(self,
+                 provider: Optional[str],
+                 model: Optional[str],
+                 sample_rate: float,
+                 service_factory: Callable[[str], Any],
+                 max_pending: int = 4,
+                 timeout: float = 60.0,
+                 log_path: Optional[str] = None,
+                 window: int = 500):
+        """
+        Initialize the mirror.
+
+        Args:
+            provider: Shadow provider (None disables mirroring)
+            model: Shadow model (None uses the provider's default)
+            sample_rate: Fraction of requests mirrored, 0-1
+            service_factory: Function provider -> LLM service (e.g. create_llm_service)
+            max_pending: Shadow calls in flight at once; further samples are dropped
+            timeout: Seconds a shadow call may take
+            log_path: Optional JSONL file receiving every observation, with a pair_id
+                linking the primary and shadow call of a request
+            window: Samples kept per target for percentiles
+        """
+        self.provider = provider
+        self.model = model
+        self.sample_rate = max(0.0, min(1.0, sample_rate))
+        self.service_factory = service_factory
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.log_path = log_path
+        self.stats = ShadowStats(window)
+        self._pairs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._pending = 0
+        self._counters = {"mirrored": 0, "dropped": 0, "skipped": 0}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.provider) and self.sample_rate > 0
+
+    def mirror(self,
+               endpoint: str,
+               messages: List[Dict[str, Any]],
+               primary_provider: str,
+               temperature: Optional[float] = None,
+               max_tokens: Optional[int] = None) -> Optional[str]:
+        """
+        Maybe mirror a request.
+
+        Args:
+            endpoint: "chat" or "analyze"
+            messages: The messages the primary call is about to send (copied)
+            primary_provider: Provider of the primary call
+            temperature: Temperature of the primary call
+            max_tokens: max_tokens of the primary call
+
+        Returns:
+            A pair ID to pass to record_primary() if the request was mirrored, else None
+        """
+        if not self.enabled or random.random() >= self.sample_rate:
+            return None
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._counters["dropped"] += 1
+                return None
+            self._pending += 1
+            self._counters["mirrored"] += 1
+            pair_id = uuid.uuid4().hex[:12]
+            self._pairs[pair_id] = {
+                "endpoint": endpoint,
+                "prompt_tokens": ContextManager(primary_provider).count_tokens(messages),
+            }
+            # Primary calls that never report (e.g. cancelled streams) must not accumulate
+            while len(self._pairs) > 4 * self.max_pending + 64:
+                self._pairs.popitem(last=False)
+        threading.Thread(
+            target=self._run,
+            args=(pair_id, endpoint, copy.deepcopy(messages), temperature, max_tokens),
+            name="shadow-call",
+            daemon=True
+        ).start()
+        return pair_id
+
+    def record_primary(self, pair_id: Optional[str], provider: str, model: str, ttft: Optional[float],
+                       latency: float, output_text: str = "", completion_tokens: Optional[int] = None,
+                       error: Optional[str] = None):
+        """
+        Record the primary call of a mirrored request (no-op if pair_id is None).
+
+        Args:
+            pair_id: ID returned by mirror()
+            provider: Primary provider
+            model: Primary model
+            ttft: Seconds to the first token (the full latency for non-streaming calls)
+            latency: Seconds until the call completed
+            output_text: The generated text
+            completion_tokens: Completion tokens reported by the provider, if any (estimated otherwise)
+            error: Error description if the call failed
+        """
+        if pair_id is None:
+            return
+        with self._lock:
+            pair = self._pairs.pop(pair_id, None)
+        if pair is None:
+            return
+        self._observe(pair_id, pair["endpoint"], "primary", provider, model, ttft, latency,
+                      pair["prompt_tokens"], output_text, completion_tokens, error)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return the configuration, counters and side-by-side aggregates."""
+        with self._lock:
+            counters = dict(self._counters)
+            counters["in_flight"] = self._pending
+        return {
+            "provider": self.provider,
+            "model": self.model,
+            "sample_rate": self.sample_rate,
+            **counters,
+            "endpoints": self.stats.snapshot(),
+        }
+
+    def _run(self, pair_id: str, endpoint: str, messages: List[Dict[str, Any]],
+             temperature: Optional[float], max_tokens: Optional[int]):
+        model = self.model or "default"
+        prompt_tokens = ContextManager(self.provider).count_tokens(messages)
+        try:
+            try:
+                admission = get_scheduler(self.provider).acquire(PRIORITY_BATCH, timeout=0)
+            except AdmissionError:
+                with self._lock:
+                    self._counters["skipped"] += 1
+                return
+            with admission:
+                started = time.monotonic()
+                ttft = None
+                parts: List[str] = []
+                completion_tokens = None
+                error = None
+                try:
+                    service = self.service_factory(self.provider)
+                    stream = service.chat_completion(
+                        messages=messages,
+                        model=self.model,
+                        temperature=temperature,
+                        max_tokens=max_tokens,
+                        stream=True,
+                        deadline=started + self.timeout
+                    )
+                    try:
+                        for chunk in stream:
+                            usage = getattr(chunk, "usage", None)
+                            if usage is not None and getattr(usage, "completion_tokens", None):
+                                completion_tokens = usage.completion_tokens
+                            if chunk.choices and chunk.choices[0].delta:
+                                content = chunk.choices[0].delta.content or ""
+                                if content and ttft is None:
+                                    ttft = time.monotonic() - started
+                                parts.append(content)
+                            if time.monotonic() - started > self.timeout:
+                                raise TimeoutError(f"shadow call exceeded {self.timeout:.0f}s")
+                    finally:
+                        close = getattr(stream, "close", None)
+                        if close:
+                            close()
+                except Exception as e:
+                    error = f"{type(e).__name__}: {e}"
+                self._observe(pair_id, endpoint, "shadow", self.provider, model, ttft,
+                              time.monotonic() - started, prompt_tokens, "".join(parts), completion_tokens, error)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def _observe(self, pair_id: str, endpoint: str, side: str, provider: str, model: str,
+                 ttft: Optional[float], latency: float, prompt_tokens: int, output_text: str,
+                 completion_tokens: Optional[int], error: Optional[str]):
+        if completion_tokens is None:
+            completion_tokens = estimate_text_tokens(output_text)
+        self.stats.record(endpoint, side, f"{provider}/{model}", ttft, latency,
+                          prompt_tokens, completion_tokens, len(output_text), error)
+        if not self.log_path:
+            return
+        line = json.dumps({
+            "time": time.time(),
+            "pair_id": pair_id,
+            "endpoint": endpoint,
+            "side": side,
+            "provider": provider,
+            "model": model,
+            "ttft_ms": round(ttft * 1000) if ttft is not None else None,
+            "latency_ms": round(latency * 1000),
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "output_chars": len(output_text),
+            "error": error,
+        })
+        try:
+            with self._lock, open(self.log_path, "a", encoding="utf-8") as log_file:
+                log_file.write(line + "\n")
+        except OSError as e:
+            print(f"Error writing shadow log: {str(e)}")
@@ -0,0 +1,195 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+from typing import Dict, Optional
+
+from flask import Response, send_file
+
+try:
+    # Optional: brotli variants for clients sending Accept-Encoding: br
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bundler output under assets/ carries a content hash (e.g. assets/index-B4x_9cQe.js) and never changes content
+HASHED_ASSET = re.compile(r"^assets/.+[.-][A-Za-z0-9_-]{8,}\.[A-Za-z0-9]+$")
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "application/xml",
+                      "image/svg+xml", "application/wasm", "application/manifest+json")
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+# Encodings in order of preference and the sidecar suffix a build may have produced for each
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+class Asset:
+    """One file of the frontend build and its compressed variants."""
+
+    def __init__(self, path: str, relative_path: str):
+        self.path = path
+        self.relative_path = relative_path
+        self.mimetype = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        self.size = os.path.getsize(path)
+        self.immutable = bool(HASHED_ASSET.match(relative_path))
+        self.variants: Dict[str, bytes] = {}
+        self._etag: Optional[str] = None
+
+    @property
+    def compressible(self) -> bool:
+        return self.mimetype.startswith(COMPRESSIBLE_TYPES)
+
+    @property
+    def etag(self) -> str:
+        # Hashed on first use rather than at scan time
+        if self._etag is None:
+            with open(self.path, "rb") as f:
+                self._etag = hashlib.sha256(f.read()).hexdigest()[:32]
+        return self._etag
+
+
+class AssetManifest:
+    """
+    In-memory index of a frontend build (e.g. frontend/dist), built on first use.
+
+    Lookups replace per-request filesystem checks, compressible files are served
+    as brotli or gzip by Accept-Encoding (using the build's .br/.gz sidecars if it
+    produced them, otherwise compressed here on a background thread; until a
+    variant is ready the file is sent uncompressed), hashed asset names get
+    long-lived immutable caching and everything else (index.html) is revalidated
+    by ETag. Nothing is read at import, so startup doesn't pay for the build's
+    size. Rebuilding the frontend requires a restart.
+    """
+
+    def __init__(self, root: str, min_compress_bytes: int = 1024):
+        """
+        Initialize the manifest; the build directory is scanned on first lookup.
+
+        Args:
+            root: The build output directory (a missing directory gives an empty manifest)
+            min_compress_bytes: Smaller files are always served uncompressed
+        """
+        self.root = root
+        self.min_compress_bytes = min_compress_bytes
+        self._assets: Optional[Dict[str, Asset]] = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    @property
+    def assets(self) -> Dict[str, Asset]:
+        if self._assets is None:
+            self._scan()
+        return self._assets
+
+    def get(self, relative_path: str) -> Optional[Asset]:
+        """Return the asset at a path relative to the build root, or None."""
+        return self.assets.get(relative_path)
+
+    def stats(self) -> Dict[str, int]:
+        """Return file counts and the memory held by compressed variants."""
+        assets = list(self.assets.values())
+        return {
+            "files": len(assets),
+            "compressed_files": sum(1 for asset in assets if asset.variants),
+            "pending_compression": self._pending,
+            "variant_bytes": sum(len(data) for asset in assets for data in list(asset.variants.values())),
+        }
+
+    def response(self, asset: Asset, request) -> Response:
+        """
+        Build the response for an asset, honouring Accept-Encoding and If-None-Match.
+
+        Args:
+            asset: The asset to send
+            request: The current Flask request
+        """
+        encoding = None
+        for name, _ in ENCODINGS:
+            if name in asset.variants and request.accept_encodings[name] > 0:
+                encoding = name
+                break
+        if encoding:
+            response = Response(asset.variants[encoding], mimetype=asset.mimetype)
+            response.headers["Content-Encoding"] = encoding
+            response.set_etag(f"{asset.etag}-{encoding}")
+        else:
+            response = send_file(asset.path, mimetype=asset.mimetype, etag=asset.etag, conditional=False)
+        if self._wants_variants(asset):
+            response.vary.add("Accept-Encoding")
+        response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL if asset.immutable else REVALIDATE_CACHE_CONTROL
+        return response.make_conditional(request)
+
+    def _scan(self):
+        with self._lock:
+            if self._assets is not None:
+                return
+            assets: Dict[str, Asset] = {}
+            if os.path.isdir(self.root):
+                for directory, _, filenames in os.walk(self.root):
+                    for filename in filenames:
+                        if filename.endswith((".br", ".gz")):
+                            continue
+                        path = os.path.join(directory, filename)
+                        relative_path = os.path.relpath(path, self.root).replace(os.sep, "/")
+                        assets[relative_path] = Asset(path, relative_path)
+            to_compress = [asset for asset in assets.values() if self._wants_variants(asset)]
+            self._pending = len(to_compress)
+            self._assets = assets
+        if to_compress:
+            threading.Thread(target=self._prepare_all, args=(to_compress,), name="asset-compress", daemon=True).start()
+
+    def _wants_variants(self, asset: Asset) -> bool:
+        return asset.compressible and asset.size >= self.min_compress_bytes
+
+    def _prepare_all(self, assets):
+        for asset in assets:
+            try:
+                self._prepare_variants(asset)
+            except OSError as e:
+                print(f"Error compressing frontend asset {asset.relative_path}: {str(e)}")
+            self._pending -= 1
+
+    def _prepare_variants(self, asset: Asset):
+        with open(asset.path, "rb") as f:
+            data = f.read()
+        for encoding, suffix in ENCODINGS:
+            sidecar = asset.path + suffix
+            if os.path.isfile(sidecar) and os.path.getmtime(sidecar) >= os.path.getmtime(asset.path):
+                with open(sidecar, "rb") as f:
+                    compressed = f.read()
+            elif encoding == "br" and brotli is not None:
+                compressed = brotli.compress(data, quality=11)
+            elif encoding == "gzip":
+                compressed = gzip.compress(data, compresslevel=9, mtime=0)
+            else:
+                continue
+            # Keep a variant only if it actually saves bytes
+            if len(compressed) < len(data):
+                asset.variants[encoding] = compressed
+
+
+def compress_json_response(response: Response, request, min_bytes: int = 1024, level: int = 6) -> Response:
+    """
+    Gzip a buffered JSON response if the client accepts it and it is large enough.
+
+    Streamed, already encoded and non-200 responses are left untouched.
+
+    Args:
+        response: The outgoing response
+        request: The current Flask request
+        min_bytes: Bodies smaller than this are sent as is
+        level: gzip compression level
+    """
+    if (response.mimetype != "application/json" or response.status_code != 200
+            or response.is_streamed or response.direct_passthrough
+            or "Content-Encoding" in response.headers
+            or request.accept_encodings["gzip"] <= 0):
+        return response
+    data = response.get_data()
+    if len(data) < min_bytes:
+        return response
+    response.set_data(gzip.compress(data, compresslevel=level))
+    response.headers["Content-Encoding"] = "gzip"
+    response.vary.add("Accept-Encoding")
+    return response
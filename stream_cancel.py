@@ -0,0 +1,176 @@
+import select
+import socket
+import threading
+import time
+from typing import Any, Dict, Optional
+
+# WSGI environ keys under which servers expose the client connection
+CLIENT_SOCKET_KEYS = ("werkzeug.socket", "gunicorn.socket")
+
+
+def client_socket(environ: Dict[str, Any]) -> Optional[socket.socket]:
+    """Return the client connection of a WSGI request, if the server exposes it."""
+    for key in CLIENT_SOCKET_KEYS:
+        sock = environ.get(key)
+        if sock is not None:
+            return sock
+    return None
+
+
+def client_disconnected(sock: socket.socket) -> Optional[bool]:
+    """
+    Check without blocking whether the peer has closed the connection.
+
+    Args:
+        sock: The client socket
+
+    Returns:
+        True if the peer closed it, False if it looks open, None if it can't be told
+        (e.g. a TLS socket, which doesn't support peeking)
+    """
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+        if not readable:
+            return False
+        # A readable socket with nothing to read has reached end of stream
+        return sock.recv(1, socket.MSG_PEEK) == b""
+    except ValueError:
+        return None
+    except OSError:
+        return True
+
+
+class StreamCanceller:
+    """
+    Watches the client connection of a streaming response and closes the upstream
+    stream as soon as the client goes away, instead of waiting for the next write
+    to fail while the provider keeps generating. It can also enforce a deadline
+    for the first token.
+    """
+
+    def __init__(self,
+                 upstream: Any,
+                 sock: Optional[socket.socket],
+                 poll_interval: float = 0.25,
+                 deadline: Optional[float] = None):
+        """
+        Initialize the canceller.
+
+        Args:
+            upstream: The provider stream; closed on cancellation and on finish()
+            sock: The client socket to watch (None disables watching)
+            poll_interval: Seconds between connection checks
+            deadline: Absolute time.monotonic() by which first_token() must be called,
+                otherwise the stream is cancelled with reason "deadline"
+        """
+        self.upstream = upstream
+        self.sock = sock if poll_interval > 0 else None
+        self.poll_interval = poll_interval
+        self.deadline = deadline
+        self.reason: Optional[str] = None
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._closed = False
+
+    @property
+    def cancelled(self) -> bool:
+        return self.reason is not None
+
+    def start(self):
+        """Start watching the client connection and deadline in a daemon thread."""
+        if self.sock is None and self.deadline is None:
+            return
+        threading.Thread(target=self._watch, name="stream-watch", daemon=True).start()
+
+    def first_token(self):
+        """Disarm the deadline; it only bounds the silence before the first token."""
+        self.deadline = None
+
+    def cancel(self, reason: str):
+        """Mark the stream cancelled and close the upstream (only the first reason is kept)."""
+        with self._lock:
+            if self.reason is None:
+                self.reason = reason
+        self._close_upstream()
+
+    def finish(self):
+        """Stop watching and release the upstream connection."""
+        self._done.set()
+        self._close_upstream()
+
+    def _watch(self):
+        sock = self.sock
+        while True:
+            deadline = self.deadline
+            if sock is None and deadline is None:
+                return
+            waits = [self.poll_interval] if sock is not None else []
+            if deadline is not None:
+                waits.append(max(0.0, deadline - time.monotonic()))
+            if self._done.wait(min(waits)):
+                return
+            if self.deadline is not None and time.monotonic() >= self.deadline:
+                self.cancel("deadline")
+                return
+            if sock is not None:
+                state = client_disconnected(sock)
+                if state:
+                    self.cancel("client_disconnected")
+                    return
+                if state is None:
+                    sock = None
+
+    def _close_upstream(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        close = getattr(self.upstream, "close", None)
+        if close:
+            try:
+                close()
+            except Exception as e:
+                print(f"Error closing upstream stream: {str(e)}")
+
+
+class CancellationStats:
+    """Counts cancelled streams and the tokens delivered before cancellation, per provider/model."""
+
+    def __init__(self):
+        self._stats: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, provider: str, model: str, reason: str, tokens_streamed: int,
+               max_tokens: Optional[int] = None, elapsed: float = 0.0):
+        """
+        Record one cancelled stream.
+
+        Args:
+            provider: The LLM provider name
+            model: The model that was generating
+            reason: Why the stream was cancelled
+            tokens_streamed: Estimated completion tokens delivered before cancellation
+            max_tokens: The request's max_tokens, if set (bounds the tokens not generated)
+            elapsed: Seconds the stream ran before cancellation
+        """
+        key = f"{provider}/{model}"
+        with self._lock:
+            entry = self._stats.setdefault(key, {
+                "cancelled": 0,
+                "tokens_streamed": 0,
+                "tokens_not_generated_max": 0,
+                "stream_seconds": 0.0,
+            })
+            entry["cancelled"] += 1
+            entry[f"reason:{reason}"] = entry.get(f"reason:{reason}", 0) + 1
+            entry["tokens_streamed"] += tokens_streamed
+            if max_tokens:
+                entry["tokens_not_generated_max"] += max(0, max_tokens - tokens_streamed)
+            entry["stream_seconds"] = round(entry["stream_seconds"] + elapsed, 3)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {key: dict(entry) for key, entry in self._stats.items()}
+
+
+cancellation_stats = CancellationStats()
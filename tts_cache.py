@@ -0,0 +1,191 @@
+import os
+import json
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+class TTSCache:
+    """
+    Content-addressed on-disk cache for synthesized speech.
+    Audio is stored once per hash of text + voice + model + voice settings,
+    evicted least-recently-used once the total size exceeds max_bytes, and
+    tracked in a JSON index so the cache survives restarts.
+    """
+
+    INDEX_FILENAME = "index.json"
+
+    def __init__(self, cache_dir: str, max_bytes: int = 256 * 1024 * 1024):
+        """
+        Initialize the cache and load any existing index from disk.
+
+        Args:
+            cache_dir: Directory holding the cached audio files and index
+            max_bytes: Total size budget for cached audio
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(cache_dir, self.INDEX_FILENAME)
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        # The directory is created on first write, so an unused cache leaves nothing on disk
+        self._load_index()
+
+    @staticmethod
+    def make_key(text: str, voice_id: str, model_id: str, voice_settings: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Build the content address for a synthesis request.
+
+        Args:
+            text: The text being synthesized
+            voice_id: The ElevenLabs voice ID
+            model_id: The TTS model ID
+            voice_settings: Voice settings sent with the request
+
+        Returns:
+            Hex SHA-256 digest identifying the audio
+        """
+        payload = json.dumps({
+            "text": text,
+            "voice_id": voice_id,
+            "model_id": model_id,
+            "voice_settings": voice_settings or {}
+        }, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def filename_for(key: str) -> str:
+        """Return the on-disk filename for a cache key."""
+        return f"{key}.mp3"
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Look up cached audio and mark it as recently used.
+
+        Args:
+            key: Cache key from make_key()
+
+        Returns:
+            The cached filename (relative to cache_dir), or None on a miss
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            filename = self.filename_for(key)
+            if not os.path.isfile(os.path.join(self.cache_dir, filename)):
+                # File was removed behind our back; forget it
+                self._total_bytes -= entry["size"]
+                del self._entries[key]
+                self._save_index()
+                return None
+            entry["last_access"] = time.time()
+            self._entries.move_to_end(key)
+            return filename
+
+    def put(self, key: str, audio: bytes) -> str:
+        """
+        Store audio bytes under a key, evicting old entries if needed.
+
+        Args:
+            key: Cache key from make_key()
+            audio: The encoded audio
+
+        Returns:
+            The cached filename (relative to cache_dir)
+        """
+        staging_path = self.staging_path(key)
+        with open(staging_path, 'wb') as f:
+            f.write(audio)
+        return self.put_file(key, staging_path)
+
+    def staging_path(self, key: str) -> str:
+        """Return a unique temporary path inside the cache directory for writing audio."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        return os.path.join(self.cache_dir, f".{key}.{threading.get_ident()}.{time.time_ns()}.tmp")
+
+    def put_file(self, key: str, path: str) -> str:
+        """
+        Move an already-written audio file into the cache under a key.
+
+        Args:
+            key: Cache key from make_key()
+            path: Path of the file to adopt; it must live on the same filesystem
+
+        Returns:
+            The cached filename (relative to cache_dir)
+        """
+        filename = self.filename_for(key)
+        size = os.path.getsize(path)
+        with self._lock:
+            os.replace(path, os.path.join(self.cache_dir, filename))
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._total_bytes -= previous["size"]
+            self._entries[key] = {"size": size, "last_access": time.time()}
+            self._total_bytes += size
+            self._evict()
+            self._save_index()
+        return filename
+
+    def stats(self) -> Dict[str, Any]:
+        """Return entry count and byte usage of the cache."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes
+            }
+
+    def _evict(self):
+        """Drop least-recently-used entries until under budget. Caller holds the lock."""
+        # Always keep the newest entry, even if it alone exceeds the budget
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            key, entry = self._entries.popitem(last=False)
+            self._total_bytes -= entry["size"]
+            try:
+                os.remove(os.path.join(self.cache_dir, self.filename_for(key)))
+            except OSError:
+                pass
+
+    def _load_index(self):
+        """Rebuild the in-memory LRU order from the persisted index."""
+        if not os.path.isdir(self.cache_dir):
+            return
+        try:
+            with open(self.index_path, 'r') as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            stored = {}
+
+        for key, entry in sorted(stored.items(), key=lambda item: item[1].get("last_access", 0)):
+            path = os.path.join(self.cache_dir, self.filename_for(key))
+            if not os.path.isfile(path):
+                continue
+            size = os.path.getsize(path)
+            self._entries[key] = {"size": size, "last_access": entry.get("last_access", 0)}
+            self._total_bytes += size
+
+        # Remove files the index doesn't know about (e.g. from an interrupted write)
+        known = {self.filename_for(key) for key in self._entries}
+        for filename in os.listdir(self.cache_dir):
+            if filename == self.INDEX_FILENAME or filename in known:
+                continue
+            try:
+                os.remove(os.path.join(self.cache_dir, filename))
+            except OSError:
+                pass
+
+        with self._lock:
+            self._evict()
+            self._save_index()
+
+    def _save_index(self):
+        """Atomically write the index to disk. Caller holds the lock."""
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self._entries, f)
+        os.replace(tmp_path, self.index_path)
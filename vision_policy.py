@@ -0,0 +1,162 @@
+import math
+import re
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from context_manager import estimate_image_tokens
+
+# Questions that need fine detail (reading text, counting, small features)
+DETAIL_SEEKING = re.compile(
+    r"\b(read|text|says?|written|writing|inscription|signature|label|caption|plaque|sign|"
+    r"zoom|closer|close[- ]up|detail(s|ed)?|small|tiny|fine|texture|brush ?strokes?|"
+    r"count|how many|number of|identify|which one|compare)\b",
+    re.IGNORECASE,
+)
+
+TILE_SIZE = 512
+
+
+class VisionDecision:
+    """
+    The detail level chosen for one image and its estimated cost.
+    resize_to is set when the tile cap needs the image smaller than the provider
+    would scale it itself; the estimate only holds if the image is sent at that size.
+    """
+
+    __slots__ = ("detail", "tiles", "target_size", "estimated_tokens", "reason", "resize_to")
+
+    def __init__(self, detail: str, tiles: Optional[Tuple[int, int]], target_size: Optional[Tuple[int, int]],
+                 estimated_tokens: int, reason: str, resize_to: Optional[Tuple[int, int]] = None):
+        self.detail = detail
+        self.tiles = tiles
+        self.target_size = target_size
+        self.estimated_tokens = estimated_tokens
+        self.reason = reason
+        self.resize_to = resize_to
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "detail": self.detail,
+            "tiles": list(self.tiles) if self.tiles else None,
+            "target_size": list(self.target_size) if self.target_size else None,
+            "estimated_tokens": self.estimated_tokens,
+            "reason": self.reason,
+            "resize_to": list(self.resize_to) if self.resize_to else None,
+        }
+
+
+def high_detail_layout(width: int, height: int, max_tiles: int = 0) -> Tuple[Tuple[int, int], Tuple[int, int]]:
+    """
+    Compute the 512px tile grid a high-detail image is billed at.
+
+    Follows the OpenAI sizing rules (fit within 2048x2048, then shortest side 768),
+    optionally shrinking further until the grid has at most max_tiles tiles.
+
+    Args:
+        width: Image width in pixels
+        height: Image height in pixels
+        max_tiles: Maximum number of tiles; 0 means no cap
+
+    Returns:
+        Tuple of ((columns, rows), (target_width, target_height))
+    """
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    while True:
+        tiles = (math.ceil(width / TILE_SIZE), math.ceil(height / TILE_SIZE))
+        if not max_tiles or tiles[0] * tiles[1] <= max_tiles or max(tiles) == 1:
+            return tiles, (int(width), int(height))
+        # Shrink so the longer side drops one tile
+        longer = max(width, height)
+        scale = (TILE_SIZE * (math.ceil(longer / TILE_SIZE) - 1)) / longer
+        width, height = width * scale, height * scale
+
+
+class VisionDetailPolicy:
+    """
+    Chooses low or high vision detail per injected image.
+    First looks at a new image and detail-seeking questions get high detail;
+    follow-up turns about an unchanged image, and images small enough that low
+    detail loses nothing, take the cheap low-detail path.
+    """
+
+    def __init__(self, low_max_side: int = 512, max_tiles: int = 6):
+        """
+        Initialize the policy.
+
+        Args:
+            low_max_side: Images whose longer side is at most this size always use low detail
+            max_tiles: Cap on the 512px tile grid for high detail; 0 means no cap
+        """
+        self.low_max_side = low_max_side
+        self.max_tiles = max_tiles
+        self._last_seen: Dict[str, str] = {}
+        self._stats = {"low": 0, "high": 0, "estimated_tokens": 0}
+        self._lock = threading.Lock()
+
+    def resize_target(self, width: int, height: int) -> Optional[Tuple[int, int]]:
+        """Return the size a high-detail image must be downscaled to for the tile cap, or None if it fits."""
+        target_size = high_detail_layout(width, height, self.max_tiles)[1]
+        return target_size if target_size != high_detail_layout(width, height)[1] else None
+
+    def choose(self,
+               image_id: str,
+               size: Optional[Tuple[int, int]] = None,
+               question: str = "",
+               session_id: Optional[str] = None,
+               provider: str = "openai") -> VisionDecision:
+        """
+        Decide the detail level for an image and record its estimated cost.
+
+        Args:
+            image_id: Identifier of the image (e.g. its stored filename)
+            size: (width, height) of the image, if known
+            question: The user's latest message text
+            session_id: Session the image is injected into, used to detect unchanged images
+            provider: The LLM provider, used to price the image
+
+        Returns:
+            The VisionDecision for the image
+        """
+        with self._lock:
+            changed = session_id is None or self._last_seen.get(session_id) != image_id
+            if session_id is not None:
+                self._last_seen[session_id] = image_id
+
+        width, height = size if size else (None, None)
+        if size and max(size) <= self.low_max_side:
+            detail, reason = "low", "small image"
+        elif DETAIL_SEEKING.search(question or ""):
+            detail, reason = "high", "detail-seeking question"
+        elif changed:
+            detail, reason = "high", "first look at this image"
+        else:
+            detail, reason = "low", "follow-up on unchanged image"
+
+        tiles = target_size = resize_to = None
+        if detail == "high" and size:
+            tiles, target_size = high_detail_layout(width, height, self.max_tiles)
+            resize_to = self.resize_target(width, height)
+            estimated = estimate_image_tokens(provider, detail, *target_size)
+        else:
+            estimated = estimate_image_tokens(provider, detail, width, height)
+
+        with self._lock:
+            self._stats[detail] += 1
+            self._stats["estimated_tokens"] += estimated
+        return VisionDecision(detail, tiles, target_size, estimated, reason, resize_to)
+
+    def forget(self, session_id: Optional[str] = None):
+        """Forget which image a session last saw (all sessions if None)."""
+        with self._lock:
+            if session_id is None:
+                self._last_seen.clear()
+            else:
+                self._last_seen.pop(session_id, None)
+
+    def stats(self) -> Dict[str, int]:
+        """Return counts of low/high decisions and the total estimated vision tokens."""
+        with self._lock:
+            return dict(self._stats)
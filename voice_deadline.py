@@ -0,0 +1,76 @@
+import sys
+import time
+import uuid
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Dict, Optional
+
+from scheduler import AdmissionError
+
+DEFAULT_FALLBACK_UTTERANCE = "Sorry, I need a moment longer on that. Could you ask me again?"
+
+
+def resolve_budget(header_value: Optional[str], body_value: Any, default_ms: float) -> Optional[float]:
+    """
+    Work out a turn's latency budget.
+
+    Args:
+        header_value: The X-Request-Deadline-Ms header, if sent
+        body_value: The deadline_ms field of the request body (extra body), if sent
+        default_ms: Configured default; 0 disables the deadline
+
+    Returns:
+        The budget in seconds, or None if the turn has no deadline
+    """
+    for value in (header_value, body_value):
+        if value in (None, ""):
+            continue
+        try:
+            budget_ms = float(value)
+        except (TypeError, ValueError):
+            continue
+        return budget_ms / 1000 if budget_ms > 0 else None
+    return default_ms / 1000 if default_ms > 0 else None
+
+
+def is_deadline_error(error: Exception) -> bool:
+    """Return True for failures caused by running out of time or capacity within the budget."""
+    if isinstance(error, (AdmissionError, FutureTimeoutError, TimeoutError)):
+        return True
+    # Looked up lazily so importing this module doesn't load the openai client (see llm_factory)
+    openai = sys.modules.get("openai")
+    return openai is not None and isinstance(error, openai.APITimeoutError)
+
+
+def assistant_chunk(model: str, text: str, finish_reason: Optional[str] = None) -> Dict[str, Any]:
+    """Build a chat.completion.chunk carrying locally generated assistant text."""
+    return {
+        "id": f"chatcmpl-local-{uuid.uuid4().hex[:12]}",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "delta": {"role": "assistant", "content": text},
+            "finish_reason": finish_reason
+        }]
+    }
+
+
+def fallback_chunk(model: str, text: str) -> Dict[str, Any]:
+    """Build a chat.completion.chunk carrying the whole fallback utterance."""
+    return assistant_chunk(model, text, finish_reason="stop")
+
+
+def fallback_completion(model: str, text: str) -> Dict[str, Any]:
+    """Build a non-streaming chat.completion carrying the fallback utterance."""
+    return {
+        "id": f"chatcmpl-fallback-{uuid.uuid4().hex[:12]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": text},
+            "finish_reason": "stop"
+        }]
+    }